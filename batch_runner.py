@@ -0,0 +1,879 @@
+import os
+import time
+import queue
+import shutil
+import threading
+import itertools
+import multiprocessing
+from collections import Counter, deque
+
+from loghandler import LogHandler, LOG_FORMAT_TEXT, LOG_DIR_NAME
+from ocr_processor import OCRProcessor, is_in_place
+from filemanager import FileManager
+from ocr_cache import OcrCache, settings_fingerprint
+from profiles import resolve_profile, DEFAULT_PROFILE
+from scheduler import (CoreScheduler, ScheduledJob, FolderShare, DEFAULT_MAX_JOBS_PER_FILE, KIND_CHUNK, KIND_MERGE,
+                       DEFAULT_PRIORITY, DEFAULT_WEIGHT, ORDER_LARGEST_FIRST, ORDER_SHORTEST_FIRST,
+                       default_memory_budget)
+from page_split import SplitState, chunk_size
+from triage import MODE_SKIP
+from hotfolder import HotFolderWatcher, DEFAULT_SETTLE_TIME, DEFAULT_POLL_INTERVAL
+from metrics import MetricsWriter, summarize
+from task_guard import TaskGuard, RetryPolicy, DEFAULT_MAX_TASKS_PER_WORKER, DEFAULT_WORKER_RSS_LIMIT
+from staging import Stager
+from dedup import DuplicateIndex, link_output
+from recompress import DEFAULT_NICE
+from journal import JobJournal, batch_key, STATE_FAILED, BATCH_FINISHED, BATCH_STOPPED
+
+# Discovered files waiting for the cache check
+DISCOVERY_QUEUE_SIZE = 256
+# Files per core that may be triaged, queued or running at the same time
+OUTSTANDING_PER_CORE = 4
+# Finished files kept for the metrics summary; bounds the memory of long watch runs
+METRICS_HISTORY = 10000
+
+class BatchRunner:
+    """Runs one OCR batch (cache, triage, scheduling, worker pool) without any UI.
+
+    The GUI and the CLI consume the events passed to on_event: per file, per triaged file
+    with its page counts, and per OCRed page. on_event is called from the pool's result
+    thread, the guard's thread and the discovery threads as well as from the caller's thread,
+    so it must not block; the GUI hands the events to its Tk loop through a ProgressBus.
+    With watch=True the batch never finishes: new files in the source folders are
+    processed as they arrive until stop() is called. Files with more than split_pages
+    pages are OCRed as page-range chunks spread over the pool and merged afterwards.
+    Per-file timings go to metrics_path (JSON lines, or CSV by extension); by default
+    ocr_metrics.jsonl is written next to the log file. The state of every file is kept in
+    a journal, so with resume=True a stopped or crashed batch only processes what is left.
+    Tasks that exceed the timeout of retry_policy get their worker killed; failed files are
+    retried with cheaper settings and, if they keep failing, moved to quarantine_folder.
+    Workers are replaced after max_tasks_per_worker tasks or above worker_rss_limit bytes,
+    and files are only started while their projected memory fits into memory_budget.
+    folder_priorities and folder_weights decide how the source folders share the cores;
+    both can be changed with set_priority while the batch runs, single files with reprioritize.
+    With staging, files are copied to a local scratch directory ahead of the workers and
+    their outputs written back in the background, for sources on network shares.
+    profile names the OCR profile of all folders, folder_profiles assigns other profiles
+    to single source folders; min_dpi, if given, overrides the resolution of every profile.
+    pause() holds back new files until unpause(), e.g. while a consumer of the results lags.
+    Outputs of profiles with a recompress policy are recompressed in a second pool of
+    recompress_workers processes at recompress_nice, so it takes no CPU from the OCR.
+    With dedup, a file with the same content as one seen before in the batch (e.g. in
+    another source folder) is not OCRed again but gets the output of the first one.
+    temp_dir puts the work directories of the workers on a fast volume such as /dev/shm or
+    an SSD; the rasterized pages and intermediate PDFs of the OCR then never reach the
+    disk of the outputs. It is also the default scratch directory of staging."""
+
+    def __init__(self, source_folders, target_folder, include_subfolders=True, use_internal_parallelism=True,
+                 logfile_enabled=True, cache_enabled=True, min_dpi=None, on_event=None,
+                 redirect_worker_output=False, watch=False, watch_polling=False,
+                 settle_time=DEFAULT_SETTLE_TIME, poll_interval=DEFAULT_POLL_INTERVAL, split_pages=0,
+                 metrics_path=None, journal_enabled=True, resume=False, log_format=LOG_FORMAT_TEXT,
+                 retry_policy=None, quarantine_folder=None, memory_budget=None,
+                 max_tasks_per_worker=DEFAULT_MAX_TASKS_PER_WORKER, worker_rss_limit=DEFAULT_WORKER_RSS_LIMIT,
+                 folder_priorities=None, folder_weights=None, shortest_first=False,
+                 staging=False, staging_dir=None, profile=DEFAULT_PROFILE, folder_profiles=None,
+                 recompress_workers=None, recompress_nice=DEFAULT_NICE, dedup=True, temp_dir=None):
+        self.source_folders = list(source_folders)
+        self.target_folder = target_folder  # None when "Zielordner = Quellordner" is active
+        self.include_subfolders = include_subfolders
+        self.use_internal_parallelism = use_internal_parallelism
+        self.logfile_enabled = logfile_enabled
+        self.cache_enabled = cache_enabled
+        self.min_dpi = min_dpi
+        self.on_event = on_event
+        self.redirect_worker_output = redirect_worker_output
+        self.watch = watch
+        self.watch_polling = watch_polling
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.split_pages = split_pages  # 0 disables splitting
+        self.metrics_path = metrics_path
+        self.journal_enabled = journal_enabled
+        self.resume = resume
+        self.log_format = log_format
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.quarantine_folder = quarantine_folder
+        # None: share of the physical memory; 0 disables the admission control
+        self.memory_budget = default_memory_budget() if memory_budget is None else memory_budget
+        self.max_tasks_per_worker = max_tasks_per_worker  # 0: workers are never recycled by count
+        self.worker_rss_limit = worker_rss_limit          # 0: no RSS limit
+        self.folder_priorities = dict(folder_priorities or {})  # source folder -> priority, higher goes first
+        self.folder_weights = dict(folder_weights or {})        # source folder -> share among equal priorities
+        self.shortest_first = shortest_first
+        self._file_priorities = {}  # input path -> priority set with reprioritize
+        self.staging = staging
+        self.temp_dir = temp_dir  # None: the system's temporary directory
+        self.staging_dir = staging_dir or temp_dir
+        self.stager = None
+        # Resolved up front, so an unknown or broken profile fails before anything runs
+        self.profile = resolve_profile(profile)
+        self.folder_profiles = {folder: resolve_profile(name) for folder, name in (folder_profiles or {}).items()}
+        self.recompress_workers = recompress_workers  # None: a quarter of the cores
+        self.recompress_nice = recompress_nice
+        self.dedup = dedup
+        self.duplicates = None
+
+        self.total_files = 0
+        self.processed_files = 0
+        self.cached_files = 0
+        self.skipped_files = 0
+        self.failed_files = 0
+        self.resumed_files = 0  # finished by an earlier, interrupted run of this batch
+        self.retried_files = 0
+        self.quarantined_files = 0
+        self.duplicate_files = 0
+        self.duplicate_pages = 0  # pages not OCRed because their file was a duplicate
+        self.page_classes = Counter()
+        self.ocr_pages = 0  # pages the workers reported as OCRed
+        self.start_time = None
+        self.processing = False
+        self.discovering = False
+        self.log_dir = ""
+        self.pool = None
+        self.guard = None
+        self.recompress_pool = None
+        self.recompress_guard = None
+        self.scheduler = None
+        self.cache = None
+        self.log_handler = None
+        self.metrics_writer = None
+        self.journal = None
+        self.metrics = deque(maxlen=METRICS_HISTORY)
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        # finish() and stop() may race, e.g. the GUI's stop button against the end of the batch
+        self._shutdown = threading.Lock()
+        self._closed = False
+        self._unpaused = threading.Event()
+        self._unpaused.set()
+        self._discovered = None
+        self._outstanding = None
+        self.watcher = None
+        self._active = {}   # input path -> (output path, source folder) of files in flight
+        self._splits = {}   # input path -> SplitState of files processed in chunks
+        self._written = {}  # in-place outputs of watch mode -> (size, mtime_ns), so they are not picked up again
+        self._waiting = {}  # input path of an original in flight -> its duplicates
+        self._originals = {}  # input path of a finished original -> (status, output path, pages, error)
+
+    def iter_pdf_files(self):
+        # Folders are walked in turn, highest priority first, so every folder gets files into the queue early
+        folders = sorted(self.source_folders, key=lambda folder: -self.folder_priorities.get(folder, DEFAULT_PRIORITY))
+        fm = FileManager(folders, self.target_folder, self.include_subfolders)
+        return fm.iter_pdf_files(interleave=True)
+
+    def folder_shares(self):
+        return {folder: FolderShare(self.folder_priorities.get(folder, DEFAULT_PRIORITY),
+                                    self.folder_weights.get(folder, DEFAULT_WEIGHT))
+                for folder in self.source_folders}
+
+    def set_priority(self, source_folder, priority=None, weight=None):
+        """Changes priority and/or weight of a source folder, also while the batch runs."""
+        if priority is not None:
+            self.folder_priorities[source_folder] = priority
+        if weight is not None:
+            self.folder_weights[source_folder] = weight
+        if self.scheduler:
+            self.scheduler.set_share(source_folder, priority, weight)
+            self.dispatch_jobs()
+
+    def reprioritize(self, input_path, priority):
+        """Gives one file its own priority; None hands it back to the priority of its folder."""
+        with self._lock:
+            self._file_priorities[input_path] = priority
+        if self.scheduler:
+            self.scheduler.reprioritize(input_path, priority)
+            self.dispatch_jobs()
+
+    def pause(self):
+        """Stops taking up new files; those already triaged or running are finished."""
+        self._unpaused.clear()
+
+    def unpause(self):
+        self._unpaused.set()
+
+    def is_paused(self):
+        return not self._unpaused.is_set()
+
+    def profile_for(self, source_folder):
+        return self.folder_profiles.get(source_folder, self.profile)
+
+    def fingerprint(self):
+        # Covers the profile of every folder, so a batch with changed profiles is not resumed as finished
+        return settings_fingerprint([self.create_processor(folder).fingerprint() for folder in self.source_folders])
+
+    def batch_key(self):
+        return batch_key(self.source_folders, self.target_folder, self.include_subfolders, self.fingerprint())
+
+    def has_unfinished(self):
+        """True if an earlier run of this batch was stopped or crashed and can be resumed."""
+        journal = JobJournal()
+        try:
+            return journal.has_unfinished(self.batch_key())
+        finally:
+            journal.close()
+
+    def open_journal(self):
+        """Returns the files to process: all of them, or on resume only the unfinished ones."""
+        self.resumed_files = 0
+        if not self.journal_enabled:
+            self.journal = None
+            return self.iter_pdf_files()
+        self.journal = JobJournal()
+        if not self.journal.open_batch(self.batch_key(), self.fingerprint(), self.resume):
+            return self.iter_pdf_files()
+        interrupted = self.journal.cleanup_interrupted()
+        self.resumed_files = self.journal.finished_count()
+        print(f"↩️ Resuming: {self.resumed_files} files already finished, {interrupted} interrupted")
+        if self.journal.discovery_complete:
+            return iter(self.journal.pending_jobs())
+        # Discovery had not finished: walk again, leaving out what is done
+        return (item for item in self.iter_pdf_files() if not self.journal.is_finished(item[0]))
+
+    def start(self):
+        """Starts discovery and processing in the background. Returns False if there is no PDF at all."""
+        files = self.open_journal()
+        first = next(files, None)
+        if first is None and not self.watch:
+            if self.journal:
+                self.journal.close_batch(BATCH_FINISHED)
+                self.journal.close()
+                self.journal = None
+            return False
+
+        self.start_time = time.time()
+        self.total_files = 0
+        self.processed_files = 0
+        self.cached_files = 0
+        self.skipped_files = 0
+        self.failed_files = 0
+        self.retried_files = 0
+        self.quarantined_files = 0
+        self.duplicate_files = 0
+        self.duplicate_pages = 0
+        self.page_classes = Counter()
+        self.ocr_pages = 0
+        self.metrics.clear()
+        self._waiting.clear()
+        self._originals.clear()
+        self.processing = True
+        self.discovering = True
+        self._closed = False
+        self._finished.clear()
+
+        # In "Zielordner = Quellordner" mode the log is placed in the first source folder
+        if self.target_folder is None:
+            self.log_dir = os.path.join(self.source_folders[0], LOG_DIR_NAME)
+        else:
+            os.makedirs(self.target_folder, exist_ok=True)
+            self.log_dir = os.path.join(self.target_folder, LOG_DIR_NAME)
+
+        # Only the main process writes the log, so the workers need no shared lock
+        self.log_handler = LogHandler(self.log_dir, self.logfile_enabled, self.log_format)
+        self.log_handler.start()
+        metrics_path = self.metrics_path
+        if metrics_path is None and self.logfile_enabled:
+            metrics_path = os.path.join(os.path.dirname(self.log_dir), "ocr_metrics.jsonl")
+        self.metrics_writer = MetricsWriter(metrics_path) if metrics_path else None
+
+        # Without internal parallelism every file gets exactly one core
+        max_jobs = DEFAULT_MAX_JOBS_PER_FILE if self.use_internal_parallelism else 1
+        self.scheduler = CoreScheduler(max_jobs_per_file=max_jobs, memory_budget=self.memory_budget,
+                                       order=ORDER_SHORTEST_FIRST if self.shortest_first else ORDER_LARGEST_FIRST,
+                                       shares=self.folder_shares())
+        self.cache = OcrCache() if self.cache_enabled else None
+        if self.dedup:
+            # Used by the feed thread only, like the cache connection
+            self.duplicates = DuplicateIndex(self.cache.file_digest, eager=True) if self.cache else DuplicateIndex()
+        # Two files per core ahead, so the next file is local when a worker becomes free
+        self.stager = Stager(self.staging_dir, read_ahead_files=2 * self.scheduler.total_cores) if self.staging else None
+
+        # Fresh workers every few files keep fragmented heaps of pikepdf/Pillow from piling up
+        self.guard = TaskGuard(rss_limit=self.worker_rss_limit or None, on_page=self._page_done)
+        self.pool = multiprocessing.Pool(
+            processes=self.scheduler.worker_count(),
+            initializer=OCRProcessor.init_worker,
+            initargs=(self.redirect_worker_output, *self.guard.initargs(), self.temp_dir),
+            maxtasksperchild=self.max_tasks_per_worker or None
+        )
+        self.guard.start(self.pool)
+        if any(self.profile_for(folder).recompress for folder in self.source_folders):
+            self.recompress_guard = TaskGuard(rss_limit=self.worker_rss_limit or None)
+            self.recompress_pool = multiprocessing.Pool(
+                processes=self.recompress_workers or max(1, self.scheduler.total_cores // 4),
+                initializer=OCRProcessor.init_recompress_worker,
+                initargs=(self.recompress_nice, self.redirect_worker_output, *self.recompress_guard.initargs(),
+                          self.temp_dir),
+                maxtasksperchild=self.max_tasks_per_worker or None
+            )
+            self.recompress_guard.start(self.recompress_pool)
+
+        self._discovered = queue.Queue(maxsize=DISCOVERY_QUEUE_SIZE)
+        self._outstanding = threading.Semaphore(self.scheduler.total_cores * OUTSTANDING_PER_CORE)
+        self.emit("start", resumed=self.resumed_files)
+        if self.watch:
+            # Started before the initial scan, so no file landing in between is missed
+            self.watcher = HotFolderWatcher(self.source_folders, self.include_subfolders, self.add_file,
+                                            self.settle_time, self.poll_interval, self.watch_polling)
+            self.watcher.start()
+        initial = files if first is None else itertools.chain([first], files)
+        threading.Thread(target=self._discover, args=(initial,), daemon=True).start()
+        threading.Thread(target=self._feed, daemon=True).start()
+        return True
+
+    def _discover(self, files):
+        # Walks the source folders; blocks while the queue is full
+        for item in files:
+            if not self._put(item):
+                return
+            if self.journal:
+                self.journal.queued(*item)
+            with self._lock:
+                self.total_files += 1
+            self.emit("discovered", total=self.total_files)
+        if not self.watch:
+            self._put(None)
+
+    def add_file(self, input_path, source_folder):
+        """Queues a single file, e.g. one that just landed in a hot folder."""
+        if not self.processing or self._is_own_file(input_path):
+            return
+        fm = FileManager(self.source_folders, self.target_folder, self.include_subfolders)
+        item = fm.get_job(input_path, os.path.dirname(input_path), source_folder)
+        if self._put(item):
+            if self.journal:
+                self.journal.queued(*item)
+            with self._lock:
+                self.total_files += 1
+            self.emit("discovered", total=self.total_files)
+
+    def _is_own_file(self, path):
+        # Files being processed, their temporary outputs and results written in place
+        with self._lock:
+            if path in self._active or any(path == output for output, _ in self._active.values()):
+                return True
+            written = self._written.pop(path, None)
+        if written is None:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True
+        return written == (st.st_size, st.st_mtime_ns)
+
+    def _put(self, item):
+        while self.processing:
+            try:
+                self._discovered.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self):
+        # Cache check and triage for every discovered file, bounded by the outstanding budget
+        try:
+            while self.processing:
+                try:
+                    item = self._discovered.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    if self.journal:
+                        self.journal.discovery_done()
+                    self.discovering = False
+                    self.emit("discovery_done", total=self.total_files)
+                    self._check_finished()
+                    return
+                # While paused no new file is taken up
+                while self.processing and not (self._unpaused.wait(timeout=0.5)
+                                               and self._outstanding.acquire(timeout=0.5)):
+                    pass
+                if not self.processing:
+                    return
+                self._submit_triage(*item)
+        finally:
+            if self.cache:
+                # The connection belongs to this thread
+                self.cache.close()
+
+    def create_processor(self, source_folder):
+        return OCRProcessor(self.use_internal_parallelism, source_folder, self.cache, self.min_dpi,
+                            self.profile_for(source_folder))
+
+    def _submit_triage(self, input_path, output_path, source_folder):
+        with self._lock:
+            if input_path in self._active:
+                # Reported twice by the watcher; the run in flight covers it
+                self.total_files -= 1
+                self._outstanding.release()
+                return
+            self._active[input_path] = (output_path, source_folder)
+        if self.duplicates is not None and self._hold_duplicate(input_path, output_path, source_folder):
+            return
+        self._submit_unique(input_path, output_path, source_folder)
+
+    def _submit_unique(self, input_path, output_path, source_folder):
+        processor = self.create_processor(source_folder)
+        if self.cache and processor.restore_cached(input_path, output_path):
+            with self._lock:
+                self.cached_files += 1
+            final_path = input_path if is_in_place(input_path, output_path) else output_path
+            self._completed(dict(input_path=input_path, status="cached", output_path=final_path))
+            return
+        self.submit(
+            processor.triage_pdf, (input_path, output_path),
+            callback=lambda result: self._triaged(result, output_path, source_folder),
+            error_callback=lambda error: self._completed(
+                dict(input_path=input_path, status="error", error=str(error))),
+            pages=1, name=f"triage of {input_path}"
+        )
+
+    def _hold_duplicate(self, input_path, output_path, source_folder):
+        """Takes a file off the pipeline if an earlier file has the same content. Returns False for new content."""
+        try:
+            original = self.duplicates.add(input_path)
+        except OSError:
+            # The triage reports what is wrong with the file
+            return False
+        if original is None:
+            return False
+        with self._lock:
+            finished = self._originals.get(original)
+            if finished is None:
+                # Waits without holding a slot of the outstanding budget, so copies cannot stall the batch
+                self._waiting.setdefault(original, []).append((input_path, output_path, source_folder))
+        if finished is None:
+            self._outstanding.release()
+            return True
+        try:
+            self._fan_out(original, finished, input_path, output_path, source_folder)
+        except Exception as e:
+            # The output of the original is gone, e.g. moved away during a watch run
+            print(f"⚠️ Output of {original} not available, processing {input_path} itself: {e}")
+            self.duplicates.discard(original)
+            with self._lock:
+                self._originals.pop(original, None)
+            return False
+        return True
+
+    def _fan_out(self, original, finished, input_path, output_path, source_folder, release=True):
+        """Completes a duplicate with the result of its original."""
+        status, original_output, pages, error = finished
+        relative_path = os.path.relpath(input_path, source_folder)
+        if status == "error":
+            self._completed(dict(input_path=input_path, status="error", error=f"Duplikat von {original}: {error}",
+                                 duplicate_of=original), release)
+            return
+        if status == "skipped" or not original_output:
+            # Nothing was OCRed; the file is placed like any file without OCR need
+            self.create_processor(source_folder).keep_original(input_path, output_path)
+            with self._lock:
+                self.skipped_files += 1
+            self._completed(dict(input_path=input_path, status="skipped", pages=pages, duplicate_of=original), release)
+            return
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        method = link_output(original_output, output_path)
+        final_path = output_path
+        if is_in_place(input_path, output_path):
+            os.replace(output_path, input_path)
+            final_path = input_path
+        print(f"🔗 Duplicate of {original} ({method}): {relative_path}")
+        with self._lock:
+            self.duplicate_files += 1
+            self.duplicate_pages += pages or 0
+        self._completed(dict(input_path=input_path, status="duplicate", output_path=final_path, pages=pages,
+                             duplicate_of=original, details=f"Duplikat von {original}"), release)
+
+    def _triaged(self, result, output_path, source_folder):
+        # Runs on the pool's result thread
+        with self._lock:
+            self.page_classes.update(result.counts)
+        self.emit("triaged", input_path=result.input_path, pages=result.pages, counts=dict(result.counts),
+                  ocr_pages=result.ocr_pages)
+        if result.error is None and result.mode == MODE_SKIP:
+            with self._lock:
+                self.skipped_files += 1
+            self._completed(dict(input_path=result.input_path, status="skipped", pages=result.pages))
+            return
+        if self.split_pages and result.pages > self.split_pages:
+            self._split(SplitState(result.input_path, output_path, source_folder, result.pages,
+                                   result.mode, result.source_dpi, result.languages))
+            return
+        job = ScheduledJob(result.input_path, output_path, source_folder, result.pages, result.mode,
+                           result.source_dpi, dpi=self.ocr_dpi(result, source_folder), priority=self._file_priorities.get(result.input_path),
+                           languages=result.languages)
+        if self.stager:
+            # Queued once the copy is local; a failed copy is read from the share
+            self.stager.prefetch(result.input_path, lambda staged_input: self._staged(job, staged_input))
+            return
+        self.scheduler.add_jobs([job])
+        self.dispatch_jobs()
+
+    def _staged(self, job, staged_input):
+        # Runs on a staging thread
+        job.staged_input = staged_input
+        self.scheduler.add_jobs([job])
+        if self.processing:
+            self.dispatch_jobs()
+
+    def _split(self, state):
+        processor = self.create_processor(state.source_folder)
+        self.submit(
+            processor.split_pdf, (state.input_path, chunk_size(state.pages, self.scheduler.total_cores)),
+            callback=lambda split: self._split_ready(state, *split),
+            error_callback=lambda error: self._completed(
+                dict(input_path=state.input_path, status="error", error=str(error))),
+            pages=state.pages, name=f"split of {state.input_path}"
+        )
+
+    def _split_ready(self, state, work_dir, chunks):
+        # Runs on the pool's result thread: every chunk competes for cores like a file
+        state.set_chunks(work_dir, chunks)
+        if self.journal:
+            # Recorded so a resume can remove the chunks of an interrupted split
+            self.journal.running(state.input_path, work_dir)
+        with self._lock:
+            self._splits[state.input_path] = state
+        self.scheduler.add_jobs([
+            ScheduledJob(chunk_input, chunk_output, state.source_folder, pages, state.mode, state.source_dpi,
+                         kind=KIND_CHUNK, split=state, dpi=self.ocr_dpi(state, state.source_folder),
+                         priority=self._file_priorities.get(state.input_path), languages=state.languages)
+            for chunk_input, chunk_output, pages in chunks
+        ])
+        self.dispatch_jobs()
+
+    def ocr_dpi(self, triage, source_folder):
+        # Resolution the pages are rasterized at, which drives the memory estimate
+        return self.create_processor(source_folder).build_options(triage.mode, triage.source_dpi)[1]
+
+    def dispatch_jobs(self):
+        """Submits as many files as the scheduler's core budget allows."""
+        while self.processing:
+            scheduled = self.scheduler.next_job()
+            if scheduled is None:
+                return
+            job, jobs = scheduled
+            processor = self.create_processor(job.source_folder)
+            if job.kind == KIND_CHUNK:
+                self.submit(
+                    processor.process_chunk, (job.input_path, job.output_path, jobs, job.mode, job.source_dpi, job.fallback,
+                                              job.languages),
+                    callback=lambda metrics, job=job, jobs=jobs: self._chunk_done(job, jobs, metrics=metrics),
+                    error_callback=lambda error, job=job, jobs=jobs: self._chunk_done(job, jobs, error),
+                    pages=job.pages, name=f"{job.input_path} of {job.split.input_path}"
+                )
+            else:
+                if job.kind == KIND_MERGE:
+                    state = job.split
+                    func = processor.merge_chunks
+                    args = (state.input_path, state.output_path, state.chunk_outputs(), state.work_dir,
+                            state.source_dpi, state.pages, list(state.metrics), state.fallback, state.languages)
+                else:
+                    func = processor.process_pdf
+                    args = (job.input_path, job.output_path, jobs, job.mode, job.source_dpi, job.pages, job.fallback,
+                            job.staged_input, job.languages)
+                    if self.journal:
+                        self.journal.running(job.input_path)
+                self.submit(
+                    func, args,
+                    callback=lambda result, job=job, jobs=jobs: self.task_callback(result, jobs, job),
+                    error_callback=lambda error, job=job, jobs=jobs: self.task_callback(
+                        dict(input_path=job.input_path, status="error", error=str(error)), jobs, job),
+                    pages=job.pages, name=job.input_path
+                )
+
+    def _page_done(self, name):
+        # Runs on the guard's thread; name is the task, i.e. the file or chunk
+        with self._lock:
+            self.ocr_pages += 1
+            ocr_pages = self.ocr_pages
+        self.emit("page", task=name, ocr_pages=ocr_pages)
+
+    def submit(self, func, args, callback, error_callback, pages=1, name=""):
+        # Every pool task runs under the guard, so a hung file cannot stall the batch
+        self.guard.submit(func, args, callback, error_callback,
+                          timeout=self.retry_policy.timeout(pages), name=name)
+
+    def _chunk_done(self, job, jobs, error=None, metrics=None):
+        # Runs on the pool's result thread; the last chunk queues the merge
+        self.scheduler.release(jobs, job.memory)
+        state = job.split
+        if error is not None:
+            print(f"❌ Error processing {job.input_path} of {state.input_path}: {error}")
+            if self.retry(job, error):
+                # The merged file then mixes settings, so it is treated as a fallback result
+                state.fallback = True
+                if self.processing:
+                    self.dispatch_jobs()
+                return
+        if state.chunk_done(None if error is None else str(error), metrics):
+            if state.errors:
+                shutil.rmtree(state.work_dir, ignore_errors=True)
+                self._completed(dict(input_path=state.input_path, status="error", error=state.errors[0]))
+            else:
+                # Merging is single-threaded, but goes first so the file gets finished
+                self.scheduler.add_jobs([ScheduledJob(state.input_path, state.output_path, state.source_folder,
+                                                      state.pages, kind=KIND_MERGE, split=state, max_jobs=1)])
+        if self.processing:
+            self.dispatch_jobs()
+
+    def task_callback(self, result, jobs=1, job=None):
+        # Runs on the pool's result thread: hand the freed cores to the next files right away
+        self.scheduler.release(jobs, job.memory if job else 0)
+        retried = (result.get("status") == "error" and job is not None and job.kind != KIND_MERGE
+                   and self.retry(job, result.get("error")))
+        recompress = (result.get("status") == "done" and self.recompress_pool and job is not None
+                      and self.profile_for(job.source_folder).recompress)
+        if recompress:
+            # The cores are free already, the recompression overlaps with the next files
+            self.submit_recompression(result, job)
+        elif not retried:
+            self._output_ready(result)
+        if self.processing:
+            self.dispatch_jobs()
+
+    def submit_recompression(self, result, job):
+        processor = self.create_processor(job.source_folder)
+        self.recompress_guard.submit(
+            processor.recompress_output, (result,), callback=self._output_ready,
+            error_callback=lambda error: self._recompression_failed(result, error),
+            timeout=self.retry_policy.timeout(job.pages), name=f"recompression of {job.input_path}")
+
+    def _recompression_failed(self, result, error):
+        # Timed out or lost its worker; the OCR output is fine as it is
+        print(f"⚠️ Recompression failed for {result['input_path']}: {error}")
+        result.pop("input_digest", None)
+        self._output_ready(result)
+
+    def _output_ready(self, result):
+        if result.get("staged_output") and result.get("status") == "done" and self.stager:
+            # The copy to the share overlaps with the next files
+            self.stager.write_back(result.pop("staged_output"), result["output_path"],
+                                   lambda error, written: self._written_back(result, error, written))
+        else:
+            self._completed(result)
+
+    def _written_back(self, result, error, written):
+        # Runs on a staging thread
+        if error is not None:
+            result.update(status="error", error=f"Write-back failed: {error}")
+        if written is not None and "disk_write_bytes" in result:
+            result["disk_write_bytes"] += written
+        self._completed(result)
+
+    def retry(self, job, error):
+        """Queues a failed job again after the policy's backoff. Returns False if it has no attempts left."""
+        policy = self.retry_policy
+        if not self.processing or not policy.should_retry(job.attempt):
+            return False
+        delay = policy.delay(job.attempt)
+        print(f"🔁 Retrying {job.input_path} in {delay:.0f}s with fallback settings "
+              f"(attempt {job.attempt + 1}/{policy.max_attempts}): {error}")
+        with self._lock:
+            self.retried_files += 1
+        timer = threading.Timer(delay, self._requeue, args=(job.retry(),))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _requeue(self, job):
+        if not self.processing:
+            return
+        self.scheduler.add_jobs([job])
+        self.dispatch_jobs()
+
+    def _completed(self, result, release=True):
+        waiting = ()
+        with self._lock:
+            self.processed_files += 1
+            if result.get("status") == "error":
+                self.failed_files += 1
+            output_path, source_folder = self._active.pop(result.get("input_path"), (None, None))
+            if self.duplicates is not None and "duplicate_of" not in result:
+                self._originals[result.get("input_path")] = (result.get("status"), result.get("output_path"),
+                                                             result.get("pages"), result.get("error"))
+                waiting = self._waiting.pop(result.get("input_path"), ())
+            self._splits.pop(result.get("input_path"), None)
+            if self.watch and self.target_folder is None and result.get("output_path"):
+                self._remember_written(result["output_path"])
+            if "wall" in result:
+                self.metrics.append(result)
+        stager = self.stager
+        if stager:
+            stager.release(result.get("input_path"))
+        if result.get("status") == "error" and self.quarantine_folder and source_folder:
+            self.quarantine(result, output_path, source_folder)
+        if self.metrics_writer and result.get("status") in ("done", "error"):
+            self.metrics_writer.write(result)
+        if self.journal:
+            status = result.get("status")
+            self.journal.finished(result.get("input_path"), STATE_FAILED if status == "error" else status,
+                                  result.get("error"))
+        if source_folder:
+            self.write_log(result, source_folder)
+        if release:
+            self._outstanding.release()
+        self.emit("file", **result)
+        for duplicate in waiting:
+            try:
+                self._fan_out(result["input_path"], self._originals[result["input_path"]], *duplicate, release=False)
+            except Exception as e:
+                # Runs on the pool's result thread, which must not die of a single file
+                self._completed(dict(input_path=duplicate[0], status="error", duplicate_of=result["input_path"],
+                                     error=f"Ausgabe von {result['input_path']} nicht übernommen: {e}"), release=False)
+        self._check_finished()
+
+    def quarantine(self, result, output_path, source_folder):
+        """Moves a file that failed every attempt out of the source folders, with the error next to it."""
+        input_path = result["input_path"]
+        target = os.path.normpath(os.path.join(self.quarantine_folder, os.path.basename(source_folder),
+                                               os.path.relpath(input_path, source_folder)))
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(input_path, target)
+            with open(f"{target}.error.txt", "w", encoding="utf-8") as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\n{result.get('error')}\n")
+            if is_in_place(input_path, output_path) and os.path.exists(output_path):
+                # Leftover "_ocr" output of the last attempt
+                os.remove(output_path)
+        except OSError as e:
+            print(f"❌ Could not quarantine {input_path}: {e}")
+            return
+        print(f"🚧 Quarantined: {input_path} -> {target}")
+        result["quarantined"] = target
+        with self._lock:
+            self.quarantined_files += 1
+
+    def write_log(self, result, source_folder):
+        status = result.get("status")
+        if self.log_format == LOG_FORMAT_TEXT:
+            # The text log lists the files that got an OCR layer, as it always did
+            if status in ("done", "cached", "duplicate"):
+                self.log_handler.write_log(result["input_path"], source_folder, result.get("details"), status=status)
+            return
+        self.log_handler.write_log(result["input_path"], source_folder, result.get("details"), status=status,
+                                   duration=result.get("wall"), pages=result.get("pages"), dpi=result.get("dpi"),
+                                   language=result.get("language"), error=result.get("error"))
+
+    def _remember_written(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._written[path] = (st.st_size, st.st_mtime_ns)
+
+    def _check_finished(self):
+        with self._lock:
+            if self.processing and not self.discovering and self.processed_files >= self.total_files:
+                self.processing = False
+                self._finished.set()
+
+    def is_finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until every file has been processed; then shuts the pool down."""
+        if not self._finished.wait(timeout):
+            return False
+        self.finish()
+        return True
+
+    def finish(self):
+        with self._shutdown:
+            if self._closed:
+                return
+            self._closed = True
+            self._finish()
+
+    def _finish(self):
+        self.pool = self.close_pool(self.pool, self.guard)
+        self.recompress_pool = self.close_pool(self.recompress_pool, self.recompress_guard)
+        self.close_stager()
+        self.log_handler.close()
+        self.close_metrics()
+        self.close_journal(BATCH_FINISHED)
+        self.emit("done", **self.summary())
+
+    def stop(self):
+        self.processing = False
+        with self._shutdown:
+            if self._closed:
+                return
+            self._closed = True
+            self._stop()
+
+    def _stop(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        self.pool = self.close_pool(self.pool, self.guard, terminate=True)
+        self.recompress_pool = self.close_pool(self.recompress_pool, self.recompress_guard, terminate=True)
+        # Outputs already being written back are finished, so no half copy is left on the share
+        self.close_stager()
+        if self.log_handler:
+            self.log_handler.close()
+        for state in self._splits.values():
+            shutil.rmtree(state.work_dir, ignore_errors=True)
+        self._splits.clear()
+        self.close_metrics()
+        self.close_journal(BATCH_STOPPED)
+        self._finished.set()
+        self.emit("stopped", **self.summary())
+
+    @staticmethod
+    def close_pool(pool, guard, terminate=False):
+        if guard:
+            guard.stop()
+        if pool:
+            if terminate or (guard and guard.abandoned):
+                # Results of killed tasks never arrive, join() would wait for them forever
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        return None
+
+    def close_stager(self):
+        if self.stager:
+            self.stager.close()
+            self.stager = None
+
+    def close_metrics(self):
+        if self.metrics_writer:
+            self.metrics_writer.close()
+            self.metrics_writer = None
+
+    def close_journal(self, status):
+        if self.journal:
+            self.journal.close_batch(status)
+            self.journal.close()
+            self.journal = None
+
+    def summary(self):
+        elapsed = time.time() - self.start_time if self.start_time else 0.0
+        with self._lock:
+            records = list(self.metrics)
+        return dict(total=self.total_files, discovering=self.discovering, processed=self.processed_files, cached=self.cached_files,
+                    skipped=self.skipped_files, failed=self.failed_files, resumed=self.resumed_files,
+                    retried=self.retried_files, quarantined=self.quarantined_files,
+                    duplicates=self.duplicate_files, duplicate_pages=self.duplicate_pages,
+                    elapsed=round(elapsed, 1),
+                    pages=dict(self.page_classes), ocr_pages=self.ocr_pages,
+                    metrics=summarize(records, elapsed), memory=self.memory_summary())
+
+    def memory_summary(self):
+        """Peak memory per worker process and how often workers were replaced or files held back."""
+        if self.guard is None:
+            return {}
+        workers = dict(self.guard.worker_memory)
+        megabytes = lambda value: round((value or 0) / 1024 ** 2)
+        return dict(workers=len(workers), recycled=self.guard.retired,
+                    held_back=self.scheduler.held_back if self.scheduler else 0,
+                    peak_worker_mb=max((megabytes(peak) for _, peak, _ in workers.values()), default=0),
+                    peak_child_mb=max((megabytes(child) for _, _, child in workers.values()), default=0),
+                    per_worker_mb={pid: megabytes(peak) for pid, (_, peak, _) in workers.items()})
+
+    def emit(self, event, **data):
+        if self.on_event:
+            self.on_event(dict(event=event, **data))
@@ -0,0 +1,385 @@
+"""Headless entry point for batchOCR, e.g. for render servers without a display.
+
+    python batchocr.py run SOURCE [SOURCE ...] --target DIR
+    python batchocr.py serve SOURCE [SOURCE ...] --in-place --interval 300
+    python batchocr.py watch SOURCE [SOURCE ...] --target DIR [--poll]
+    python batchocr.py metrics ocr_metrics.jsonl
+    python batchocr.py log TARGET/ocr_log --status error --from 2024-05-01
+    python batchocr.py coordinator SOURCE [SOURCE ...] --target DIR --port 8765
+    python batchocr.py worker http://coordinator:8765
+    python batchocr.py profiles [--save NAME]
+
+"run" processes the sources once, "serve" keeps re-scanning them; unchanged files
+are skipped through the cache. "watch" treats the sources as hot folders and
+processes every new or modified PDF as soon as it is completely written. With --progress json every event is written to
+stdout as one JSON object per line. "metrics" summarizes the timings recorded by earlier runs,
+"log" searches the log of earlier runs through its index.
+"coordinator" hands the files of the sources to "worker" processes on other machines;
+--local-workers N starts N of them on this machine, e.g. for testing. --profile picks the OCR
+settings (built-in "standard", "fast", "archive" or a JSON file in ~/.batchocr/profiles),
+--folder-profile FOLDER=NAME gives single sources their own; "profiles" lists them."""
+import os
+import sys
+import json
+import signal
+import argparse
+import threading
+
+from batch_runner import BatchRunner
+from profiles import (ProfileError, load_profile, list_profiles, save_profile, profile_path, DEFAULT_PROFILE,
+                      DEFAULT_PROFILE_DIR)
+from hotfolder import DEFAULT_SETTLE_TIME, DEFAULT_POLL_INTERVAL
+from logstore import LogStore, LOG_FORMAT_TEXT, LOG_FORMAT_JSON
+from task_guard import (RetryPolicy, DEFAULT_TIMEOUT_BASE, DEFAULT_TIMEOUT_PER_PAGE, DEFAULT_MAX_ATTEMPTS, DEFAULT_BACKOFF,
+                        DEFAULT_MAX_TASKS_PER_WORKER, DEFAULT_WORKER_RSS_LIMIT)
+from metrics import read_records, summarize, format_summary
+from distributed import (Coordinator, RemoteWorker, start_local_workers, is_loopback, DEFAULT_HOST, DEFAULT_PORT,
+                         DEFAULT_LEASE_TIME)
+
+class ProgressPrinter:
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.lock = threading.Lock()
+        self.stream = sys.stdout
+        if fmt == "json":
+            # Status messages of the processor go to stderr, stdout only carries events
+            sys.stdout = sys.stderr
+
+    def __call__(self, event):
+        with self.lock:
+            if self.fmt == "json":
+                self.stream.write(json.dumps(event, default=str) + "\n")
+                self.stream.flush()
+            elif event["event"] == "discovery_done":
+                print(f"{event['total']} PDF-Dateien gefunden", file=sys.stderr)
+            elif event["event"] in ("done", "stopped"):
+                resumed = f", {event['resumed']} aus früherem Durchlauf" if event["resumed"] else ""
+                resumed += f", {event['retried']} Wiederholungen" if event["retried"] else ""
+                resumed += f", {event['quarantined']} in Quarantäne" if event["quarantined"] else ""
+                if event.get("duplicates"):
+                    resumed += f", {event['duplicates']} Duplikate ({event['duplicate_pages']} Seiten gespart)"
+                print(f"{event['processed']}/{event['total']} Dateien verarbeitet "
+                      f"({event['cached']} aus Cache, {event['skipped']} ohne OCR-Bedarf, "
+                      f"{event['failed']} Fehler{resumed}) - {event['elapsed']}s", file=sys.stderr)
+                if event["metrics"]["files"]:
+                    print(format_summary(event["metrics"]), file=sys.stderr)
+                memory = event.get("memory")
+                if memory and memory["workers"]:
+                    print(f"Speicher: höchstens {memory['peak_worker_mb']} MB pro Worker, "
+                          f"{memory['peak_child_mb']} MB für Tesseract/Ghostscript, "
+                          f"{memory['recycled']} Worker ersetzt, {memory['held_back']} Dateien zurückgestellt", file=sys.stderr)
+
+def build_parser():
+    # Options shared by the local batch commands and the coordinator
+    folders = argparse.ArgumentParser(add_help=False)
+    folders.add_argument("sources", nargs="+", metavar="SOURCE", help="Quellordner")
+    target = folders.add_mutually_exclusive_group(required=True)
+    target.add_argument("-t", "--target", help="Zielordner")
+    target.add_argument("--in-place", action="store_true", help="Zielordner = Quellordner (Originale ersetzen)")
+    folders.add_argument("--no-subfolders", action="store_true", help="Unterordner nicht integrieren")
+    folders.add_argument("--no-logfile", action="store_true", help="Kein Logfile erstellen")
+    folders.add_argument("--log-format", choices=(LOG_FORMAT_TEXT, LOG_FORMAT_JSON), default=LOG_FORMAT_TEXT,
+                         help="text: Zeilen wie bisher; json: mit Ordner, Status, Dauer und Seitenzahl je Datei "
+                              "(in beiden Fällen eine Datei pro Tag im Ordner ocr_log)")
+    folders.add_argument("--profile", default=DEFAULT_PROFILE, help="OCR-Profil aller Quellordner (siehe \"profiles\")")
+    folders.add_argument("--folder-profile", action="append", default=[], metavar="ORDNER=PROFIL",
+                         help="Eigenes OCR-Profil für einen Quellordner (mehrfach angebbar)")
+    folders.add_argument("--min-dpi", type=int, help="Mindestauflösung für OCR (Standard: aus dem Profil)")
+    folders.add_argument("--attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                         help="Versuche pro Datei; Wiederholungen laufen ohne Begradigung und mit geringerer Auflösung")
+    folders.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_BASE, metavar="SEC",
+                         help="Zeitlimit pro Datei in Sekunden, zuzüglich --timeout-per-page je Seite (beide 0 = aus)")
+    folders.add_argument("--timeout-per-page", type=float, default=DEFAULT_TIMEOUT_PER_PAGE, metavar="SEC")
+    folders.add_argument("--progress", choices=("text", "json"), default="text",
+                         help="Fortschrittsausgabe; json schreibt ein Ereignis pro Zeile nach stdout")
+
+    common = argparse.ArgumentParser(add_help=False, parents=[folders])
+    common.add_argument("--no-internal-parallelism", action="store_true", help="Interne Parallelisierung deaktivieren")
+    common.add_argument("--no-cache", action="store_true", help="Auch unveränderte Dateien erneut verarbeiten")
+    common.add_argument("--split-pages", type=int, default=0, metavar="N",
+                        help="PDFs mit mehr als N Seiten in Abschnitte aufteilen und parallel verarbeiten (0 = aus)")
+    common.add_argument("--resume", action="store_true",
+                        help="Einen gestoppten oder abgebrochenen Durchlauf fortsetzen, fertige Dateien auslassen")
+    common.add_argument("--no-journal", action="store_true", help="Keinen Verarbeitungsstand für --resume speichern")
+    common.add_argument("--backoff", type=float, default=DEFAULT_BACKOFF, metavar="SEC",
+                        help="Wartezeit vor der ersten Wiederholung, verdoppelt sich mit jedem Versuch")
+    common.add_argument("--quarantine", metavar="DIR",
+                        help="Dateien, die bei allen Versuchen scheitern, in diesen Ordner verschieben")
+    common.add_argument("--priority", action="append", default=[], metavar="ORDNER=N",
+                        help="Priorität eines Quellordners; höhere zuerst (Standard 0, mehrfach angebbar)")
+    common.add_argument("--weight", action="append", default=[], metavar="ORDNER=W",
+                        help="Anteil eines Quellordners an den Kernen unter gleicher Priorität (Standard 1)")
+    common.add_argument("--shortest-first", action="store_true",
+                        help="Innerhalb eines Ordners kurze Dateien zuerst statt lange")
+    common.add_argument("--stage", action="store_true",
+                        help="Dateien vorab lokal zwischenspeichern und Ergebnisse im Hintergrund zurückschreiben "
+                             "(für Quellen auf Netzlaufwerken)")
+    common.add_argument("--stage-dir", metavar="DIR",
+                        help="Lokales Verzeichnis für --stage, z.B. /dev/shm oder eine SSD (Standard: temporäres Verzeichnis)")
+    common.add_argument("--temp-dir", metavar="DIR",
+                        help="Arbeitsverzeichnisse der OCR auf einem schnellen Laufwerk, z.B. /dev/shm oder eine SSD "
+                             "(Standard: temporäres Verzeichnis; auch für --stage)")
+    common.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="Dateien nur starten, solange ihr geschätzter Speicherbedarf hineinpasst "
+                             "(Standard: 75%% des Arbeitsspeichers, 0 = aus)")
+    common.add_argument("--max-tasks-per-worker", type=int, default=DEFAULT_MAX_TASKS_PER_WORKER, metavar="N",
+                        help="Worker-Prozesse nach N Aufgaben ersetzen (0 = nie)")
+    common.add_argument("--worker-rss-limit", type=int, default=DEFAULT_WORKER_RSS_LIMIT // 1024 ** 2, metavar="MB",
+                        help="Worker-Prozesse ersetzen, deren Speicher nach einer Datei darüber liegt (0 = aus)")
+    common.add_argument("--no-dedup", action="store_true",
+                        help="Inhaltsgleiche Dateien (z.B. in mehreren Quellordnern) jede für sich verarbeiten")
+    common.add_argument("--recompress-workers", type=int, metavar="N",
+                        help="Prozesse für die Nachkomprimierung von Profilen mit recompress (Standard: ein Viertel der Kerne)")
+    common.add_argument("--metrics", metavar="FILE",
+                        help="Zeitmessung pro Datei in diese Datei schreiben (.jsonl oder .csv); "
+                             "Standard: ocr_metrics.jsonl neben dem Logfile")
+
+    parser = argparse.ArgumentParser(prog="batchocr", description="batchOCR ohne grafische Oberfläche")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", parents=[common], help="Quellordner einmal verarbeiten")
+    serve = commands.add_parser("serve", parents=[common], help="Quellordner fortlaufend verarbeiten")
+    serve.add_argument("--interval", type=float, default=300, help="Sekunden zwischen zwei Durchläufen")
+    watch = commands.add_parser("watch", parents=[common], help="Quellordner als Hotfolder überwachen")
+    watch.add_argument("--poll", action="store_true", help="Ordner regelmäßig durchsuchen statt inotify (Netzlaufwerke)")
+    watch.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Sekunden zwischen zwei Suchläufen")
+    watch.add_argument("--settle", type=float, default=DEFAULT_SETTLE_TIME,
+                       help="Sekunden ohne Änderung, bevor eine Datei als vollständig gilt")
+    log = commands.add_parser("log", help="Log früherer Durchläufe durchsuchen")
+    log.add_argument("dir", metavar="DIR", help="Log-Ordner (ocr_log im Zielordner)")
+    log.add_argument("--from", dest="date_from", metavar="JJJJ-MM-TT", help="Einträge ab diesem Tag")
+    log.add_argument("--to", dest="date_to", metavar="JJJJ-MM-TT", help="Einträge bis einschließlich diesem Tag")
+    # Text lines carry neither, entries indexed from text files have no folder or status
+    log.add_argument("--folder", help="Nur Einträge dieses Quellordners (zuverlässig nur mit --log-format json)")
+    log.add_argument("--status", help="Nur Einträge mit diesem Status, z.B. error (zuverlässig nur mit --log-format json)")
+    log.add_argument("--file", dest="filename", help="Nur Dateien, deren Name dies enthält")
+    log.add_argument("--limit", type=int, default=50, help="Höchstens so viele Einträge, neueste zuerst")
+    metrics = commands.add_parser("metrics", help="Zeitmessungen früherer Durchläufe auswerten")
+    metrics.add_argument("file", metavar="FILE", help="Metrikdatei (.jsonl oder .csv)")
+    metrics.add_argument("--slowest", type=int, default=10, help="Anzahl der langsamsten Dateien")
+    metrics.add_argument("--json", action="store_true", help="Zusammenfassung als JSON ausgeben")
+    coordinator = commands.add_parser("coordinator", parents=[folders],
+                                      help="Quellordner auf Worker anderer Rechner verteilen")
+    coordinator.add_argument("--host", default=DEFAULT_HOST,
+                             help="Adresse, auf der auf Worker gewartet wird, z.B. 0.0.0.0 für alle "
+                                  "(Standard: nur dieser Rechner; andere Adressen nur mit --token)")
+    coordinator.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinator.add_argument("--token", default=os.environ.get("BATCHOCR_TOKEN"),
+                             help="Gemeinsames Kennwort für Worker (Standard: $BATCHOCR_TOKEN)")
+    coordinator.add_argument("--lease-time", type=float, default=DEFAULT_LEASE_TIME, metavar="SEC",
+                             help="Sekunden ohne Lebenszeichen, nach denen eine Datei neu vergeben wird")
+    coordinator.add_argument("--local-workers", type=int, default=0, metavar="N",
+                             help="N Worker auf diesem Rechner starten, z.B. zum Testen")
+    worker = commands.add_parser("worker", help="Dateien eines Koordinators verarbeiten")
+    worker.add_argument("url", help="Adresse des Koordinators, z.B. http://server:8765")
+    worker.add_argument("--token", default=os.environ.get("BATCHOCR_TOKEN"),
+                        help="Gemeinsames Kennwort (Standard: $BATCHOCR_TOKEN)")
+    worker.add_argument("--slots", type=int, help="Gleichzeitig verarbeitete Dateien (Standard: halbe Kernzahl)")
+    worker.add_argument("--name", help="Name in Log und Statistik (Standard: Rechnername-PID)")
+    worker.add_argument("--no-internal-parallelism", action="store_true", help="Interne Parallelisierung deaktivieren")
+    worker.add_argument("--temp-dir", metavar="DIR",
+                        help="Downloads und Arbeitsverzeichnisse auf einem schnellen Laufwerk, z.B. /dev/shm")
+    profiles = commands.add_parser("profiles", help="OCR-Profile anzeigen")
+    profiles.add_argument("--save", metavar="PROFIL",
+                          help=f"Profil als JSON-Datei in {DEFAULT_PROFILE_DIR} ablegen, um es anzupassen")
+    return parser
+
+def folder_values(parser, values, cast):
+    # "FOLDER=VALUE" pairs; the folder is matched like the sources, i.e. as absolute path
+    result = {}
+    for value in values:
+        folder, _, number = value.rpartition("=")
+        try:
+            result[os.path.abspath(folder)] = cast(number)
+        except ValueError:
+            parser.error(f"Ungültige Angabe {value!r}, erwartet ORDNER=ZAHL")
+    return result
+
+def folder_profiles(parser, args):
+    # Loaded here, so a typo in a profile name ends in a usage error instead of a traceback
+    profiles = folder_values(parser, args.folder_profile, str)
+    try:
+        for name in [args.profile, *profiles.values()]:
+            load_profile(name)
+    except ProfileError as e:
+        parser.error(str(e))
+    return profiles
+
+def create_runner(args, printer):
+    watch = args.command == "watch"
+    return BatchRunner(
+        [os.path.abspath(source) for source in args.sources],
+        None if args.in_place else os.path.abspath(args.target),
+        include_subfolders=not args.no_subfolders,
+        use_internal_parallelism=not args.no_internal_parallelism,
+        logfile_enabled=not args.no_logfile,
+        log_format=args.log_format,
+        cache_enabled=not args.no_cache,
+        min_dpi=args.min_dpi,
+        profile=args.profile,
+        folder_profiles=folder_profiles(build_parser(), args),
+        on_event=printer,
+        redirect_worker_output=args.progress == "json",
+        split_pages=args.split_pages,
+        metrics_path=os.path.abspath(args.metrics) if args.metrics else None,
+        journal_enabled=not args.no_journal,
+        resume=args.resume,
+        retry_policy=RetryPolicy(args.attempts, args.backoff, timeout_base=args.timeout,
+                                 timeout_per_page=args.timeout_per_page),
+        quarantine_folder=os.path.abspath(args.quarantine) if args.quarantine else None,
+        memory_budget=None if args.memory_budget is None else args.memory_budget * 1024 ** 2,
+        max_tasks_per_worker=args.max_tasks_per_worker,
+        worker_rss_limit=args.worker_rss_limit * 1024 ** 2,
+        folder_priorities=folder_values(build_parser(), args.priority, int),
+        folder_weights=folder_values(build_parser(), args.weight, float),
+        shortest_first=args.shortest_first,
+        staging=args.stage or bool(args.stage_dir),
+        staging_dir=args.stage_dir,
+        temp_dir=args.temp_dir,
+        recompress_workers=args.recompress_workers,
+        dedup=not args.no_dedup,
+        watch=watch,
+        watch_polling=watch and args.poll,
+        settle_time=args.settle if watch else DEFAULT_SETTLE_TIME,
+        poll_interval=args.poll_interval if watch else DEFAULT_POLL_INTERVAL
+    )
+
+def run_once(args, printer, stop_event):
+    """Processes the sources once. Returns the number of failed files, or None if stopped."""
+    runner = create_runner(args, printer)
+    if not runner.start():
+        printer(dict(event="done", total=0, processed=0, cached=0, skipped=0, failed=0, resumed=0, retried=0, quarantined=0, elapsed=0.0, pages={},
+                     metrics=summarize([]), memory={}))
+        return 0
+    while not runner.wait(timeout=1):
+        if stop_event.is_set():
+            runner.stop()
+            return None
+    return runner.failed_files
+
+def run_coordinator(args, printer, stop_event):
+    """Distributes the sources once. Returns the number of failed files, or None if stopped."""
+    if not args.token and not is_loopback(args.host):
+        build_parser().error(f"--host {args.host} nur zusammen mit --token oder $BATCHOCR_TOKEN")
+    coordinator = Coordinator(
+        [os.path.abspath(source) for source in args.sources],
+        None if args.in_place else os.path.abspath(args.target),
+        include_subfolders=not args.no_subfolders,
+        host=args.host,
+        port=args.port,
+        token=args.token,
+        min_dpi=args.min_dpi,
+        profile=args.profile,
+        folder_profiles=folder_profiles(build_parser(), args),
+        lease_time=args.lease_time,
+        max_attempts=args.attempts,
+        timeout_base=args.timeout,
+        timeout_per_page=args.timeout_per_page,
+        logfile_enabled=not args.no_logfile,
+        log_format=args.log_format,
+        on_event=printer
+    )
+    coordinator.start()
+    workers, stop_workers = start_local_workers(coordinator, args.local_workers)
+    try:
+        while not coordinator.is_finished():
+            if stop_event.wait(1):
+                coordinator.stop()
+                return None
+    finally:
+        # Before the server goes away, so no local worker waits for an answer
+        stop_workers.set()
+        for process in workers:
+            process.join()
+    coordinator.wait()
+    return coordinator.failed_files
+
+def run_worker(args, stop_event):
+    worker = RemoteWorker(args.url, args.token, args.slots, args.name, not args.no_internal_parallelism,
+                          temp_dir=args.temp_dir)
+    worker.run(stop_event)
+    return 0
+
+def show_profiles(args):
+    if args.save:
+        try:
+            print(save_profile(load_profile(args.save)))
+        except (ProfileError, OSError) as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        return 0
+    for name in list_profiles():
+        try:
+            profile = load_profile(name)
+        except ProfileError as e:
+            print(f"{name}: {e}")
+            continue
+        source = "Datei" if os.path.isfile(profile_path(name)) else "eingebaut"
+        print(f"{name} ({source}): {'+'.join(profile.languages)}, {profile.min_dpi} dpi, optimize {profile.optimize}, "
+              f"deskew {'an' if profile.deskew else 'aus'}, clean {'an' if profile.clean else 'aus'}, "
+              f"{profile.output_type}" + (f", OEM {profile.tesseract_oem}" if profile.tesseract_oem is not None else "")
+              + (", Spracherkennung" if profile.detect_language and len(profile.languages) > 1 else "")
+              + (f", Nachkomprimierung {profile.recompress}" if profile.recompress else ""))
+    return 0
+
+def show_log(args):
+    if not os.path.isdir(args.dir):
+        print(f"❌ Kein Log-Ordner: {args.dir}", file=sys.stderr)
+        return 1
+    store = LogStore(args.dir)
+    try:
+        store.sync()
+        filters = dict(date_from=args.date_from, date_to=args.date_to, filename=args.filename, status=args.status,
+                       folder=os.path.abspath(args.folder) if args.folder else None)
+        for timestamp, folder, path, status, details in store.rows(0, args.limit, **filters):
+            print("\t".join([timestamp, status or "", os.path.join(folder, path) if folder else path, details or ""]))
+        print(f"{store.count(**filters)} Einträge", file=sys.stderr)
+    finally:
+        store.close()
+    return 0
+
+def show_metrics(args):
+    summary = summarize(list(read_records(args.file)), slowest=args.slowest)
+    print(json.dumps(summary) if args.json else format_summary(summary))
+    return 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "metrics":
+        return show_metrics(args)
+    if args.command == "log":
+        return show_log(args)
+    if args.command == "profiles":
+        return show_profiles(args)
+
+    stop_event = threading.Event()
+    def request_stop(signum, frame):
+        stop_event.set()
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    if args.command == "worker":
+        # Runs until SIGINT/SIGTERM; files in progress are finished first
+        return run_worker(args, stop_event)
+    printer = ProgressPrinter(args.progress)
+
+    if args.command == "coordinator":
+        failed = run_coordinator(args, printer, stop_event)
+        return 0 if failed == 0 else 1
+
+    if args.command == "run":
+        failed = run_once(args, printer, stop_event)
+        return 0 if failed == 0 else 1
+
+    if args.command == "watch":
+        # Never finishes on its own; runs until SIGINT/SIGTERM
+        run_once(args, printer, stop_event)
+        return 0
+
+    while not stop_event.is_set():
+        if run_once(args, printer, stop_event) is None:
+            break
+        stop_event.wait(args.interval)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
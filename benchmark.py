@@ -0,0 +1,344 @@
+"""Reproducible OCR benchmark on synthetic scans.
+
+    python benchmark.py generate [--corpus DIR]
+    python benchmark.py run [--workers 1 4] [--jobs 1 2] [--variant default no-deskew]
+    python benchmark.py compare [--threshold 10]
+
+"generate" renders text pages with Pillow (noise, skew, several resolutions and page
+counts) and keeps the text as ground truth. "run" OCRs the corpus once per combination
+of pool size, jobs per file and settings variant, exactly like a batch does (FileManager,
+triage, OCRProcessor), and appends throughput, peak RSS and recognition accuracy to the
+results file. "compare" reports every configuration whose latest run got worse than the
+one before; it exits with 1 in that case, so it can gate a build."""
+import os
+import sys
+import json
+import queue
+import time
+import random
+import shutil
+import difflib
+import hashlib
+import argparse
+import platform
+import subprocess
+import multiprocessing
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from filemanager import FileManager
+from ocr_processor import OCRProcessor
+from profiles import resolve_profile
+from triage import triage_pdf
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.expanduser("~"), ".batchocr", "benchmark", "corpus")
+DEFAULT_RESULTS_PATH = os.path.join(os.path.expanduser("~"), ".batchocr", "benchmark", "results.jsonl")
+DEFAULT_SEED = 4711
+CORPUS_DATE = time.strptime("2024-01-01", "%Y-%m-%d")
+
+# name, pages, scan resolution, skew in degrees, noise (speckles per square inch)
+CORPUS = (
+    ("brief_300", 1, 300, 0.0, 0),
+    ("rechnung_200_schief", 2, 200, 1.5, 20),
+    ("bericht_150_verrauscht", 5, 150, -1.0, 60),
+    ("vertrag_300", 12, 300, 0.5, 20),
+    ("fax_100", 3, 100, 2.5, 100),
+)
+
+# Settings variants: an OCR profile, overrides of its ocrmypdf options and of min_dpi
+VARIANTS = {
+    "default": dict(),
+    "no-deskew": dict(options=dict(deskew=False)),
+    "optimize-0": dict(options=dict(optimize=0)),
+    "optimize-2": dict(options=dict(optimize=2)),
+    "min-dpi-200": dict(min_dpi=200),
+    "min-dpi-400": dict(min_dpi=400),
+    "profile-fast": dict(profile="fast"),
+    "profile-archive": dict(profile="archive"),
+}
+
+# compare: relative change (percent) that counts as a regression
+DEFAULT_THRESHOLD = 10.0
+
+WORDS = (
+    "Rechnung", "Vertrag", "Kunde", "Lieferung", "Betrag", "Datum", "Anschrift", "Zahlung", "Auftrag",
+    "Angebot", "Bestellung", "Quittung", "Konto", "Steuer", "Frist", "Unterschrift", "Seite", "Nummer",
+    "invoice", "contract", "customer", "delivery", "amount", "address", "payment", "order", "receipt",
+    "account", "deadline", "signature", "page", "number", "und", "oder", "mit", "für", "über", "the",
+    "and", "with", "for", "from", "Müller", "Straße", "Größe", "Prüfung", "2024", "1.250,00", "EUR",
+    "Nr.", "vom", "bis", "per", "net", "total", "Gesamt", "Summe", "Menge", "Preis", "Artikel",
+)
+FONT_CANDIDATES = ("DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Arial.ttf", "arial.ttf")
+# A4 in inches
+PAGE_SIZE = (8.27, 11.69)
+
+def load_font(size):
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size), name
+        except OSError:
+            continue
+    # Pillow's bundled font; the corpus then differs from machines that have one of the above
+    return ImageFont.load_default(size), "default"
+
+def page_text(rng, lines=32, words_per_line=8):
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines)]
+
+def render_page(lines, dpi, skew, noise, rng):
+    width, height = (int(inches * dpi) for inches in PAGE_SIZE)
+    # 12 pt text with 1 inch margins
+    font, _ = load_font(max(6, round(12 / 72 * dpi)))
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    y = dpi
+    line_height = round(12 / 72 * dpi * 1.5)
+    for line in lines:
+        draw.text((dpi, y), line, fill=0, font=font)
+        y += line_height
+    # Dust and toner speckles; drawn from rng, so the corpus is the same on every run
+    radius = max(1, dpi // 150)
+    for _ in range(int(noise * PAGE_SIZE[0] * PAGE_SIZE[1])):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + radius, y + radius), fill=rng.randrange(0, 128))
+    if skew:
+        page = page.rotate(skew, resample=Image.BICUBIC, fillcolor=255)
+    # Scanner optics
+    return page.filter(ImageFilter.GaussianBlur(0.5 * dpi / 300))
+
+def generate_corpus(corpus_dir, seed=DEFAULT_SEED):
+    """Renders the synthetic scans and their ground truth; returns the corpus manifest."""
+    rng = random.Random(seed)
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    os.makedirs(os.path.join(corpus_dir, "pdf"))
+    documents = []
+    for name, pages, dpi, skew, noise in CORPUS:
+        texts = [page_text(rng) for _ in range(pages)]
+        images = [render_page(lines, dpi, skew, noise, rng) for lines in texts]
+        path = os.path.join(corpus_dir, "pdf", f"{name}.pdf")
+        # Fixed dates keep the files byte-identical between runs
+        images[0].save(path, save_all=True, append_images=images[1:], resolution=dpi,
+                       creationDate=CORPUS_DATE, modDate=CORPUS_DATE)
+        documents.append(dict(name=name, pages=pages, dpi=dpi, skew=skew, noise=noise,
+                              truth=["\n".join(lines) for lines in texts]))
+    _, font = load_font(12)
+    manifest = dict(seed=seed, font=font, documents=documents)
+    manifest["id"] = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    with open(os.path.join(corpus_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+def load_corpus(corpus_dir, seed=DEFAULT_SEED):
+    try:
+        with open(os.path.join(corpus_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["seed"] == seed:
+            return manifest
+    except (OSError, ValueError, KeyError):
+        pass
+    return generate_corpus(corpus_dir, seed)
+
+class BenchmarkProcessor(OCRProcessor):
+    """OCRProcessor with the overrides of a settings variant; also writes the recognized text as sidecar."""
+
+    def __init__(self, options=None, min_dpi=None, profile=None):
+        super().__init__(use_internal_parallelism=True, min_dpi=min_dpi, profile=resolve_profile(profile))
+        self.overrides = options or {}
+
+    def ocr_options(self):
+        return {**super().ocr_options(), **self.overrides}
+
+    def ocr(self, input_path, output_path, jobs, options):
+        super().ocr(input_path, output_path, jobs, dict(options, sidecar=sidecar_path(output_path)))
+
+def sidecar_path(output_path):
+    return os.path.splitext(output_path)[0] + ".txt"
+
+def process_file(processor, input_path, output_path, source_folder, jobs):
+    # Same steps as a batch: triage decides the mode and the oversampling
+    processor.pdf_folder = source_folder
+    triage = triage_pdf(input_path)
+    return processor.process_pdf(input_path, output_path, jobs, triage.mode, triage.source_dpi, triage.pages)
+
+def peak_rss_mb():
+    """Peak RSS of the largest finished child process (pool worker, Tesseract, Ghostscript) or of this one."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def normalize(text):
+    return " ".join(text.split())
+
+def accuracy(truth, recognized):
+    """Word and character accuracy as the share of the ground truth found in the OCR text, in percent."""
+    truth, recognized = normalize(truth), normalize(recognized)
+    words = difflib.SequenceMatcher(None, truth.split(), recognized.split(), autojunk=False)
+    chars = difflib.SequenceMatcher(None, truth, recognized, autojunk=False)
+    word_hits = sum(block.size for block in words.get_matching_blocks())
+    char_hits = sum(block.size for block in chars.get_matching_blocks())
+    return 100.0 * word_hits / max(1, len(truth.split())), 100.0 * char_hits / max(1, len(truth))
+
+def run_config(config, corpus_dir, work_dir, results):
+    """Runs in its own process, so the peak RSS belongs to this configuration only."""
+    source_folder = os.path.join(corpus_dir, "pdf")
+    target_folder = os.path.join(work_dir, config["name"])
+    shutil.rmtree(target_folder, ignore_errors=True)
+    variant = VARIANTS[config["variant"]]
+    processor = BenchmarkProcessor(variant.get("options"), variant.get("min_dpi"), variant.get("profile"))
+    files = FileManager([source_folder], target_folder).get_pdf_files()
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(config["workers"]) as pool:
+        outcomes = pool.starmap(process_file, [(processor, input_path, output_path, source, config["jobs"])
+                                               for input_path, output_path, source in files])
+    wall = time.perf_counter() - start
+    results.put(dict(wall=wall, peak_rss_mb=peak_rss_mb(),
+                     files=[dict(outcome, output_path=output_path) for (_, output_path, _), outcome in zip(files, outcomes)]))
+
+def evaluate(config, manifest, run):
+    documents = {document["name"]: document for document in manifest["documents"]}
+    per_document = {}
+    for outcome in run["files"]:
+        name = os.path.splitext(os.path.basename(outcome["input_path"]))[0]
+        entry = dict(status=outcome["status"], wall=outcome.get("wall"), stages=outcome.get("stages", {}))
+        if outcome["status"] == "done":
+            with open(sidecar_path(outcome["output_path"]), encoding="utf-8") as f:
+                # ocrmypdf separates the pages of the sidecar with form feeds
+                recognized = f.read().replace("\f", "\n")
+            entry["word_accuracy"], entry["char_accuracy"] = (
+                round(value, 2) for value in accuracy("\n".join(documents[name]["truth"]), recognized))
+        else:
+            entry["error"] = outcome.get("error")
+        per_document[name] = entry
+
+    done = [entry for entry in per_document.values() if entry["status"] == "done"]
+    pages = sum(documents[name]["pages"] for name, entry in per_document.items() if entry["status"] == "done")
+    return dict(
+        config=config,
+        pages=pages,
+        failed=len(per_document) - len(done),
+        wall=round(run["wall"], 2),
+        pages_per_sec=round(pages / run["wall"], 3) if run["wall"] else 0.0,
+        peak_rss_mb=run["peak_rss_mb"],
+        word_accuracy=round(sum(e["word_accuracy"] for e in done) / len(done), 2) if done else 0.0,
+        char_accuracy=round(sum(e["char_accuracy"] for e in done) / len(done), 2) if done else 0.0,
+        documents=per_document,
+    )
+
+def build_matrix(workers, jobs, variants):
+    return [dict(name=f"w{w}-j{j}-{variant}", workers=w, jobs=j, variant=variant)
+            for w in workers for j in jobs for variant in variants]
+
+def version():
+    # Commit of this checkout, so results can be told apart between versions
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def environment():
+    import ocrmypdf
+    return dict(version=version(), ocrmypdf=ocrmypdf.__version__, python=platform.python_version(),
+                platform=platform.platform(), cores=os.cpu_count())
+
+def run_benchmark(matrix, corpus_dir, results_path, seed=DEFAULT_SEED, work_dir=None):
+    manifest = load_corpus(corpus_dir, seed)
+    work_dir = work_dir or os.path.join(os.path.dirname(corpus_dir), "work")
+    env = environment()
+    context = multiprocessing.get_context("spawn")
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    records = []
+    for config in matrix:
+        print(f"🔄 {config['name']}", file=sys.stderr)
+        results = context.Queue()
+        process = context.Process(target=run_config, args=(config, corpus_dir, work_dir, results))
+        process.start()
+        run = None
+        while run is None:
+            try:
+                run = results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"{config['name']} abgebrochen (Exit-Code {process.exitcode})")
+        process.join()
+        record = dict(timestamp=time.strftime("%Y-%m-%d %H:%M:%S"), corpus=manifest["id"], **env,
+                      **evaluate(config, manifest, run))
+        with open(results_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"✅ {config['name']}: {record['pages_per_sec']} Seiten/s, {record['peak_rss_mb']} MB, "
+              f"Wörter {record['word_accuracy']}%, Zeichen {record['char_accuracy']}%", file=sys.stderr)
+        records.append(record)
+    return records
+
+def read_results(results_path):
+    with open(results_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(records, threshold=DEFAULT_THRESHOLD):
+    """Compares the last two runs of every configuration on the same corpus. Returns the regressions."""
+    runs = {}
+    for record in records:
+        runs.setdefault((record["config"]["name"], record["corpus"]), []).append(record)
+    regressions = []
+    for (name, _), history in runs.items():
+        if len(history) < 2:
+            continue
+        before, after = history[-2], history[-1]
+        checks = [
+            ("pages_per_sec", before["pages_per_sec"], after["pages_per_sec"], -1),
+            ("peak_rss_mb", before["peak_rss_mb"], after["peak_rss_mb"], 1),
+            ("word_accuracy", before["word_accuracy"], after["word_accuracy"], -1),
+        ]
+        for metric, old, new, worse in checks:
+            if not old or new is None:
+                continue
+            change = 100.0 * (new - old) / old
+            if change * worse > threshold:
+                regressions.append(dict(config=name, metric=metric, before=old, after=new, change=round(change, 1),
+                                        versions=(before["version"], after["version"])))
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="batchOCR-Benchmark mit synthetischen Scans")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_DIR, help="Ordner des Testkorpus")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Startwert für Text und Rauschen")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="Ergebnisdatei (JSON Lines)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("generate", help="Testkorpus erzeugen")
+    run = commands.add_parser("run", help="Korpus mit allen Kombinationen verarbeiten")
+    run.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1], help="Prozesse im Pool")
+    run.add_argument("--jobs", type=int, nargs="+", default=[1], help="ocrmypdf-Jobs pro Datei")
+    run.add_argument("--variant", nargs="+", choices=sorted(VARIANTS), default=sorted(VARIANTS),
+                     help="Einstellungsvarianten")
+    diff = commands.add_parser("compare", help="Letzte Läufe jeder Kombination vergleichen")
+    diff.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="Abweichung in Prozent, ab der eine Verschlechterung gemeldet wird")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "generate":
+        manifest = generate_corpus(args.corpus, args.seed)
+        print(f"{len(manifest['documents'])} Dokumente in {args.corpus} (Korpus {manifest['id']})")
+        return 0
+    if args.command == "run":
+        run_benchmark(build_matrix(args.workers, args.jobs, args.variant), args.corpus, args.results, args.seed)
+        return 0
+    regressions = compare(read_results(args.results), args.threshold)
+    for r in regressions:
+        print(f"❌ {r['config']}: {r['metric']} {r['before']} -> {r['after']} ({r['change']:+}%), "
+              f"{r['versions'][0]} -> {r['versions'][1]}")
+    if not regressions:
+        print("Keine Verschlechterung gefunden")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import hashlib
+
+from ocr_cache import file_sha256
+from fileio import reflink, copy_file
+
+# Bytes read from the start and from the end of a file for the partial hash
+PARTIAL_BYTES = 64 * 1024
+
+def partial_hash(path, size):
+    # Scans of different documents differ early; files that only differ in between still meet the full hash
+    digest = hashlib.sha256(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        digest.update(f.read(PARTIAL_BYTES))
+        if size > 2 * PARTIAL_BYTES:
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_BYTES))
+    return digest.hexdigest()
+
+class _Original:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._partial = None
+        self._full = None
+
+    def partial(self):
+        if self._partial is None:
+            self._partial = partial_hash(self.path, self.size)
+        return self._partial
+
+    def full(self, full_hash):
+        if self._full is None:
+            self._full = full_hash(self.path)
+        return self._full
+
+class DuplicateIndex:
+    """Finds inputs whose content was already seen in this batch. Files are compared by
+    size first; only files of equal size get a partial hash, and only equal partial hashes
+    a full hash, so a folder of distinct scans is barely read. full_hash can be the cache's
+    file_digest, which remembers the hashes it computed; as the cache hashes every file
+    anyway, eager then hashes at once, before an in-place output can replace the original.
+
+    Keeps one entry per distinct file; add() is called from a single thread."""
+
+    def __init__(self, full_hash=file_sha256, eager=False):
+        self.full_hash = full_hash
+        self.eager = eager
+        self._sizes = {}  # size -> originals of that size
+
+    def add(self, path):
+        """Registers a file. Returns the path of an earlier file with the same content, or None."""
+        size = os.path.getsize(path)
+        candidate = _Original(path, size)
+        if self.eager:
+            candidate.full(self.full_hash)
+        originals = self._sizes.setdefault(size, [])
+        for original in originals:
+            if original.partial() == candidate.partial() and original.full(self.full_hash) == candidate.full(self.full_hash):
+                return original.path
+        originals.append(candidate)
+        return None
+
+    def discard(self, path):
+        """Forgets an original, e.g. one whose output is gone."""
+        for size, originals in list(self._sizes.items()):
+            originals[:] = [original for original in originals if original.path != path]
+            if not originals:
+                del self._sizes[size]
+
+def link_output(source, target):
+    """Places the content of source at target as a reflink, else a hardlink, else a copy,
+    and returns which one it became. Outputs are always replaced and never written in
+    place, so a hardlinked output cannot change together with its original."""
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    if reflink(source, tmp_path):
+        method = "reflink"
+    else:
+        try:
+            os.link(source, tmp_path)
+            method = "hardlink"
+        except OSError:
+            # Other filesystem, or links not supported
+            method = copy_file(source, tmp_path)
+    os.replace(tmp_path, target)
+    return method
@@ -0,0 +1,591 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import shutil
+import socket
+import tempfile
+import ipaddress
+import threading
+import multiprocessing
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from filemanager import FileManager
+from loghandler import LogHandler, LOG_FORMAT_TEXT, LOG_DIR_NAME
+from ocr_processor import OCRProcessor, is_in_place, ensure_output_dir, copy_atomic
+from profiles import OcrProfile, resolve_profile, DEFAULT_PROFILE
+from triage import triage_pdf, MODE_SKIP
+from metrics import summarize
+from pdfprobe import page_count
+from task_guard import (TaskGuard, RetryPolicy, DEFAULT_MAX_ATTEMPTS, DEFAULT_TIMEOUT_BASE,
+                        DEFAULT_TIMEOUT_PER_PAGE)
+
+DEFAULT_PORT = 8765
+# Only this machine can reach the coordinator unless another address is given together with a token
+DEFAULT_HOST = "127.0.0.1"
+# A lease expires unless the worker's heartbeat renews it within this time
+DEFAULT_LEASE_TIME = 60.0
+HEARTBEAT_INTERVAL = 10.0
+# Pause of an idle worker before it asks for work again
+POLL_INTERVAL = 2.0
+REQUEST_TIMEOUT = 60.0
+COPY_CHUNK = 1024 * 1024
+TOKEN_HEADER = "X-Batchocr-Token"
+RESULT_HEADER = "X-Batchocr-Result"
+
+class RemoteJob:
+    def __init__(self, input_path, output_path, source_folder, attempt=1, fallback=False):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.source_folder = source_folder
+        self.attempt = attempt
+        self.fallback = fallback  # cheaper OCR settings, used for retries
+
+    def retry(self):
+        return RemoteJob(self.input_path, self.output_path, self.source_folder, self.attempt + 1, fallback=True)
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        # A host name or "" (all addresses)
+        return False
+
+class _Lease:
+    def __init__(self, job, worker, expires):
+        self.job = job
+        self.worker = worker
+        self.expires = expires
+
+class Coordinator:
+    """Hands the files of a batch to remote workers over HTTP.
+
+    Workers lease one file at a time (POST /lease), download it (GET /jobs/<id>/input),
+    renew their leases with heartbeats (POST /heartbeat) and upload the OCRed file
+    (POST /jobs/<id>/result). A lease that is not renewed, because the worker died or
+    lost the network, expires and the file is handed out again. Every lease also carries
+    a timeout by page count; the worker kills a job that exceeds it and reports the
+    failure, so the file is retried or failed at once. Only the coordinator
+    touches the source and target folders; the events match those of BatchRunner.
+    Every lease carries the OCR profile of the file's folder, so all workers use the same settings.
+    Anyone who reaches the server can read the sources and overwrite outputs, so listening
+    on anything but a loopback address requires a token."""
+
+    def __init__(self, source_folders, target_folder, include_subfolders=True, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 token=None, min_dpi=None, lease_time=DEFAULT_LEASE_TIME, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 logfile_enabled=True, log_format=LOG_FORMAT_TEXT, on_event=None, profile=DEFAULT_PROFILE,
+                 folder_profiles=None, timeout_base=DEFAULT_TIMEOUT_BASE, timeout_per_page=DEFAULT_TIMEOUT_PER_PAGE):
+        self.source_folders = list(source_folders)
+        self.target_folder = target_folder  # None when "Zielordner = Quellordner" is active
+        self.include_subfolders = include_subfolders
+        if not token and not is_loopback(host):
+            raise ValueError(f"Coordinator on {host or 'all addresses'} needs a token for its workers")
+        self.host = host
+        self.port = port
+        self.token = token
+        self.min_dpi = min_dpi  # None: the resolution of the profile
+        self.profile = resolve_profile(profile)
+        self.folder_profiles = {folder: resolve_profile(name) for folder, name in (folder_profiles or {}).items()}
+        self.lease_time = lease_time
+        self.max_attempts = max(1, max_attempts)
+        self.timeouts = RetryPolicy(timeout_base=timeout_base, timeout_per_page=timeout_per_page)
+        self.logfile_enabled = logfile_enabled
+        self.log_format = log_format
+        self.on_event = on_event
+
+        self.total_files = 0
+        self.processed_files = 0
+        self.skipped_files = 0
+        self.failed_files = 0
+        self.retried_files = 0
+        self.workers = set()
+        self.start_time = None
+        self.processing = False
+        self.discovering = False
+        self.log_handler = None
+        self.server = None
+        self.metrics = []
+        self._pending = deque()
+        self._leases = {}  # lease id -> _Lease
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    @property
+    def url(self):
+        host = "127.0.0.1" if self.host in ("", "0.0.0.0") else self.host
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        self.start_time = time.time()
+        self.processing = True
+        self.discovering = True
+        self._finished.clear()
+        if self.target_folder is None:
+            log_dir = os.path.join(self.source_folders[0], LOG_DIR_NAME)
+        else:
+            os.makedirs(self.target_folder, exist_ok=True)
+            log_dir = os.path.join(self.target_folder, LOG_DIR_NAME)
+        self.log_handler = LogHandler(log_dir, self.logfile_enabled, self.log_format)
+        self.log_handler.start()
+
+        self.server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.server.daemon_threads = True
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._discover, daemon=True).start()
+        threading.Thread(target=self._expire_leases, daemon=True).start()
+        print(f"🛰️ Coordinator listening on {self.url}")
+        self.emit("start")
+
+    def _discover(self):
+        fm = FileManager(self.source_folders, self.target_folder, self.include_subfolders)
+        for item in fm.iter_pdf_files():
+            if not self.processing:
+                return
+            with self._lock:
+                self._pending.append(RemoteJob(*item))
+                self.total_files += 1
+            self.emit("discovered", total=self.total_files)
+        self.discovering = False
+        self.emit("discovery_done", total=self.total_files)
+        self._check_finished()
+
+    def lease(self, worker):
+        """Returns the next file for a worker as a dict, or None if there is nothing to do."""
+        with self._lock:
+            self.workers.add(worker)
+            if not self.processing or not self._pending:
+                return None
+            job = self._pending.popleft()
+            lease_id = uuid.uuid4().hex
+            self._leases[lease_id] = _Lease(job, worker, time.monotonic() + self.lease_time)
+        print(f"📤 {os.path.relpath(job.input_path, job.source_folder)} -> {worker}")
+        profile = self.folder_profiles.get(job.source_folder, self.profile)
+        return dict(lease=lease_id, name=os.path.basename(job.input_path), min_dpi=self.min_dpi,
+                    profile=profile.to_dict(), timeout=self.timeouts.timeout(page_count(job.input_path)),
+                    fallback=job.fallback, attempt=job.attempt, lease_time=self.lease_time)
+
+    def heartbeat(self, worker, lease_ids):
+        """Renews the leases of a worker; returns those it no longer holds."""
+        expires = time.monotonic() + self.lease_time
+        lost = []
+        with self._lock:
+            self.workers.add(worker)
+            for lease_id in lease_ids:
+                lease = self._leases.get(lease_id)
+                if lease is None or lease.worker != worker:
+                    lost.append(lease_id)
+                else:
+                    lease.expires = expires
+        return lost
+
+    def input_path(self, lease_id):
+        with self._lock:
+            lease = self._leases.get(lease_id)
+            return lease.job.input_path if lease else None
+
+    def complete(self, lease_id, result, body, length):
+        """Places the uploaded output of a lease. Returns False if the lease had expired."""
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+        if lease is None:
+            # Handed out again in the meantime; that run delivers the file
+            _drain(body, length)
+            return False
+        job = lease.job
+        result.update(input_path=job.input_path, worker=lease.worker)
+        try:
+            self._place(job, result, body, length)
+        except OSError as e:
+            print(f"❌ Could not write {job.output_path}: {e}")
+            result.update(status="error", error=str(e))
+        if result.get("status") == "error" and self._retry(job, result.get("error")):
+            return True
+        self._completed(result)
+        return True
+
+    def _place(self, job, result, body, length):
+        status = result.get("status")
+        if status == "done":
+            ensure_output_dir(job.output_path)
+            tmp_path = f"{job.output_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                _copy(body, f, length)
+            final_path = job.input_path if is_in_place(job.input_path, job.output_path) else job.output_path
+            os.replace(tmp_path, final_path)
+            result["output_path"] = final_path
+            print(f"✅ Finished by {result['worker']}: {os.path.relpath(job.input_path, job.source_folder)}")
+            return
+        _drain(body, length)
+        if status == "skipped":
+            with self._lock:
+                self.skipped_files += 1
+            # Left as it is; in target folder mode it is copied over
+            if not is_in_place(job.input_path, job.output_path) and not os.path.exists(job.output_path):
+                ensure_output_dir(job.output_path)
+                copy_atomic(job.input_path, job.output_path)
+
+    def _retry(self, job, error):
+        if not self.processing or job.attempt >= self.max_attempts:
+            return False
+        print(f"🔁 Retrying {job.input_path} with fallback settings (attempt {job.attempt + 1}/{self.max_attempts}): {error}")
+        with self._lock:
+            self.retried_files += 1
+            self._pending.appendleft(job.retry())
+        return True
+
+    def _expire_leases(self):
+        while self.processing:
+            now = time.monotonic()
+            with self._lock:
+                expired = [(lease_id, lease) for lease_id, lease in self._leases.items() if lease.expires < now]
+                for lease_id, _ in expired:
+                    del self._leases[lease_id]
+            for _, lease in expired:
+                print(f"⌛ Lease of {lease.job.input_path} expired, {lease.worker} seems lost")
+                error = f"Worker {lease.worker} lost"
+                if not self._retry(lease.job, error):
+                    self._completed(dict(input_path=lease.job.input_path, status="error", error=error))
+            time.sleep(1.0)
+
+    def _completed(self, result):
+        with self._lock:
+            self.processed_files += 1
+            if result.get("status") == "error":
+                self.failed_files += 1
+            if "wall" in result:
+                self.metrics.append(result)
+        source_folder = next((folder for folder in self.source_folders
+                              if os.path.commonpath([folder, result["input_path"]]) == folder), self.source_folders[0])
+        status = result.get("status")
+        if self.log_format == LOG_FORMAT_TEXT:
+            if status == "done":
+                self.log_handler.write_log(result["input_path"], source_folder, result.get("details"), status=status)
+        else:
+            self.log_handler.write_log(result["input_path"], source_folder, result.get("details"), status=status,
+                                       duration=result.get("wall"), pages=result.get("pages"), dpi=result.get("dpi"),
+                                       language=result.get("language"), error=result.get("error"),
+                                       worker=result.get("worker"))
+        self.emit("file", **result)
+        self._check_finished()
+
+    def _check_finished(self):
+        with self._lock:
+            if (self.processing and not self.discovering and not self._pending and not self._leases
+                    and self.processed_files >= self.total_files):
+                self.processing = False
+                self._finished.set()
+
+    def is_finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until every file has been processed; then shuts the server down."""
+        if not self._finished.wait(timeout):
+            return False
+        self._shutdown()
+        self.emit("done", **self.summary())
+        return True
+
+    def stop(self):
+        self.processing = False
+        self._shutdown()
+        self._finished.set()
+        self.emit("stopped", **self.summary())
+
+    def _shutdown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.log_handler:
+            self.log_handler.close()
+
+    def summary(self):
+        elapsed = time.time() - self.start_time if self.start_time else 0.0
+        with self._lock:
+            records = list(self.metrics)
+            workers = sorted(self.workers)
+        return dict(total=self.total_files, discovering=self.discovering, processed=self.processed_files, cached=0,
+                    skipped=self.skipped_files, failed=self.failed_files, resumed=0, retried=self.retried_files,
+                    quarantined=0, elapsed=round(elapsed, 1), pages={}, metrics=summarize(records, elapsed),
+                    memory={}, workers=workers)
+
+    def emit(self, event, **data):
+        if self.on_event:
+            self.on_event(dict(event=event, **data))
+
+def _copy(source, target, length):
+    while length > 0:
+        chunk = source.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise OSError("Upload ended early")
+        target.write(chunk)
+        length -= len(chunk)
+
+def _drain(source, length):
+    while length > 0:
+        chunk = source.read(min(COPY_CHUNK, length))
+        if not chunk:
+            return
+        length -= len(chunk)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Heartbeats and polls would flood the console
+        pass
+
+    def _authorized(self):
+        token = self.server.coordinator.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), token):
+            self.close_connection = True
+            self._reply(403)
+            return False
+        return True
+
+    def _reply(self, code, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _length(self):
+        return int(self.headers.get("Content-Length") or 0)
+
+    def _read_json(self):
+        return json.loads(self.rfile.read(self._length()) or b"{}")
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        coordinator = self.server.coordinator
+        parts = self.path.strip("/").split("/")
+        if parts == ["lease"]:
+            job = coordinator.lease(self._read_json().get("worker", self.client_address[0]))
+            self._reply(200, job) if job else self._reply(204)
+        elif parts == ["heartbeat"]:
+            data = self._read_json()
+            self._reply(200, dict(lost=coordinator.heartbeat(data.get("worker"), data.get("leases", []))))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            result = json.loads(self.headers.get(RESULT_HEADER) or "{}")
+            self._reply(200 if coordinator.complete(parts[1], result, self.rfile, self._length()) else 409)
+        else:
+            self.close_connection = True
+            self._reply(404)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        coordinator = self.server.coordinator
+        parts = self.path.strip("/").split("/")
+        if parts == ["status"]:
+            self._reply(200, coordinator.summary())
+            return
+        input_path = coordinator.input_path(parts[1]) if len(parts) == 3 and parts[0] == "jobs" else None
+        if input_path is None:
+            self._reply(404)
+            return
+        with open(input_path, "rb") as f:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, COPY_CHUNK)
+
+def _request(url, token, data=None, headers=None, method="POST"):
+    request = urllib.request.Request(url, data=data, method=method, headers=dict(headers or {}))
+    if token:
+        request.add_header(TOKEN_HEADER, token)
+    return urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT)
+
+def _post_json(url, token, payload):
+    with _request(url, token, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json"}) as response:
+        body = response.read()
+        return json.loads(body) if body else None
+
+def process_remote_job(url, token, job, jobs):
+    """Runs in a pool process of the worker: download, triage, OCR and upload one leased file."""
+    lease_id = job["lease"]
+    work_dir = tempfile.mkdtemp(prefix="batchocr_remote_")
+    try:
+        # Same name in different folders, so process_pdf does not take it for an in-place run
+        input_dir, output_dir = os.path.join(work_dir, "in"), os.path.join(work_dir, "out")
+        os.makedirs(input_dir)
+        input_path = os.path.join(input_dir, job["name"])
+        output_path = os.path.join(output_dir, job["name"])
+        with _request(f"{url}/jobs/{lease_id}/input", token, method="GET") as response, open(input_path, "wb") as f:
+            shutil.copyfileobj(response, f, COPY_CHUNK)
+
+        triage = triage_pdf(input_path)
+        if triage.error is None and triage.mode == MODE_SKIP:
+            print(f"⏭️ No OCR needed: {job['name']}")
+            result = dict(status="skipped", pages=triage.pages)
+        else:
+            processor = OCRProcessor(jobs > 1, input_dir, min_dpi=job["min_dpi"],
+                                     profile=OcrProfile.from_dict(job["profile"]))
+            languages = processor.detect_languages(input_path, triage) if triage.error is None else None
+            result = processor.process_pdf(input_path, output_path, jobs, triage.mode, triage.source_dpi,
+                                           triage.pages, job["fallback"], languages=languages)
+            if result["status"] == "done" and processor.profile.recompress:
+                # Right here rather than in a second pool: the upload then moves fewer bytes
+                result = processor.recompress_output(result)
+        # Paths are the coordinator's business
+        result.pop("input_path", None)
+        upload = result.pop("output_path", None) if result["status"] == "done" else None
+        headers = {RESULT_HEADER: json.dumps(result), "Content-Type": "application/pdf",
+                   "Content-Length": str(os.path.getsize(upload) if upload else 0)}
+        with open(upload or os.devnull, "rb") as body:
+            try:
+                _request(f"{url}/jobs/{lease_id}/result", token, body, headers).close()
+            except urllib.error.HTTPError as e:
+                if e.code != 409:
+                    raise
+                print(f"⌛ Lease of {job['name']} was lost, result discarded")
+        return result["status"]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+class RemoteWorker:
+    """Processes files of a coordinator on this machine: leases up to `slots` files at a
+    time and OCRs each in its own process with a share of the local cores. A heartbeat
+    keeps the leases alive for as long as the files are being worked on, but not past the
+    timeout of the lease: a job that runs longer gets its process killed by the TaskGuard.
+    Jobs that fail are reported, so the coordinator need not wait for the lease to expire."""
+
+    def __init__(self, url, token=None, slots=None, name=None, use_internal_parallelism=True, redirect_output=False,
+                 temp_dir=None):
+        cores = os.cpu_count() or 1
+        self.url = url.rstrip("/")
+        self.token = token
+        self.slots = max(1, slots or cores // 2)
+        self.jobs = max(1, cores // self.slots) if use_internal_parallelism else 1
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.redirect_output = redirect_output
+        self.temp_dir = temp_dir  # downloads and OCR work directories; None: the system's temporary directory
+        self.processed = 0
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self._reachable = True
+        self._active = {}  # lease id -> (file name, deadline or None)
+        self._free = threading.Semaphore(self.slots)
+        self._lock = threading.Lock()
+
+    def run(self, stop_event):
+        """Works until stop_event is set; files in progress are finished first."""
+        guard = TaskGuard()
+        pool = multiprocessing.Pool(self.slots, initializer=OCRProcessor.init_worker,
+                                    initargs=(self.redirect_output, *guard.initargs(), self.temp_dir))
+        guard.start(pool)
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop_event,), daemon=True)
+        heartbeat.start()
+        print(f"🛠️ Worker {self.name}: {self.slots} files at a time, {self.jobs} cores each, coordinator {self.url}")
+        try:
+            while not stop_event.is_set():
+                if not self._free.acquire(timeout=0.5):
+                    continue
+                job = self._lease()
+                if job is None:
+                    self._free.release()
+                    stop_event.wait(POLL_INTERVAL)
+                    continue
+                timeout = job.get("timeout")
+                with self._lock:
+                    self._active[job["lease"]] = (job["name"], time.monotonic() + timeout if timeout else None)
+                    # Several heartbeats per lease time, so a single lost one does not cost the lease
+                    self.heartbeat_interval = min(HEARTBEAT_INTERVAL, job["lease_time"] / 3)
+                guard.submit(process_remote_job, (self.url, self.token, job, self.jobs),
+                             callback=lambda status, job=job: self._done(job),
+                             error_callback=lambda error, job=job: self._done(job, error),
+                             timeout=timeout, name=job["name"])
+        finally:
+            pool.close()
+            # The guard keeps watching the files in progress until they are finished or killed
+            while True:
+                with self._lock:
+                    if not self._active:
+                        break
+                time.sleep(0.5)
+            guard.stop()
+            if guard.abandoned:
+                # Results of killed jobs never arrive, join() would wait for them forever
+                pool.terminate()
+            pool.join()
+
+    def _lease(self):
+        try:
+            job = _post_json(f"{self.url}/lease", self.token, dict(worker=self.name))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            if self._reachable:
+                print(f"❌ Coordinator {self.url} not reachable: {e}")
+            self._reachable = False
+            return None
+        if not self._reachable:
+            print(f"🔌 Coordinator {self.url} reachable again")
+        self._reachable = True
+        return job
+
+    def _done(self, job, error=None):
+        # Runs on the pool's result thread or the guard's thread
+        if error is not None:
+            print(f"❌ Error processing {job['name']}: {error}")
+            self._report_failure(job, error)
+        with self._lock:
+            self._active.pop(job["lease"], None)
+            self.processed += 1
+        self._free.release()
+
+    def _report_failure(self, job, error):
+        # Without a report the coordinator only notices when the lease expires
+        headers = {RESULT_HEADER: json.dumps(dict(status="error", error=str(error) or type(error).__name__)),
+                   "Content-Type": "application/pdf", "Content-Length": "0"}
+        try:
+            _request(f"{self.url}/jobs/{job['lease']}/result", self.token, b"", headers).close()
+        except urllib.error.HTTPError as e:
+            if e.code != 409:
+                print(f"❌ Could not report the failure of {job['name']}: {e}")
+        except (urllib.error.URLError, OSError) as e:
+            print(f"❌ Could not report the failure of {job['name']}: {e}")
+
+    def _heartbeat(self, stop_event):
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                # A job past its timeout is about to be killed; its lease is not renewed any more
+                leases = [lease_id for lease_id, (_, deadline) in self._active.items()
+                          if deadline is None or now < deadline]
+            if leases:
+                try:
+                    lost = _post_json(f"{self.url}/heartbeat", self.token, dict(worker=self.name, leases=leases))["lost"]
+                    for lease_id in lost:
+                        print(f"⌛ Lease of {self._active.get(lease_id, (lease_id,))[0]} was given to another worker")
+                except (urllib.error.URLError, OSError, ValueError) as e:
+                    print(f"❌ Heartbeat failed: {e}")
+            elif stop_event.is_set():
+                return
+            # Idle: look again soon, a new lease needs its first heartbeat within the lease time
+            time.sleep(self.heartbeat_interval if leases else 0.5)
+
+def run_worker(url, token=None, slots=None, name=None, use_internal_parallelism=True, stop_event=None):
+    # Entry point of the local workers started by the coordinator for testing
+    RemoteWorker(url, token, slots, name, use_internal_parallelism).run(stop_event or threading.Event())
+
+def start_local_workers(coordinator, count, slots=1):
+    """Starts `count` worker processes on this machine against the coordinator, e.g. to test the protocol.
+    Returns the processes and the event that stops them."""
+    stop_event = multiprocessing.Event()
+    processes = []
+    for index in range(count):
+        process = multiprocessing.Process(target=run_worker, args=(coordinator.url, coordinator.token, slots,
+                                                                    f"local-{index + 1}", True, stop_event))
+        process.start()
+        processes.append(process)
+    return processes, stop_event
@@ -0,0 +1,86 @@
+"""asyncio front end of the batch, for embedding batchOCR into services.
+
+    engine = BatchEngine(cache_enabled=False)
+    async for result in engine.run(["/scans/in"], "/scans/out", profile="archive"):
+        print(result["input_path"], result["status"])
+
+The work runs in the BatchRunner's worker pool as for the GUI and the CLI; the event
+loop only receives the results. Cancelling the consuming task, or leaving the loop,
+stops the batch."""
+import asyncio
+import threading
+
+from batch_runner import BatchRunner
+from profiles import DEFAULT_PROFILE
+
+# Results the consumer may fall behind by before the batch stops taking up new files
+DEFAULT_MAX_PENDING = 64
+FINAL_EVENTS = ("done", "stopped")
+
+class BatchEngine:
+    """Runs batches for an asyncio application. options are BatchRunner keyword arguments
+    shared by every run; run() takes further ones per batch.
+
+    run() yields the result of every file (the "file" events of the runner), or with
+    all_events=True every event, including progress and the final summary. When more
+    than max_pending results are waiting for the consumer, the runner is paused and
+    only the files already in flight are finished, so a slow consumer does not make
+    results pile up in memory."""
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, **options):
+        self.max_pending = max(1, max_pending)
+        self.options = options
+
+    async def run(self, source_folders, target_folder=None, profile=DEFAULT_PROFILE, all_events=False, **options):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        pending = 0  # file results in the queue
+
+        def deliver(event):
+            # Runs in the loop's thread
+            nonlocal pending
+            events.put_nowait(event)
+            if event["event"] == "file":
+                pending += 1
+                if pending >= self.max_pending and not runner.is_paused():
+                    runner.pause()
+
+        def on_event(event):
+            # Called from the runner's threads
+            try:
+                loop.call_soon_threadsafe(deliver, event)
+            except RuntimeError:
+                # The loop is closed; nobody is left to read the event
+                pass
+
+        runner = BatchRunner(source_folders, target_folder, profile=profile, on_event=on_event,
+                             **{**self.options, **options})
+        start = loop.run_in_executor(None, runner.start)
+        try:
+            started = await asyncio.shield(start)
+        except asyncio.CancelledError:
+            # The start goes on in its thread; whatever it started is stopped again
+            if await start:
+                await loop.run_in_executor(None, runner.stop)
+            raise
+        if not started:
+            return
+        # Blocks until the batch is done and then shuts the pool down; returns at once after a stop
+        waiter = threading.Thread(target=runner.wait, daemon=True)
+        waiter.start()
+        try:
+            while True:
+                event = await events.get()
+                if event["event"] == "file":
+                    pending -= 1
+                    if runner.is_paused() and pending <= self.max_pending // 2:
+                        runner.unpause()
+                if all_events or event["event"] == "file":
+                    yield event
+                if event["event"] in FINAL_EVENTS:
+                    return
+        finally:
+            if not runner.is_finished():
+                # Terminating the pool takes a moment, the loop keeps running meanwhile
+                await loop.run_in_executor(None, runner.stop)
+            await loop.run_in_executor(None, waiter.join)
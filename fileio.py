@@ -0,0 +1,74 @@
+import os
+import sys
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl that makes a file share the extents of another (Btrfs, XFS, bcachefs; Linux only)
+FICLONE = 0x40049409
+# Bytes per copy_file_range call; the kernel copies them without passing through user space
+COPY_CHUNK = 64 * 1024 ** 2
+IO_COUNTERS = "/proc/self/io"
+THREAD_IO_COUNTERS = "/proc/thread-self/io"
+
+def reflink(source, target):
+    """Copy-on-write clone of source at target. Returns False where the filesystem cannot clone."""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        return False
+
+def _copy_file_range(source, target):
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while os.copy_file_range(src.fileno(), dst.fileno(), COPY_CHUNK):
+            pass
+
+def copy_file(source, target):
+    """Copies source to target without moving the data through this process: a reflink
+    where the filesystem clones (no data written at all), else copy_file_range, which
+    XFS/Btrfs may still turn into a clone and NFS 4.2/SMB into a server-side copy, else
+    shutil.copyfile. Returns which one it became."""
+    if reflink(source, target):
+        return "reflink"
+    if hasattr(os, "copy_file_range"):
+        try:
+            _copy_file_range(source, target)
+            return "copy_file_range"
+        except OSError:
+            # Older kernels refuse copies across filesystems, some filesystems refuse it at all
+            pass
+    shutil.copyfile(source, target)
+    return "copy"
+
+def use_temp_dir(temp_dir):
+    """Worker initializer part: puts the temporary files of this process and of the programs
+    it starts (ocrmypdf work directories, Ghostscript, Tesseract) into temp_dir, e.g. /dev/shm
+    or an SSD, so the intermediate images and PDFs of the OCR never reach the output disk."""
+    if not temp_dir:
+        return
+    os.makedirs(temp_dir, exist_ok=True)
+    tempfile.tempdir = temp_dir
+    os.environ["TMPDIR"] = temp_dir
+
+def disk_writes(this_thread=False):
+    """Bytes this process and its finished children had written to storage so far, or only
+    the calling thread; None where the kernel does not tell (not Linux). Writes to tmpfs
+    are not counted, nor data written and deleted again before it reached the disk."""
+    try:
+        with open(THREAD_IO_COUNTERS if this_thread else IO_COUNTERS, "r", encoding="ascii") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["write_bytes"]) - int(counters["cancelled_write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
@@ -1,3 +1,6 @@
+import os
+from collections import deque
+
 class FileManager:
     def __init__(self, source_folders, target_folder, include_subfolders=True):
         self.source_folders = source_folders
@@ -5,47 +8,54 @@ class FileManager:
         self.include_subfolders = include_subfolders
 
     def get_pdf_files(self):
-        pdf_files = []
-        for source_folder in self.source_folders:
-            if not os.path.isdir(source_folder):
+        return list(self.iter_pdf_files())
+
+    def iter_pdf_files(self, interleave=False):
+        # Yields the files while the folders are still being walked, so processing can start right away.
+        # Output directories are not created here but right before a file is written.
+        if not interleave:
+            for source_folder in self.source_folders:
+                yield from self.iter_folder(source_folder)
+            return
+        # One file of every folder in turn, so a huge first folder does not hold back the others
+        walks = deque(self.iter_folder(source_folder) for source_folder in self.source_folders)
+        while walks:
+            walk = walks.popleft()
+            job = next(walk, None)
+            if job is not None:
+                yield job
+                walks.append(walk)
+
+    def iter_folder(self, source_folder):
+        if not os.path.isdir(source_folder):
+            return
+        pending = [source_folder]
+        while pending:
+            root = pending.pop()
+            subfolders = []
+            try:
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+                        elif entry.name.lower().endswith(".pdf") and entry.is_file():
+                            yield self.get_job(entry.path, root, source_folder)
+            except OSError:
+                # Unreadable folders are skipped like os.walk does
                 continue
             if self.include_subfolders:
-                for root, _, files in os.walk(source_folder):
-                    for file in files:
-                        if file.lower().endswith(".pdf"):
-                            input_path = os.path.join(root, file)
-                            rel = os.path.relpath(root, source_folder)
-                            base_folder = os.path.basename(source_folder)
-                            
-                            if self.target_folder is None:
-                                # If target folder is same as source folder, we need to create a temporary output path
-                                # We'll use a temporary filename by adding "_ocr" before the extension
-                                file_name, file_ext = os.path.splitext(file)
-                                temp_file = f"{file_name}_ocr{file_ext}"
-                                output_dir = root
-                                output_path = os.path.join(output_dir, temp_file)
-                            else:
-                                output_dir = os.path.join(self.target_folder, base_folder, rel)
-                                os.makedirs(output_dir, exist_ok=True)
-                                output_path = os.path.join(output_dir, file)
-                            
-                            pdf_files.append((input_path, output_path, source_folder))
-            else:
-                for file in os.listdir(source_folder):
-                    if file.lower().endswith(".pdf"):
-                        input_path = os.path.join(source_folder, file)
-                        base_folder = os.path.basename(source_folder)
-                        
-                        if self.target_folder is None:
-                            # If target folder is same as source folder, create a temporary filename
-                            file_name, file_ext = os.path.splitext(file)
-                            temp_file = f"{file_name}_ocr{file_ext}"
-                            output_dir = source_folder
-                            output_path = os.path.join(output_dir, temp_file)
-                        else:
-                            output_dir = os.path.join(self.target_folder, base_folder)
-                            os.makedirs(output_dir, exist_ok=True)
-                            output_path = os.path.join(output_dir, file)
-                            
-                        pdf_files.append((input_path, output_path, source_folder))
-        return pdf_files
\ No newline at end of file
+                # Reversed, so the stack walks the subfolders in directory order
+                pending.extend(sorted(subfolders, reverse=True))
+
+    def get_job(self, input_path, root, source_folder):
+        file = os.path.basename(input_path)
+        if self.target_folder is None:
+            # If target folder is same as source folder, we need to create a temporary output path
+            # We'll use a temporary filename by adding "_ocr" before the extension
+            file_name, file_ext = os.path.splitext(file)
+            output_path = os.path.join(root, f"{file_name}_ocr{file_ext}")
+        else:
+            base_folder = os.path.basename(source_folder)
+            rel = os.path.relpath(root, source_folder)
+            output_path = os.path.normpath(os.path.join(self.target_folder, base_folder, rel, file))
+        return (input_path, output_path, source_folder)
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+
+from filemanager import FileManager
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # inotify support is optional, polling works everywhere
+    Observer = None
+    FileSystemEventHandler = object
+
+# A file counts as completely written once size and mtime did not change for this long
+DEFAULT_SETTLE_TIME = 2.0
+# Rescan interval for network shares, where inotify does not see remote writes
+DEFAULT_POLL_INTERVAL = 5.0
+CHECK_INTERVAL = 0.5
+
+class _FolderEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher, source_folder):
+        super().__init__()
+        self.watcher = watcher
+        self.source_folder = source_folder
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        # Moves into the hot folder report the new name as dest_path
+        path = getattr(event, "dest_path", "") or event.src_path
+        if event.event_type in ("created", "modified", "moved", "closed"):
+            self.watcher.touch(path, self.source_folder)
+
+class HotFolderWatcher:
+    """Detects new or modified PDFs in the source folders and reports them once they are fully written.
+
+    Uses inotify (via watchdog) when available, otherwise or on request it rescans the
+    folders periodically. Files that already exist at start are left to the initial scan."""
+
+    def __init__(self, source_folders, include_subfolders, on_ready, settle_time=DEFAULT_SETTLE_TIME,
+                 poll_interval=DEFAULT_POLL_INTERVAL, use_polling=False):
+        self.source_folders = list(source_folders)
+        self.include_subfolders = include_subfolders
+        self.on_ready = on_ready
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling or Observer is None
+        self._candidates = {}  # path -> [source_folder, size, mtime_ns, stable_since]
+        self._snapshot = {}    # polling only: path -> (size, mtime_ns)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    def start(self):
+        if self.use_polling:
+            self._poll(initial=True)
+        else:
+            self._observer = Observer()
+            for folder in self.source_folders:
+                if os.path.isdir(folder):
+                    self._observer.schedule(_FolderEventHandler(self, folder), folder,
+                                            recursive=self.include_subfolders)
+            self._observer.start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def touch(self, path, source_folder):
+        if not path.lower().endswith(".pdf"):
+            return
+        if not self.include_subfolders and os.path.normpath(os.path.dirname(path)) != os.path.normpath(source_folder):
+            return
+        with self._lock:
+            self._candidates.setdefault(path, [source_folder, None, None, None])
+
+    def _run(self):
+        last_poll = time.monotonic()
+        while not self._stop.wait(CHECK_INTERVAL):
+            if self.use_polling and time.monotonic() - last_poll >= self.poll_interval:
+                self._poll()
+                last_poll = time.monotonic()
+            self._check_candidates()
+
+    def _poll(self, initial=False):
+        fm = FileManager(self.source_folders, None, self.include_subfolders)
+        snapshot = {}
+        for input_path, _, source_folder in fm.iter_pdf_files():
+            try:
+                st = os.stat(input_path)
+            except OSError:
+                continue
+            snapshot[input_path] = (st.st_size, st.st_mtime_ns)
+            if not initial and self._snapshot.get(input_path) != snapshot[input_path]:
+                self.touch(input_path, source_folder)
+        self._snapshot = snapshot
+
+    def _check_candidates(self):
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, candidate in list(self._candidates.items()):
+                source_folder, size, mtime_ns, stable_since = candidate
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Deleted or renamed before it settled (e.g. a temporary "_ocr" output)
+                    del self._candidates[path]
+                    continue
+                if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                    candidate[1:] = [st.st_size, st.st_mtime_ns, now]
+                elif st.st_size > 0 and now - stable_since >= self.settle_time and self._readable(path):
+                    del self._candidates[path]
+                    ready.append((path, source_folder))
+        for path, source_folder in ready:
+            self.on_ready(path, source_folder)
+
+    @staticmethod
+    def _readable(path):
+        # Windows scanners keep the file locked until they are done writing
+        try:
+            with open(path, "rb"):
+                return True
+        except OSError:
+            return False
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".batchocr", "journal.sqlite")
+# Finished batches kept for inspection; older ones are dropped when a new batch starts
+KEEP_BATCHES = 20
+# Discovered files are written in groups; losing them only costs a re-scan on resume
+QUEUED_BATCH_SIZE = 256
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+# Results that count as finished; everything else is dispatched again on resume
+FINISHED_STATES = ("done", "cached", "skipped", "failed", "duplicate")
+
+BATCH_RUNNING = "running"
+BATCH_STOPPED = "stopped"
+BATCH_FINISHED = "finished"
+
+def batch_key(source_folders, target_folder, include_subfolders, fingerprint):
+    """Identifies a batch across runs: same folders and same OCR settings."""
+    encoded = json.dumps([list(source_folders), target_folder, include_subfolders, fingerprint]).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+def file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime_ns
+
+class JobJournal:
+    """Durable per-file state of a batch (queued, running, done, failed) in SQLite WAL.
+
+    Only the main process writes to it, from the discovery, feeder and result threads;
+    a batch that was stopped or crashed can be resumed with only its unfinished files."""
+
+    def __init__(self, db_path=DEFAULT_JOURNAL_PATH):
+        self.db_path = db_path
+        self.batch_id = None
+        self.fingerprint = None
+        self.resumed = False
+        self.discovery_complete = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queued = []
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Survives a crash of the application; only a power loss may drop the last transactions
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY, key TEXT, status TEXT, discovery_done INTEGER,
+                    started REAL, updated REAL);
+                CREATE INDEX IF NOT EXISTS batches_key ON batches (key, status);
+                CREATE TABLE IF NOT EXISTS jobs (
+                    batch INTEGER, input_path TEXT, output_path TEXT, source_folder TEXT, state TEXT,
+                    fingerprint TEXT, size INTEGER, mtime_ns INTEGER, work_dir TEXT, error TEXT, updated REAL,
+                    PRIMARY KEY (batch, input_path));
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (batch, state);
+            """)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush()
+                self._conn.close()
+                self._conn = None
+
+    def open_batch(self, key, fingerprint, resume=False):
+        """Starts a new batch or, with resume, continues the last unfinished one with the same key.
+        Returns True if a batch was resumed."""
+        with self._lock:
+            db = self._db()
+            self.fingerprint = fingerprint
+            row = db.execute("SELECT id, discovery_done FROM batches WHERE key = ? AND status != ? "
+                             "ORDER BY id DESC LIMIT 1", (key, BATCH_FINISHED)).fetchone() if resume else None
+            now = time.time()
+            with db:
+                if row:
+                    self.batch_id, discovery_done = row
+                    db.execute("UPDATE batches SET status = ?, updated = ? WHERE id = ?",
+                               (BATCH_RUNNING, now, self.batch_id))
+                else:
+                    # An unfinished batch that is not resumed is given up
+                    db.execute("UPDATE batches SET status = ? WHERE key = ? AND status != ?",
+                               (BATCH_FINISHED, key, BATCH_FINISHED))
+                    discovery_done = 0
+                    self.batch_id = db.execute("INSERT INTO batches (key, status, discovery_done, started, updated) "
+                                               "VALUES (?, ?, 0, ?, ?)", (key, BATCH_RUNNING, now, now)).lastrowid
+                    self._prune(db)
+            self.resumed = row is not None
+            self.discovery_complete = bool(discovery_done)
+            return self.resumed
+
+    def has_unfinished(self, key):
+        with self._lock:
+            row = self._db().execute("SELECT 1 FROM batches WHERE key = ? AND status != ? LIMIT 1",
+                                     (key, BATCH_FINISHED)).fetchone()
+            return row is not None
+
+    def cleanup_interrupted(self):
+        """Removes what the interrupted run left behind of the files it was working on
+        (partial outputs, "_ocr" temporaries, split work directories) and queues them again."""
+        with self._lock:
+            db = self._db()
+            rows = db.execute("SELECT input_path, output_path, work_dir FROM jobs WHERE batch = ? AND state = ?",
+                              (self.batch_id, STATE_RUNNING)).fetchall()
+            for input_path, output_path, work_dir in rows:
+                # Never the input itself; in place the output is its "_ocr" sibling
+                if output_path != input_path and os.path.exists(output_path):
+                    os.remove(output_path)
+                if work_dir:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+            with db:
+                db.execute("UPDATE jobs SET state = ?, work_dir = NULL, updated = ? WHERE batch = ? AND state = ?",
+                           (STATE_QUEUED, time.time(), self.batch_id, STATE_RUNNING))
+            return len(rows)
+
+    def pending_jobs(self):
+        """Unfinished files of a resumed batch whose discovery had completed, in discovery order."""
+        with self._lock:
+            rows = self._db().execute("SELECT input_path, output_path, source_folder FROM jobs "
+                                      "WHERE batch = ? AND state = ? ORDER BY rowid",
+                                      (self.batch_id, STATE_QUEUED)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def finished_count(self):
+        with self._lock:
+            placeholders = ", ".join("?" * len(FINISHED_STATES))
+            return self._db().execute(f"SELECT COUNT(*) FROM jobs WHERE batch = ? AND state IN ({placeholders})",
+                                      (self.batch_id, *FINISHED_STATES)).fetchone()[0]
+
+    def is_finished(self, input_path):
+        """True if the file was completed by an earlier run of this batch and has not changed since."""
+        with self._lock:
+            row = self._db().execute("SELECT state, fingerprint, size, mtime_ns FROM jobs "
+                                     "WHERE batch = ? AND input_path = ?", (self.batch_id, input_path)).fetchone()
+        if row is None:
+            return False
+        state, fingerprint, size, mtime_ns = row
+        return state in FINISHED_STATES and fingerprint == self.fingerprint and file_state(input_path) == (size, mtime_ns)
+
+    def queued(self, input_path, output_path, source_folder):
+        with self._lock:
+            if self._conn is None:
+                return
+            size, mtime_ns = file_state(input_path)
+            self._queued.append((self.batch_id, input_path, output_path, source_folder, STATE_QUEUED,
+                                 self.fingerprint, size, mtime_ns, None, None, time.time()))
+            if len(self._queued) >= QUEUED_BATCH_SIZE:
+                self._flush()
+
+    def running(self, input_path, work_dir=None):
+        self._update(input_path, STATE_RUNNING, work_dir=work_dir)
+
+    def finished(self, input_path, state, error=None):
+        # Remembers the file as it is now, so an in-place result is recognized as unchanged
+        size, mtime_ns = file_state(input_path)
+        self._update(input_path, state, error=error, size=size, mtime_ns=mtime_ns)
+
+    def discovery_done(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._flush()
+            with self._conn:
+                self._conn.execute("UPDATE batches SET discovery_done = 1, updated = ? WHERE id = ?",
+                           (time.time(), self.batch_id))
+
+    def close_batch(self, status):
+        with self._lock:
+            if self.batch_id is None or self._conn is None:
+                return
+            self._flush()
+            with self._conn:
+                self._conn.execute("UPDATE batches SET status = ?, updated = ? WHERE id = ?",
+                                   (status, time.time(), self.batch_id))
+
+    def _update(self, input_path, state, **columns):
+        with self._lock:
+            if self._conn is None:
+                # A late result after close()
+                return
+            self._flush()
+            assignments = "".join(f", {column} = ?" for column in columns)
+            with self._conn:
+                self._conn.execute(f"UPDATE jobs SET state = ?, updated = ?{assignments} WHERE batch = ? AND input_path = ?",
+                           (state, time.time(), *columns.values(), self.batch_id, input_path))
+
+    def _flush(self):
+        # Caller holds the lock
+        if not self._queued:
+            return
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._queued)
+        self._queued = []
+
+    def _prune(self, db):
+        old = db.execute("SELECT id FROM batches WHERE status = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                         (BATCH_FINISHED, KEEP_BATCHES)).fetchall()
+        for (batch_id,) in old:
+            db.execute("DELETE FROM jobs WHERE batch = ?", (batch_id,))
+            db.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
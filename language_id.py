@@ -0,0 +1,106 @@
+import os
+import re
+import tempfile
+import subprocess
+
+import pikepdf
+
+try:
+    from pdfminer.high_level import extract_text
+except ImportError:  # pulled in by ocrmypdf, but not by every version
+    extract_text = None
+
+from triage import PAGE_DIGITAL, PAGE_OCR, PAGE_IMAGE
+
+# Frequent words that tell the languages apart; words shared by two of them are left out
+STOPWORDS = {
+    "deu": frozenset("""der die das und ist nicht mit sich des dem den ein eine einer eines einem auf für von zu
+        im bei auch wird werden wurde sind oder aber nach wie über noch nur wir ich zum zur vom durch gegen ohne bis
+        unter dass diese dieser dieses kann können haben hat sehr mehr ihre ihr unsere uns bitte sowie wenn""".split()),
+    "eng": frozenset("""the and of to is that for with on are this be by from at as have has not it its which was
+        were been would can could should their there they we you your our or but all any if into than then these
+        those please""".split()),
+    "fra": frozenset("""le les et est une du qui dans pour pas sur avec au aux ce cette sont ont être nous vous
+        leur mais où""".split()),
+    "spa": frozenset("""el los las y es del por para su sus como más pero está son esta""".split()),
+    "ita": frozenset("""il gli è di che non della delle dei nel nella sono alla""".split()),
+    "nld": frozenset("""het een van dat op te zijn niet met voor maar om ook bij naar dit deze wordt worden""".split()),
+}
+# Below this many stopwords the sample says nothing; the file keeps all languages of the profile
+MIN_HITS = 12
+# Share of the hits a language needs to be OCRed alone, and to stay in a reduced set
+MIN_SHARE = 0.85
+MIN_SECONDARY_SHARE = 0.15
+# Pages of an existing text layer that are read
+MAX_TEXT_PAGES = 3
+# A sample page costs about as much as OCRing a page, so files without text need at least this many pages
+MIN_SAMPLE_PAGES = 2
+# The sample is OCRed at this resolution; enough for the frequent short words
+SAMPLE_DPI = 150
+SAMPLE_TIMEOUT = 60
+WORD = re.compile(r"[^\W\d_]+")
+
+class LanguageGuess:
+    def __init__(self, languages, confidence, source):
+        self.languages = languages
+        self.confidence = confidence
+        self.source = source  # "text" or "sample"
+
+def score_text(text, candidates, source="text"):
+    """Languages of a text out of candidates; None if it has too few stopwords to tell."""
+    hits = dict.fromkeys(candidates, 0)
+    for word in WORD.findall(text.lower()):
+        for language in candidates:
+            if word in STOPWORDS[language]:
+                hits[language] += 1
+    total = sum(hits.values())
+    if total < MIN_HITS:
+        return None
+    best = max(candidates, key=hits.get)
+    confidence = hits[best] / total
+    if confidence >= MIN_SHARE:
+        return LanguageGuess([best], confidence, source)
+    # Mixed documents keep every language with a real share, in the order of the profile
+    return LanguageGuess([language for language in candidates if hits[language] / total >= MIN_SECONDARY_SHARE],
+                         confidence, source)
+
+def text_sample(input_path, page_numbers):
+    if extract_text is None or not page_numbers:
+        return ""
+    return extract_text(input_path, page_numbers=page_numbers[:MAX_TEXT_PAGES])
+
+def image_sample(input_path, page_number, page_dpi, candidates):
+    """OCRs the largest image of one page at SAMPLE_DPI with all candidate languages."""
+    with pikepdf.open(input_path) as pdf:
+        images = [pikepdf.PdfImage(raw) for raw in pdf.pages[page_number].images.values()]
+        if not images:
+            return ""
+        image = max(images, key=lambda image: image.width * image.height).as_pil_image()
+    if page_dpi > SAMPLE_DPI:
+        scale = SAMPLE_DPI / page_dpi
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+    with tempfile.TemporaryDirectory(prefix="batchocr_lang_") as work_dir:
+        sample_path = os.path.join(work_dir, "sample.png")
+        image.convert("L").save(sample_path)
+        completed = subprocess.run(
+            ["tesseract", sample_path, "stdout", "-l", "+".join(candidates), "--dpi", str(min(page_dpi, SAMPLE_DPI))],
+            capture_output=True, text=True, timeout=SAMPLE_TIMEOUT)
+    return completed.stdout if completed.returncode == 0 else ""
+
+def detect_languages(input_path, triage, candidates):
+    """Cheap first pass before the OCR: the languages of a file out of candidates (the profile's),
+    read from its text layer or, failing that, from one scanned page OCRed at low resolution.
+    Returns None when there is nothing to choose or the sample is not conclusive."""
+    if len(candidates) < 2 or any(language not in STOPWORDS for language in candidates):
+        return None
+    text_pages = [number for number, page_class in enumerate(triage.page_classes) if page_class in (PAGE_DIGITAL, PAGE_OCR)]
+    guess = score_text(text_sample(input_path, text_pages), candidates)
+    if guess is not None:
+        return guess
+    image_pages = [number for number, page_class in enumerate(triage.page_classes) if page_class == PAGE_IMAGE]
+    if len(image_pages) < MIN_SAMPLE_PAGES:
+        return None
+    # The middle page rather than the first, which often is a cover sheet with little text
+    page_number = image_pages[len(image_pages) // 2]
+    text = image_sample(input_path, page_number, triage.page_dpi[page_number] or SAMPLE_DPI, candidates)
+    return score_text(text, candidates, source="sample")
@@ -0,0 +1,180 @@
+import os
+import re
+import sqlite3
+import threading
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+
+from logstore import LogStore
+
+# Zeilen, die pro Abfrage aus dem Index geholt werden, und wie viele solcher Blöcke im Speicher bleiben
+BLOCK_ROWS = 200
+CACHED_BLOCKS = 8
+WHEEL_ROWS = 3
+DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+class LogViewer(tk.Toplevel):
+    """Zeigt das Log aus dem Index des LogStore: die Tabelle enthält nur die sichtbaren Zeilen,
+    beim Scrollen werden die nächsten blockweise nachgeladen. Filter laufen als Abfrage
+    auf dem Index, nicht über die Logdateien."""
+
+    def __init__(self, master, log_dir):
+        super().__init__(master)
+        self.title("OCR Logfile")
+        self.geometry("1000x600")
+        self.store = LogStore(log_dir)
+        self.filters = {}
+        self.total = 0
+        self.offset = 0
+        self.visible = 20
+        self._blocks = OrderedDict()  # Blocknummer -> Zeilen
+        self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Fehlende Einträge (z.B. nach einem Absturz) werden im Hintergrund indiziert
+        self.status_label.config(text="Index wird aktualisiert …")
+        self._sync_error = None
+        self._sync_thread = threading.Thread(target=self._sync, daemon=True)
+        self._sync_thread.start()
+        self.after(100, self._wait_for_sync)
+
+    def create_widgets(self):
+        filter_frame = ttk.Frame(self)
+        filter_frame.pack(fill="x", padx=5, pady=5)
+        ttk.Label(filter_frame, text="Von").pack(side="left")
+        self.date_from = ttk.Entry(filter_frame, width=11)
+        self.date_from.pack(side="left", padx=(2, 8))
+        ttk.Label(filter_frame, text="Bis").pack(side="left")
+        self.date_to = ttk.Entry(filter_frame, width=11)
+        self.date_to.pack(side="left", padx=(2, 8))
+        ttk.Label(filter_frame, text="Ordner").pack(side="left")
+        self.folder = ttk.Combobox(filter_frame, width=30, state="readonly")
+        self.folder.pack(side="left", padx=(2, 8))
+        ttk.Label(filter_frame, text="Status").pack(side="left")
+        self.status = ttk.Combobox(filter_frame, width=9, state="readonly")
+        self.status.pack(side="left", padx=(2, 8))
+        ttk.Label(filter_frame, text="Datei").pack(side="left")
+        self.filename = ttk.Entry(filter_frame, width=20)
+        self.filename.pack(side="left", padx=(2, 8))
+        ttk.Button(filter_frame, text="🔍 Filtern", command=self.apply_filters).pack(side="left", padx=2)
+        ttk.Button(filter_frame, text="Zurücksetzen", command=self.reset_filters).pack(side="left", padx=2)
+        for entry in (self.date_from, self.date_to, self.filename):
+            entry.bind("<Return>", lambda event: self.apply_filters())
+
+        table_frame = ttk.Frame(self)
+        table_frame.pack(fill="both", expand=True)
+        columns = ("datum", "uhrzeit", "status", "dateipfad", "dateiname", "details")
+        self.tree = ttk.Treeview(table_frame, columns=columns, show="headings", selectmode="browse")
+        for column, text, width in (("datum", "Datum", 90), ("uhrzeit", "Uhrzeit", 70), ("status", "Status", 70),
+                                    ("dateipfad", "Dateipfad", 350), ("dateiname", "Dateiname", 150),
+                                    ("details", "Details", 250)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, anchor="w", width=width)
+        self.tree.pack(side="left", fill="both", expand=True)
+        # Die Scrollbar steht für das ganze Log, nicht für die paar Zeilen in der Tabelle
+        self.scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.bind("<Configure>", lambda event: self.after_idle(self.on_resize))
+        self.tree.bind("<MouseWheel>", self.on_wheel)
+        self.tree.bind("<Button-4>", self.on_wheel)
+        self.tree.bind("<Button-5>", self.on_wheel)
+        self.tree.bind("<Prior>", lambda event: self.scroll_to(self.offset - self.visible))
+        self.tree.bind("<Next>", lambda event: self.scroll_to(self.offset + self.visible))
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0))
+        self.tree.bind("<End>", lambda event: self.scroll_to(self.total))
+
+        self.status_label = ttk.Label(self, text="")
+        self.status_label.pack(fill="x", padx=5, pady=2)
+
+    def _sync(self):
+        try:
+            self.store.sync()
+        except (OSError, sqlite3.Error) as e:
+            self._sync_error = e
+
+    def _wait_for_sync(self):
+        if self._sync_thread.is_alive():
+            self.after(100, self._wait_for_sync)
+            return
+        if self._sync_error is not None:
+            self.status_label.config(text=f"Index konnte nicht aktualisiert werden: {self._sync_error}")
+        self.folder["values"] = ["", *self.store.folders()]
+        self.status["values"] = ["", *self.store.statuses()]
+        self.apply_filters()
+
+    def reset_filters(self):
+        for entry in (self.date_from, self.date_to, self.filename):
+            entry.delete(0, tk.END)
+        self.folder.set("")
+        self.status.set("")
+        self.apply_filters()
+
+    def apply_filters(self):
+        date_from, date_to = self.date_from.get().strip(), self.date_to.get().strip()
+        for date in (date_from, date_to):
+            if date and not DATE.match(date):
+                self.status_label.config(text=f"Ungültiges Datum {date!r}, erwartet JJJJ-MM-TT")
+                return
+        self.filters = dict(date_from=date_from or None, date_to=date_to or None, folder=self.folder.get() or None,
+                            status=self.status.get() or None, filename=self.filename.get().strip() or None)
+        self._blocks.clear()
+        self.total = self.store.count(**self.filters)
+        self.status_label.config(text=f"{self.total} Einträge, neueste zuerst")
+        self.scroll_to(0)
+
+    def on_resize(self):
+        # Zeilenhöhe und Kopfzeile aus der ersten angezeigten Zeile, solange keine da ist geschätzt
+        children = self.tree.get_children()
+        bbox = self.tree.bbox(children[0]) if children else None
+        header, row_height = (bbox[1], bbox[3]) if bbox else (25, 20)
+        visible = max(1, (self.tree.winfo_height() - header) // max(1, row_height))
+        if visible != self.visible:
+            self.visible = visible
+            self.scroll_to(self.offset)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif action == "scroll":
+            self.scroll_to(self.offset + int(amount) * (self.visible if unit == "pages" else 1))
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.scroll_to(self.offset + (-WHEEL_ROWS if up else WHEEL_ROWS))
+        return "break"
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, self.total - self.visible))
+        self.tree.delete(*self.tree.get_children())
+        for timestamp, folder, path, status, details in self.rows(self.offset, self.visible):
+            datum, _, uhrzeit = timestamp.partition(" ")
+            self.tree.insert("", tk.END, values=(datum, uhrzeit, status or "", path, os.path.basename(path), details or ""))
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1.0, (self.offset + self.visible) / self.total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def rows(self, offset, count):
+        rows = []
+        index = offset // BLOCK_ROWS
+        while len(rows) < count and index * BLOCK_ROWS < self.total:
+            block = self.block(index)
+            start = max(0, offset - index * BLOCK_ROWS)
+            rows.extend(block[start:start + count - len(rows)])
+            index += 1
+        return rows
+
+    def block(self, index):
+        if index in self._blocks:
+            self._blocks.move_to_end(index)
+            return self._blocks[index]
+        block = self.store.rows(index * BLOCK_ROWS, BLOCK_ROWS, **self.filters)
+        self._blocks[index] = block
+        if len(self._blocks) > CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return block
+
+    def close(self):
+        self.store.close()
+        self.destroy()
@@ -1,25 +1,82 @@
 import os
 import time
+import queue
+import sqlite3
+import threading
+
+from logstore import LogStore, LOG_FORMAT_TEXT, SHARD_EXTENSIONS
+# Directory of the log next to the outputs; earlier versions wrote ocr_log.txt or ocr_log.jsonl there
+LOG_DIR_NAME = "ocr_log"
+# Entries are written when this many are pending or the oldest is this old
+FLUSH_SIZE = 256
+FLUSH_INTERVAL = 1.0
 
 class LogHandler:
-    def __init__(self, log_file_path, enabled=True):
-        self.log_file_path = log_file_path
+    """Writes the batch log from a single thread of the main process.
+
+    write_log only queues the entry; the writer thread appends whole batches with one
+    open/write per flush. "text" is the classic "timestamp - path<TAB>details" format,
+    "json" writes one record per line with status, duration and page count.
+    The log is a LogStore directory (log_dir) with one file per day and an index;
+    an ocr_log.txt/.jsonl of earlier versions next to it is imported once."""
+
+    def __init__(self, log_dir, enabled=True, log_format=LOG_FORMAT_TEXT,
+                 flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.log_dir = log_dir
         self.enabled = enabled
-        self.lock = None
-    
-    def set_lock(self, lock):
-        self.lock = lock
+        self.log_format = log_format
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.store = LogStore(log_dir, log_format, legacy_path=log_dir + SHARD_EXTENSIONS[log_format])
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
 
-    def write_log(self, input_path, pdf_folder):
+    def close(self):
+        """Writes everything still queued and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.store.close()
+
+    def write_log(self, input_path, pdf_folder, details=None, **fields):
         if not self.enabled:
             return
-        relative_path = os.path.relpath(input_path, pdf_folder)
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"{timestamp} - {relative_path}\n"
-        if self.lock:
-            with self.lock:
-                with open(self.log_file_path, "a", encoding="utf-8") as logfile:
-                    logfile.write(log_entry)
+        entry = dict(timestamp=time.strftime("%Y-%m-%d %H:%M:%S"), path=os.path.relpath(input_path, pdf_folder),
+                     details=details, folder=pdf_folder, **fields)
+        if self._thread is None:
+            # Not started, e.g. used outside a batch: write through
+            self._write([entry])
         else:
-            with open(self.log_file_path, "a", encoding="utf-8") as logfile:
-                logfile.write(log_entry)
+            self._queue.put(entry)
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                entry = False
+            if entry:
+                pending.append(entry)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if pending and (entry is None or entry is False or len(pending) >= self.flush_size):
+                self._write(pending)
+                pending = []
+                deadline = None
+            if entry is None:
+                return
+
+    def _write(self, entries):
+        try:
+            self.store.append(entries)
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ Error writing log {self.log_dir}: {e}")
@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import sqlite3
+import itertools
+import threading
+
+LOG_FORMAT_TEXT = "text"
+LOG_FORMAT_JSON = "json"
+SHARD_EXTENSIONS = {LOG_FORMAT_TEXT: ".txt", LOG_FORMAT_JSON: ".jsonl"}
+# A day's shard is continued in a new part once it reaches this size
+MAX_SHARD_BYTES = 32 * 1024 ** 2
+INDEX_NAME = "index.sqlite"
+# "2024-05-01.txt", "2024-05-01.3.jsonl"
+SHARD_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?(\.txt|\.jsonl)$")
+# Entries are read in groups when indexing a shard or importing an old single-file log
+IMPORT_BATCH = 5000
+
+def format_entry(entry, log_format):
+    if log_format == LOG_FORMAT_JSON:
+        return json.dumps({key: value for key, value in entry.items() if value is not None}, ensure_ascii=False) + "\n"
+    # Details (e.g. the chosen DPI) are tab-separated so the path stays parseable
+    suffix = f"\t{entry['details']}" if entry.get("details") else ""
+    return f"{entry['timestamp']} - {entry['path']}{suffix}\n"
+
+def parse_line(line, log_format):
+    """Entry of one log line, None for lines that are not an entry."""
+    line = line.strip()
+    if not line:
+        return None
+    if log_format == LOG_FORMAT_JSON:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) and "timestamp" in entry and "path" in entry else None
+    timestamp, separator, rest = line.partition(" - ")
+    if not separator:
+        return None
+    path, _, details = rest.partition("\t")
+    # The text format has neither folder nor status
+    return dict(timestamp=timestamp, path=path, details=details or None)
+
+def format_for(path):
+    return LOG_FORMAT_JSON if path.endswith(".jsonl") else LOG_FORMAT_TEXT
+
+class LogStore:
+    """The batch log as one file per day, continued in numbered parts above max_shard_bytes,
+    plus a SQLite index of every entry (date, folder, status, file name), so the viewer
+    can count, filter and page through years of history without reading the files.
+
+    The files keep the classic text or JSON lines format and stay the record: sync()
+    indexes whatever the index is missing, e.g. after a crash or when it was deleted,
+    and imports an old single-file log (legacy_path) once; an interrupted import resumes
+    where it stopped. Text lines carry neither folder nor status, so entries indexed from
+    text shards (a rebuilt index, an imported text log) cannot be filtered by them; that
+    takes the JSON format.
+
+    The batch and the viewer index the same shards through their own instances, so the
+    indexed size of a shard only moves forward together with the entries it covers, in
+    one transaction and only from the size the indexer started at."""
+
+    def __init__(self, directory, log_format=LOG_FORMAT_TEXT, max_shard_bytes=MAX_SHARD_BYTES, legacy_path=None):
+        self.directory = directory
+        self.log_format = log_format
+        self.max_shard_bytes = max_shard_bytes
+        self.legacy_path = legacy_path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._synced = False
+        self._shard = None  # (day, part, size) of the shard written last
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, INDEX_NAME), timeout=30, check_same_thread=False)
+            # The viewer reads while a batch writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # Writes take the lock at BEGIN, so the check of a shard's indexed size holds until the commit
+            self._conn.isolation_level = "IMMEDIATE"
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY, timestamp TEXT, folder TEXT, path TEXT, filename TEXT, status TEXT,
+                    details TEXT, shard TEXT);
+                CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+                CREATE INDEX IF NOT EXISTS entries_folder ON entries (folder, timestamp);
+                CREATE INDEX IF NOT EXISTS entries_status ON entries (status, timestamp);
+                CREATE INDEX IF NOT EXISTS entries_filename ON entries (filename);
+                CREATE TABLE IF NOT EXISTS shards (name TEXT PRIMARY KEY, size INTEGER);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def append(self, entries):
+        """Writes entries (dicts with timestamp, path, details, folder, status, ...) and indexes them."""
+        with self._lock:
+            db = self._db()
+            if not self._synced:
+                self._sync(db)
+            self._write(db, entries)
+
+    def _write(self, db, entries, import_offset=None):
+        written = []
+        # Entries arrive in time order, so a flush spans a day boundary at most once
+        for day, group in itertools.groupby(entries, key=lambda entry: entry["timestamp"][:10]):
+            group = list(group)
+            data = "".join(format_entry(entry, self.log_format) for entry in group).encode("utf-8")
+            name = self._next_shard(day, len(data))
+            with open(os.path.join(self.directory, name), "ab") as shard:
+                shard.write(data)
+                size = shard.tell()
+            self._shard = (day, self._shard[1], size)
+            written.append((name, group, size - len(data), size))
+        with db:
+            # Skipped where the viewer indexed (some of) these lines in the meantime
+            stale = [name for name, group, start, size in written if not self._index(db, name, group, start, size)]
+            if import_offset is not None:
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('import_offset', ?)", (str(import_offset),))
+        for name in stale:
+            # Whatever the viewer left of them is indexed from the shard
+            row = db.execute("SELECT size FROM shards WHERE name = ?", (name,)).fetchone()
+            self._index_tail(db, name, row[0] if row else 0)
+
+    def _next_shard(self, day, size):
+        if self._shard is None or self._shard[0] != day:
+            # Continue the last part of the day, e.g. after a restart
+            parts = [int(match.group(2) or 0) for match in map(SHARD_NAME.match, self._shard_names())
+                     if match and match.group(1) == day and match.group(3) == SHARD_EXTENSIONS[self.log_format]]
+            part = max(parts, default=0)
+            self._shard = (day, part, self._size(self.shard_name(day, part)))
+        day, part, current = self._shard
+        if current and current + size > self.max_shard_bytes:
+            part += 1
+            self._shard = (day, part, 0)
+        return self.shard_name(day, part)
+
+    def shard_name(self, day, part=0):
+        return f"{day}{f'.{part}' if part else ''}{SHARD_EXTENSIONS[self.log_format]}"
+
+    def _shard_names(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory) if SHARD_NAME.match(name))
+        except OSError:
+            return []
+
+    def _size(self, name):
+        try:
+            return os.path.getsize(os.path.join(self.directory, name))
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _index(db, name, entries, start, size):
+        """Indexes the entries between start and size of a shard, unless the index is not at start
+        (another indexer got there first, or it is behind and sync() catches up). Call in a transaction."""
+        moved = db.execute("UPDATE shards SET size = ? WHERE name = ? AND size = ?", (size, name, start)).rowcount
+        if not moved and start == 0:
+            moved = db.execute("INSERT OR IGNORE INTO shards (name, size) VALUES (?, ?)", (name, size)).rowcount
+        if not moved:
+            return False
+        db.executemany(
+            "INSERT INTO entries (timestamp, folder, path, filename, status, details, shard) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(entry["timestamp"], entry.get("folder"), entry["path"], os.path.basename(entry["path"]),
+              entry.get("status"), entry.get("details") or entry.get("error"), name) for entry in entries])
+        return True
+
+    def sync(self):
+        """Indexes what the shards have beyond the index and imports the old single-file log."""
+        with self._lock:
+            self._sync(self._db())
+
+    def _sync(self, db):
+        indexed = dict(db.execute("SELECT name, size FROM shards"))
+        for name in self._shard_names():
+            if self._size(name) > indexed.get(name, 0):
+                self._index_tail(db, name, indexed.get(name, 0))
+        if self.legacy_path and os.path.isfile(self.legacy_path):
+            imported = db.execute("SELECT value FROM meta WHERE key = 'imported'").fetchone()
+            if imported is None:
+                self._import(db, self.legacy_path)
+        self._synced = True
+
+    def _index_tail(self, db, name, offset):
+        log_format = format_for(name)
+        with open(os.path.join(self.directory, name), "rb") as shard:
+            shard.seek(offset)
+            while True:
+                lines = shard.readlines(IMPORT_BATCH * 200)
+                # A line cut off by a crash is indexed once it is complete
+                if lines and not lines[-1].endswith(b"\n"):
+                    lines.pop()
+                if not lines:
+                    return
+                start, offset = offset, offset + sum(len(line) for line in lines)
+                entries = [entry for entry in (parse_line(line.decode("utf-8", "replace"), log_format) for line in lines)
+                           if entry is not None]
+                with db:
+                    if not self._index(db, name, entries, start, offset):
+                        # Another instance is indexing this shard
+                        return
+
+    def _import(self, db, path):
+        log_format = format_for(path)
+        row = db.execute("SELECT value FROM meta WHERE key = 'import_offset'").fetchone()
+        offset = int(row[0]) if row else 0
+        print(f"🗂️ Importing {path} into {self.directory}" + (f" from byte {offset}" if offset else ""))
+        with open(path, "rb") as legacy:
+            legacy.seek(offset)
+            while True:
+                lines = legacy.readlines(IMPORT_BATCH * 200)
+                if not lines:
+                    break
+                offset += sum(len(line) for line in lines)
+                # The offset is stored with the entries, so an interrupted import continues after them
+                self._write(db, [entry for entry in (parse_line(line.decode("utf-8", "replace"), log_format)
+                                                     for line in lines) if entry is not None], import_offset=offset)
+        with db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported', ?)", (path,))
+
+    @staticmethod
+    def _where(date_from=None, date_to=None, folder=None, status=None, filename=None):
+        clauses, params = [], []
+        if date_from:
+            clauses.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            # A date without a time includes the whole day
+            clauses.append("timestamp <= ?")
+            params.append(date_to + " 23:59:59" if len(date_to) == 10 else date_to)
+        if folder:
+            clauses.append("folder = ?")
+            params.append(folder)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if filename:
+            escaped = filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("filename LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._db().execute(f"SELECT COUNT(*) FROM entries{where}", params).fetchone()[0]
+
+    def rows(self, offset, limit, **filters):
+        """(timestamp, folder, path, status, details) of a page of entries, newest first."""
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._db().execute(
+                f"SELECT timestamp, folder, path, status, details FROM entries{where} "
+                f"ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?", [*params, limit, offset]).fetchall()
+
+    def folders(self):
+        with self._lock:
+            return [row[0] for row in self._db().execute(
+                "SELECT DISTINCT folder FROM entries WHERE folder IS NOT NULL ORDER BY folder")]
+
+    def statuses(self):
+        with self._lock:
+            return [row[0] for row in self._db().execute(
+                "SELECT DISTINCT status FROM entries WHERE status IS NOT NULL ORDER BY status")]
@@ -0,0 +1,214 @@
+import os
+import csv
+import json
+import time
+import threading
+
+import metrics_plugin
+from fileio import disk_writes
+
+STAGES = ("rasterize", "orientation", "deskew", "ocr", "pdfa", "optimize", "merge")
+CSV_FIELDS = ("timestamp", "input_path", "status", "pages", "wall", "cpu", "input_bytes", "output_bytes", "dpi") + \
+    tuple(f"stage_{stage}" for stage in STAGES) + ("language", "saved_bytes", "disk_write_bytes")
+
+def _cpu_seconds():
+    # Includes finished child processes, i.e. Tesseract, Ghostscript and the ocrmypdf page workers
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+class Measurement:
+    """Wall/CPU time, ocrmypdf stage times and disk writes of one file (or chunk) in a worker process."""
+
+    def __init__(self):
+        metrics_plugin.reset()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = _cpu_seconds()
+        self.writes_start = disk_writes()
+
+    def finish(self, input_path, output_path=None):
+        metrics = dict(
+            wall=round(time.perf_counter() - self.wall_start, 3),
+            cpu=round(_cpu_seconds() - self.cpu_start, 3),
+            stages=metrics_plugin.stage_times(),
+            input_bytes=_size(input_path),
+        )
+        if output_path:
+            metrics["output_bytes"] = _size(output_path)
+        metrics.update(self.disk_writes())
+        return metrics
+
+    def disk_writes(self):
+        # Includes finished children as well; empty where the platform does not count
+        writes = disk_writes()
+        if writes is None or self.writes_start is None:
+            return {}
+        return dict(disk_write_bytes=writes - self.writes_start)
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def combine(parts):
+    """Adds up the metrics of the chunks of a split file."""
+    total = dict(wall=0.0, cpu=0.0, stages={}, input_bytes=0)
+    for part in parts:
+        total["wall"] += part.get("wall", 0.0)
+        total["cpu"] += part.get("cpu", 0.0)
+        for stage, seconds in part.get("stages", {}).items():
+            total["stages"][stage] = round(total["stages"].get(stage, 0.0) + seconds, 3)
+        if "disk_write_bytes" in part:
+            total["disk_write_bytes"] = total.get("disk_write_bytes", 0) + part["disk_write_bytes"]
+    total["wall"] = round(total["wall"], 3)
+    total["cpu"] = round(total["cpu"], 3)
+    return total
+
+class MetricsWriter:
+    """Appends one record per finished file to a JSON lines or (by extension) CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if self.is_csv and not new_file:
+            _upgrade_csv(path)
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        if self.is_csv:
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, result):
+        record = dict(timestamp=time.strftime("%Y-%m-%d %H:%M:%S"), input_path=result.get("input_path"),
+                      status=result.get("status"))
+        for key in ("pages", "dpi", "language", "wall", "cpu", "input_bytes", "output_bytes", "saved_bytes",
+                    "disk_write_bytes", "stages", "error"):
+            if key in result:
+                record[key] = result[key]
+        with self._lock:
+            if self._file.closed:
+                # A late result after stop()
+                return
+            if self.is_csv:
+                row = dict(record)
+                for stage, seconds in record.get("stages", {}).items():
+                    row[f"stage_{stage}"] = seconds
+                self._csv.writerow(row)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def _csv_rows(f):
+    """Rows of a metrics CSV as dicts. Columns are only ever appended to CSV_FIELDS, so a row
+    with more fields than the header of its file was written by a newer version and is read
+    with as many of the current columns."""
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    for row in reader:
+        if len(row) > len(header) and tuple(header) == CSV_FIELDS[:len(header)]:
+            yield dict(zip(CSV_FIELDS, row))
+        else:
+            yield dict(zip(header, row))
+
+def _upgrade_csv(path):
+    # Rewrites a file with the header of an older version under the current columns,
+    # otherwise new rows would not line up with its header
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f), None)
+        if header is None or tuple(header) == CSV_FIELDS:
+            return
+        f.seek(0)
+        rows = list(_csv_rows(f))
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_path, path)
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in _csv_rows(f):
+                record = {key: value for key, value in row.items() if value not in ("", None)}
+                for key in ("pages", "input_bytes", "output_bytes", "saved_bytes", "disk_write_bytes", "dpi"):
+                    if key in record:
+                        record[key] = int(record[key])
+                for key in ("wall", "cpu"):
+                    if key in record:
+                        record[key] = float(record[key])
+                stages = {stage: float(record.pop(f"stage_{stage}")) for stage in STAGES if f"stage_{stage}" in record}
+                record["stages"] = stages
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+def summarize(records, elapsed=None, slowest=5):
+    """Throughput and latency figures over the records of OCRed files.
+    elapsed is the wall time of the batch; without it the sum of the file times is used."""
+    done = [r for r in records if r.get("status") == "done" and r.get("pages") and "wall" in r]
+    pages = sum(int(r["pages"]) for r in done)
+    wall = sum(float(r["wall"]) for r in done)
+    per_page = [float(r["wall"]) / int(r["pages"]) for r in done]
+    stages = {}
+    for r in done:
+        for stage, seconds in r.get("stages", {}).items():
+            stages[stage] = round(stages.get(stage, 0.0) + float(seconds), 2)
+    span = elapsed if elapsed else wall
+    # Only records of platforms that count disk writes, and of versions that recorded them
+    measured = [r for r in done if "disk_write_bytes" in r]
+    written = sum(int(r["disk_write_bytes"]) for r in measured)
+    measured_input = sum(int(r.get("input_bytes", 0)) for r in measured)
+    return dict(
+        files=len(done),
+        pages=pages,
+        pages_per_sec=round(pages / span, 2) if span else 0.0,
+        page_latency_p50=round(percentile(per_page, 0.50), 2),
+        page_latency_p95=round(percentile(per_page, 0.95), 2),
+        cpu=round(sum(float(r.get("cpu", 0)) for r in done), 1),
+        input_bytes=int(sum(float(r.get("input_bytes", 0)) for r in done)),
+        output_bytes=int(sum(float(r.get("output_bytes", 0)) for r in done)),
+        # Bytes the recompression took off the outputs
+        saved_bytes=int(sum(float(r.get("saved_bytes", 0)) for r in done)),
+        disk_write_bytes=written,
+        # Bytes written to disk per byte of input, including the output itself
+        write_amplification=round(written / measured_input, 2) if measured_input else None,
+        stages=stages,
+        slowest=[dict(input_path=r["input_path"], wall=r["wall"], pages=r["pages"])
+                 for r in sorted(done, key=lambda r: float(r["wall"]), reverse=True)[:slowest]],
+    )
+
+def format_summary(summary):
+    lines = [
+        f"{summary['files']} Dateien, {summary['pages']} Seiten, {summary['pages_per_sec']} Seiten/s",
+        f"Zeit pro Seite: p50 {summary['page_latency_p50']}s, p95 {summary['page_latency_p95']}s",
+    ]
+    if summary.get("saved_bytes"):
+        original = summary["output_bytes"] + summary["saved_bytes"]
+        lines.append(f"Nachkomprimierung: {summary['saved_bytes'] / 1024 ** 2:.1f} MB eingespart "
+                     f"({summary['saved_bytes'] / original:.0%} der OCR-Ausgaben)")
+    if summary.get("write_amplification") is not None:
+        lines.append(f"Schreiblast: {summary['disk_write_bytes'] / 1024 ** 2:.1f} MB auf Datenträger, "
+                     f"{summary['write_amplification']} Byte je Eingabebyte")
+    if summary["stages"]:
+        lines.append("Phasen: " + ", ".join(f"{stage} {seconds}s" for stage, seconds in summary["stages"].items()))
+    for entry in summary["slowest"]:
+        lines.append(f"  {entry['wall']}s  {entry['pages']} S.  {entry['input_path']}")
+    return "\n".join(lines)
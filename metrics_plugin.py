@@ -0,0 +1,92 @@
+"""ocrmypdf plugin that measures the time spent in each processing stage.
+
+Loaded per call with ocrmypdf.ocr(..., plugins=["metrics_plugin"]). The stages are
+collected in this module, so they belong to the worker process running the call;
+OCRProcessor resets them before and reads them after every file."""
+import time
+import threading
+from collections import defaultdict
+
+from ocrmypdf import hookimpl
+
+from task_guard import report_page
+
+_lock = threading.Lock()
+_stages = defaultdict(float)
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+def stage_times():
+    with _lock:
+        return {stage: round(seconds, 3) for stage, seconds in _stages.items()}
+
+def _add(stage, seconds):
+    with _lock:
+        _stages[stage] += seconds
+
+def _timed(stage, func):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _add(stage, time.perf_counter() - start)
+    return wrapper
+
+def _page(func):
+    # ocrmypdf calls one of the generate_* methods per page, so every call is a page done
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        report_page()
+        return result
+    return wrapper
+
+class TimedOcrEngine:
+    """Wraps the OCR engine chosen by ocrmypdf and books its calls on the deskew/ocr stages.
+    Page tasks run in threads, so the stages add up the time of all pages. Every OCRed
+    page is reported to the batch for its progress display."""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self.get_deskew = _timed("deskew", engine.get_deskew)
+        self.get_orientation = _timed("orientation", engine.get_orientation)
+        self.generate_hocr = _page(_timed("ocr", engine.generate_hocr))
+        self.generate_pdf = _page(_timed("ocr", engine.generate_pdf))
+        if hasattr(engine, "generate_ocr"):
+            self.generate_ocr = _page(_timed("ocr", engine.generate_ocr))
+
+    def __getattr__(self, name):
+        # Only called for attributes not set above; guarded for unpickling
+        engine = self.__dict__.get("_engine")
+        if engine is None:
+            raise AttributeError(name)
+        return getattr(engine, name)
+
+    def __str__(self):
+        return str(self._engine)
+
+def _stage_wrapper(stage):
+    start = time.perf_counter()
+    yield
+    _add(stage, time.perf_counter() - start)
+
+@hookimpl(hookwrapper=True)
+def rasterize_pdf_page():
+    yield from _stage_wrapper("rasterize")
+
+@hookimpl(hookwrapper=True)
+def generate_pdfa():
+    yield from _stage_wrapper("pdfa")
+
+@hookimpl(hookwrapper=True)
+def optimize_pdf():
+    yield from _stage_wrapper("optimize")
+
+@hookimpl(hookwrapper=True)
+def get_ocr_engine():
+    outcome = yield
+    engine = outcome.get_result()
+    if engine is not None and not isinstance(engine, TimedOcrEngine):
+        outcome.force_result(TimedOcrEngine(engine))
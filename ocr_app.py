@@ -1,15 +1,22 @@
 import os
 import time
-import multiprocessing
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
 import tkinter.font as tkfont
 from PIL import Image, ImageTk
 import tkfilebrowser
 
-from loghandler import LogHandler
-from ocr_processor import OCRProcessor
-from filemanager import FileManager
+from batch_runner import BatchRunner
+from profiles import ProfileError, list_profiles, DEFAULT_PROFILE
+from triage import PAGE_DIGITAL, PAGE_OCR, PAGE_IMAGE, PAGE_EMPTY
+from page_split import DEFAULT_SPLIT_PAGES
+from metrics import format_summary
+from log_viewer import LogViewer
+from progress import ProgressBus, ProgressTracker, format_duration
+
+# Wie oft die Oberfläche die Ereignisse der Verarbeitung abholt (ms)
+PUMP_INTERVAL = 100
 
 class OcrApp(tk.Tk):
     def __init__(self):
@@ -28,25 +35,35 @@ class OcrApp(tk.Tk):
         self.include_subfolders = tk.BooleanVar(value=True)
         self.use_internal_parallelism = tk.BooleanVar(value=True)
         self.logfile_enabled = tk.BooleanVar(value=True)
+        self.cache_enabled = tk.BooleanVar(value=True)
+        self.dedup = tk.BooleanVar(value=True)
+        self.min_dpi = tk.IntVar(value=0)  # 0: Auflösung aus dem Profil
+        self.profile = tk.StringVar(value=DEFAULT_PROFILE)
+        self.split_large_files = tk.BooleanVar(value=False)
+        self.watch_folders = tk.BooleanVar(value=False)
+        self.watch_polling = tk.BooleanVar(value=False)
+        self.shortest_first = tk.BooleanVar(value=False)
+        self.staging = tk.BooleanVar(value=False)
+        self.folder_priorities = {}  # Quellordner -> Priorität, höhere zuerst
+        self.folder_profiles = {}    # Quellordner -> eigenes OCR-Profil
         self.mode = tk.StringVar(value="folder_mode")  # "folder_mode" oder "file_mode"
         
-        self.total_files = 0
-        self.processed_files = 0
-        self.pool = None
-        self.manager = None
-        self.tasks = []
+        self.runner = None
         self.processing = False
-        self.start_time = None
-        self.log_file_path = ""
+        # Die Verarbeitung meldet sich nur über den Bus, Widgets ändert allein der Tk-Thread
+        self.bus = ProgressBus()
+        self.tracker = ProgressTracker()
+        self.log_dir = ""
         self.last_folder = os.path.expanduser("~")
         
-        self.pdf_processor = OCRProcessor()  # Wird beim Einzelfile-/Ordner-Modus verwendet
         self.set_styles()
         self.create_widgets()
 
     def set_styles(self):
         style = ttk.Style(self)
-        style.theme_use("xpnative")
+        # "xpnative" gibt es nur unter Windows
+        if "xpnative" in style.theme_names():
+            style.theme_use("xpnative")
         default_font = tkfont.nametofont("TkDefaultFont")
         default_font.configure(family="Segoe UI", size=11)
         style.configure("TLabel", font=("Segoe UI", 11), background="#f0f0f0")
@@ -93,6 +110,8 @@ class OcrApp(tk.Tk):
         src_btn_frame.grid(row=2, column=0, sticky="e", pady=5)
         ttk.Button(src_btn_frame, text="➕ Hinzufügen", command=self.browse_source).pack(side="left", padx=5)
         ttk.Button(src_btn_frame, text="❌ Entfernen", command=self.remove_source_folder).pack(side="left", padx=5)
+        ttk.Button(src_btn_frame, text="⭐ Priorität", command=self.set_folder_priority).pack(side="left", padx=5)
+        ttk.Button(src_btn_frame, text="🧾 Profil", command=self.set_folder_profile).pack(side="left", padx=5)
 
         # File Selection Frame (für Einzel-PDFs)
         self.file_frame = ttk.Frame(self.source_container)
@@ -118,6 +137,22 @@ class OcrApp(tk.Tk):
         self.options_menu.add_checkbutton(label="Unterordner integrieren", variable=self.include_subfolders)
         self.options_menu.add_checkbutton(label="Interne Parallelisierung aktivieren", variable=self.use_internal_parallelism)
         self.options_menu.add_checkbutton(label="Logfile erstellen", variable=self.logfile_enabled)
+        self.options_menu.add_checkbutton(label="Unveränderte Dateien überspringen (Cache)", variable=self.cache_enabled)
+        self.options_menu.add_checkbutton(label="Doppelte Dateien nur einmal verarbeiten", variable=self.dedup)
+        profile_menu = tk.Menu(self.options_menu, tearoff=0)
+        for name in list_profiles():
+            profile_menu.add_radiobutton(label=name, variable=self.profile, value=name)
+        self.options_menu.add_cascade(label="OCR-Profil", menu=profile_menu)
+        dpi_menu = tk.Menu(self.options_menu, tearoff=0)
+        dpi_menu.add_radiobutton(label="Aus dem Profil", variable=self.min_dpi, value=0)
+        for dpi in (200, 300, 400, 600):
+            dpi_menu.add_radiobutton(label=f"{dpi} dpi", variable=self.min_dpi, value=dpi)
+        self.options_menu.add_cascade(label="Mindestauflösung für OCR", menu=dpi_menu)
+        self.options_menu.add_checkbutton(label=f"Große PDFs aufteilen (ab {DEFAULT_SPLIT_PAGES} Seiten)", variable=self.split_large_files)
+        self.options_menu.add_checkbutton(label="Quellordner überwachen (Hotfolder, bis Stop)", variable=self.watch_folders)
+        self.options_menu.add_checkbutton(label="Überwachung per Abfrage (Netzlaufwerke)", variable=self.watch_polling)
+        self.options_menu.add_checkbutton(label="Kurze Dateien zuerst", variable=self.shortest_first)
+        self.options_menu.add_checkbutton(label="Netzlaufwerke: Dateien lokal zwischenspeichern", variable=self.staging)
         self.options_menubutton.grid(row=5, column=0, columnspan=3, pady=5)
 
         # Fortschrittsanzeige
@@ -167,6 +202,48 @@ class OcrApp(tk.Tk):
         for index in selected[::-1]:
             self.source_listbox.delete(index)
 
+    def set_folder_priority(self):
+        """Priorität der markierten Quellordner; wirkt auch auf eine laufende Verarbeitung."""
+        selected = self.source_listbox.curselection()
+        if not selected:
+            messagebox.showinfo("Priorität", "Bitte markieren Sie mindestens einen Quellordner.")
+            return
+        folders = [self.source_listbox.get(index) for index in selected]
+        priority = simpledialog.askinteger(
+            "Priorität", "Priorität (höhere zuerst, Standard 0):",
+            initialvalue=self.folder_priorities.get(folders[0], 0), parent=self)
+        if priority is None:
+            return
+        for index, folder in zip(selected, folders):
+            self.folder_priorities[folder] = priority
+            # Bevorzugte Ordner blau, zurückgestellte grau
+            color = "#1a5fb4" if priority > 0 else "#77767b" if priority < 0 else "black"
+            self.source_listbox.itemconfig(index, foreground=color)
+            if self.processing and self.runner:
+                self.runner.set_priority(folder, priority)
+
+    def set_folder_profile(self):
+        """Eigenes OCR-Profil für die markierten Quellordner; gilt ab dem nächsten Start."""
+        selected = self.source_listbox.curselection()
+        if not selected:
+            messagebox.showinfo("Profil", "Bitte markieren Sie mindestens einen Quellordner.")
+            return
+        folders = [self.source_listbox.get(index) for index in selected]
+        name = simpledialog.askstring(
+            "Profil", f"OCR-Profil ({', '.join(list_profiles())}),\nleer = Profil aus den Optionen:",
+            initialvalue=self.folder_profiles.get(folders[0], ""), parent=self)
+        if name is None:
+            return
+        name = name.strip()
+        if name and name not in list_profiles():
+            messagebox.showerror("Profil", f"Unbekanntes Profil: {name}")
+            return
+        for folder in folders:
+            if name:
+                self.folder_profiles[folder] = name
+            else:
+                self.folder_profiles.pop(folder, None)
+
     def browse_target(self):
         folder = filedialog.askdirectory(title="Zielordner wählen", initialdir=self.last_folder)
         if folder:
@@ -175,133 +252,150 @@ class OcrApp(tk.Tk):
             self.target_entry.insert(0, folder)
             self.last_folder = folder
 
-    def get_pdf_files(self):
-        """Erstellt den FileManager. Wird target_folder als None übergeben, falls 'Zielordner = Quellordner' aktiv ist."""
-        self.source_folders = self.source_listbox.get(0, tk.END)
-        target = None if self.same_as_source.get() else self.target_folder
-        fm = FileManager(self.source_folders, target, self.include_subfolders.get())
-        return fm.get_pdf_files()
-
     def start_processing(self):
         self.source_folders = self.source_listbox.get(0, tk.END)
         if not self.source_folders or (not self.same_as_source.get() and not self.target_folder):
             messagebox.showerror("Fehler", "Bitte wählen Sie mindestens einen Quellordner und einen Zielordner aus.")
             return
 
-        files = self.get_pdf_files()
-        if not files:
-            messagebox.showinfo("Info", "Keine PDF-Dateien gefunden.")
+        # Neuer Bus je Lauf, damit keine späten Ereignisse des letzten Laufs ankommen
+        self.bus = ProgressBus()
+        self.tracker.reset()
+        # Wird target_folder als None übergeben, ist 'Zielordner = Quellordner' aktiv
+        target = None if self.same_as_source.get() else self.target_folder
+        try:
+            self.runner = BatchRunner(
+                self.source_folders, target,
+                include_subfolders=self.include_subfolders.get(),
+                use_internal_parallelism=self.use_internal_parallelism.get(),
+                logfile_enabled=self.logfile_enabled.get(),
+                cache_enabled=self.cache_enabled.get(),
+                dedup=self.dedup.get(),
+                min_dpi=self.min_dpi.get() or None,
+                profile=self.profile.get(),
+                folder_profiles={folder: name for folder, name in self.folder_profiles.items() if folder in self.source_folders},
+                split_pages=DEFAULT_SPLIT_PAGES if self.split_large_files.get() else 0,
+                watch=self.watch_folders.get(),
+                watch_polling=self.watch_polling.get(),
+                folder_priorities=self.folder_priorities,
+                shortest_first=self.shortest_first.get(),
+                staging=self.staging.get(),
+                on_event=self.bus.publish
+            )
+        except ProfileError as e:
+            messagebox.showerror("Profil", str(e))
             return
+        if self.runner.has_unfinished():
+            self.runner.resume = messagebox.askyesno(
+                "Fortsetzen", "Die letzte Verarbeitung dieser Ordner wurde nicht abgeschlossen.\n"
+                              "Fortsetzen und bereits fertige Dateien auslassen?")
 
-        self.start_time = time.time()
-        self.total_files = len(files)
-        self.processed_files = 0
-        self.progress_bar["maximum"] = self.total_files
         self.progress_bar["value"] = 0
-
+        self.progress_label.config(text="Wird gestartet …")
         self.start_button.config(state="disabled")
-        self.stop_button.config(state="normal")
-
-        # Falls "Zielordner = Quellordner" aktiv ist, log_file_path wird im ersten Quellordner abgelegt
-        if self.same_as_source.get():
-            self.log_file_path = os.path.join(self.source_folders[0], "ocr_log.txt")
-        else:
-            self.log_file_path = os.path.join(self.target_folder, "ocr_log.txt")
-
-        self.manager = multiprocessing.Manager()
-        log_lock = self.manager.Lock()
-
-        log_handler = LogHandler(self.log_file_path, self.logfile_enabled.get())
-        log_handler.set_lock(log_lock)
-
-        self.pool = multiprocessing.Pool(
-            processes=os.cpu_count(),
-            initializer=OCRProcessor.init_worker,
-            initargs=(log_lock,)
-        )
-
-        self.tasks = []
-        for args in files:
-            processor = OCRProcessor(self.use_internal_parallelism.get(), log_handler, args[2])
-            res = self.pool.apply_async(
-                processor.process_pdf,
-                args=(args[0], args[1]),
-                callback=self.task_callback
-            )
-            self.tasks.append(res)
-
-        self.update_progress()
+        self.processing = True
+        # Journal, erste Datei und Pool-Start laufen im Hintergrund, ebenso das Warten auf das Ende
+        threading.Thread(target=self.run_batch, args=(self.runner, self.bus), daemon=True).start()
+        self.after(PUMP_INTERVAL, self.pump_events)
+
+    @staticmethod
+    def run_batch(runner, bus):
+        # Läuft in einem eigenen Thread und meldet sich nur über den Bus
+        try:
+            started = runner.start()
+        except Exception as e:
+            bus.publish(dict(event="start_failed", error=str(e)))
+            return
+        if not started:
+            bus.publish(dict(event="nothing_found"))
+            return
+        # Beendet danach den Pool; nach einem Stop passiert hier nichts mehr
+        runner.wait()
 
     def stop_processing(self):
-        if self.pool:
-            self.pool.terminate()
-            self.pool.join()
+        if not self.runner:
+            return
+        self.stop_button.config(state="disabled")
+        self.progress_label.config(text=self.progress_label.cget("text") + "\nWird gestoppt …")
+        # Pool beenden und Journal schließen im Hintergrund; "stopped" kommt über den Bus
+        threading.Thread(target=self.runner.stop, daemon=True).start()
+
+    def pump_events(self):
+        events = self.bus.drain()
+        for event in events:
+            self.tracker.update(event)
+            self.handle_event(event)
+        if self.processing:
+            self.update_progress()
+            self.after(PUMP_INTERVAL, self.pump_events)
+
+    def handle_event(self, event):
+        kind = event["event"]
+        if kind == "start":
+            self.log_dir = self.runner.log_dir
+            self.stop_button.config(state="normal")
+        elif kind == "nothing_found":
+            self.finish_processing("Noch nicht gestartet")
+            messagebox.showinfo("Info", "Keine PDF-Dateien gefunden.")
+        elif kind == "start_failed":
+            self.finish_processing("Noch nicht gestartet")
+            messagebox.showerror("Fehler", f"Die Verarbeitung konnte nicht gestartet werden:\n{event['error']}")
+        elif kind == "stopped":
+            self.update_progress()
+            self.finish_processing()
+            messagebox.showinfo("Gestoppt", "Die Verarbeitung wurde gestoppt.")
+        elif kind == "done":
+            self.update_progress()
+            if event["metrics"]["files"]:
+                # Die langsamsten Dateien stehen in der Metrikdatei, das Label zeigt nur den Durchsatz
+                self.progress_label.config(
+                    text=self.progress_label.cget("text") + "\n" + format_summary(dict(event["metrics"], slowest=[])))
+            self.finish_processing()
+            self.display_logfile()
 
+    def finish_processing(self, text=None):
         self.processing = False
+        if text is not None:
+            self.progress_label.config(text=text)
         self.start_button.config(state="normal")
         self.stop_button.config(state="disabled")
-        messagebox.showinfo("Gestoppt", "Die Verarbeitung wurde gestoppt.")
 
     def update_progress(self):
-        elapsed_time = time.time() - self.start_time
-        percent = (self.processed_files / self.total_files) * 100 if self.total_files > 0 else 0
-        self.progress_label.config(
-            text=f"{self.processed_files}/{self.total_files} Dateien verarbeitet ({percent:.1f}%) - {elapsed_time:.1f}s vergangen"
-        )
-        if self.processed_files < self.total_files:
-            self.after(1000, self.update_progress)
-        else:
-            self.pool.close()
-            self.pool.join()
-            self.start_button.config(state="normal")
-            self.stop_button.config(state="disabled")
-            self.display_logfile()
-
-    def task_callback(self, result):
-        self.processed_files += 1
-        self.progress_bar["value"] = self.processed_files
+        tracker = self.tracker
+        if tracker.start_time is None:
+            return
+        elapsed_time = time.monotonic() - tracker.start_time
+        percent = (tracker.processed / tracker.total) * 100 if tracker.total > 0 else 0
+        cached = tracker.statuses["cached"]
+        skipped = tracker.statuses["skipped"]
+        details = f", {cached} aus Cache" if cached else ""
+        details += f", {skipped} ohne OCR-Bedarf" if skipped else ""
+        details += f", {tracker.resumed} aus früherem Durchlauf" if tracker.resumed else ""
+        duplicates = tracker.statuses["duplicate"]
+        details += f", {duplicates} Duplikate ({tracker.duplicate_pages} Seiten gespart)" if duplicates else ""
+        pages = (f"Seiten: {tracker.page_classes[PAGE_IMAGE]} gescannt, {tracker.page_classes[PAGE_OCR]} bereits OCR, "
+                 f"{tracker.page_classes[PAGE_DIGITAL]} digital")
+        if tracker.page_classes[PAGE_EMPTY]:
+            pages += f", {tracker.page_classes[PAGE_EMPTY]} leer"
+        # Die Gesamtzahl wächst, solange die Quellordner noch durchsucht werden
+        self.progress_bar["maximum"] = max(tracker.total, 1)
+        self.progress_bar["value"] = tracker.processed
+        total = f"{tracker.total}+" if tracker.discovering else f"{tracker.total}"
+        text = (f"{tracker.processed}/{total} Dateien verarbeitet ({percent:.1f}%{details}) - {elapsed_time:.1f}s vergangen\n"
+                f"{pages}, {tracker.ocr_pages_done}/{tracker.ocr_pages_total} mit OCR erkannt")
+        rate = tracker.pages_per_sec()
+        if tracker.summary is None and rate:
+            eta = tracker.eta()
+            text += (f"\n{rate:.1f} Seiten/s, {tracker.files_per_min():.1f} Dateien/min"
+                     f"{f', noch ca. {format_duration(eta)}' if eta is not None else ''}")
+        self.progress_label.config(text=text)
 
     def display_logfile(self):
-        if not os.path.exists(self.log_file_path):
+        if not os.path.isdir(self.log_dir):
             messagebox.showinfo("Logfile", "Kein Logfile gefunden.")
             return
-
-        log_win = tk.Toplevel(self)
-        log_win.title("OCR Logfile")
-        log_win.geometry("800x600")
-
-        columns = ("datum", "uhrzeit", "dateipfad", "dateiname")
-        tree = ttk.Treeview(log_win, columns=columns, show="headings")
-        tree.heading("datum", text="Datum")
-        tree.heading("uhrzeit", text="Uhrzeit")
-        tree.heading("dateipfad", text="Dateipfad")
-        tree.heading("dateiname", text="Dateiname")
-        tree.column("datum", anchor="w", width=120)
-        tree.column("uhrzeit", anchor="w", width=100)
-        tree.column("dateipfad", anchor="w", width=400)
-        tree.column("dateiname", anchor="w", width=150)
-        tree.pack(fill="both", expand=True)
-
-        with open(self.log_file_path, "r", encoding="utf-8") as logfile:
-            for line in logfile:
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split(" - ", 1)
-                if len(parts) == 2:
-                    timestamp = parts[0].strip()
-                    relpath = parts[1].strip()
-                    if " " in timestamp:
-                        datum, uhrzeit = timestamp.split(" ", 1)
-                    else:
-                        datum, uhrzeit = timestamp, ""
-                    filename = os.path.basename(relpath)
-                    tree.insert("", tk.END, values=(datum, uhrzeit, relpath, filename))
-                else:
-                    tree.insert("", tk.END, values=(line, "", "", ""))
-        scrollbar = ttk.Scrollbar(log_win, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side="right", fill="y")
+        # Lädt nur die sichtbaren Zeilen, auch bei sehr langen Logs
+        LogViewer(self, self.log_dir)
 
 if __name__ == "__main__":
     app = OcrApp()
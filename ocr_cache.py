@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from fileio import copy_file
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".batchocr", "cache")
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+HASH_CHUNK = 1024 * 1024
+# A full cache is evicted down to this share of max_bytes, so the next scan only comes after some growth
+EVICT_TO = 0.9
+
+def settings_fingerprint(settings):
+    """Stable hash of the OCR settings that influence the output."""
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+: reads into one reused buffer instead of a new bytes object per chunk
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CacheHit:
+    def __init__(self, output_sha256, object_path):
+        self.output_sha256 = output_sha256
+        self.object_path = object_path  # None if the input already is an OCR output
+
+class OcrCache:
+    """On-disk index of finished OCR results, keyed by input content hash plus settings.
+
+    The SQLite connection is opened lazily per process, so the cache can be handed
+    to pool workers together with the OCRProcessor. Within a process it is shared by
+    the threads of the batch (feed, pool results, staging) and guarded by a lock;
+    hashing and copying happen outside of it."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(cache_dir, "index.sqlite")
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha256 TEXT);
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, output_sha256 TEXT, output_size INTEGER,
+                    stored INTEGER, last_used REAL);
+                CREATE INDEX IF NOT EXISTS results_lru ON results (stored, last_used);
+                -- Hits and evictions update all rows of an output
+                CREATE INDEX IF NOT EXISTS results_output ON results (output_sha256);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            """)
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'stored_bytes'").fetchone() is None:
+                # Once per cache; afterwards store() and evict() keep the total up to date
+                with self._conn:
+                    self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('stored_bytes', ?)",
+                                       (self._stored_bytes(self._conn),))
+        return self._conn
+
+    @staticmethod
+    def _stored_bytes(db):
+        row = db.execute("SELECT SUM(size) FROM (SELECT MAX(output_size) AS size FROM results "
+                         "WHERE stored = 1 GROUP BY output_sha256)").fetchone()
+        return row[0] or 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def file_digest(self, path):
+        """Content hash of a file; only re-hashed if mtime or size changed since the last scan."""
+        st = os.stat(path)
+        with self._lock:
+            row = self._db().execute("SELECT mtime_ns, size, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            return row[2]
+        sha = file_sha256(path)
+        with self._lock, self._db() as db:
+            db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                       (path, st.st_mtime_ns, st.st_size, sha))
+        return sha
+
+    def lookup(self, input_path, fingerprint):
+        """Returns a CacheHit for an input that was already processed with these settings, else None."""
+        digest = self.file_digest(input_path)
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT output_sha256, stored FROM results WHERE key = ?",
+                             (self._key(digest, fingerprint),)).fetchone()
+            if row is None:
+                return None
+            output_sha, stored = row
+            if output_sha == digest:
+                hit = CacheHit(output_sha, None)
+            elif stored and os.path.exists(self._object_path(output_sha)):
+                hit = CacheHit(output_sha, self._object_path(output_sha))
+            else:
+                return None
+            with db:
+                db.execute("UPDATE results SET last_used = ? WHERE output_sha256 = ?", (time.time(), output_sha))
+        return hit
+
+    def store(self, input_digest, fingerprint, output_path):
+        """Records a finished output and keeps a copy of it for later restores."""
+        output_sha = self.file_digest(output_path)
+        output_size = os.path.getsize(output_path)
+        stored = 0
+        # Unchanged files (no OCR needed) are not worth a copy
+        if output_sha != input_digest and output_size <= self.max_bytes:
+            object_path = self._object_path(output_sha)
+            if not os.path.exists(object_path):
+                tmp_path = f"{object_path}.{os.getpid()}.tmp"
+                copy_file(output_path, tmp_path)
+                os.replace(tmp_path, object_path)
+            stored = 1
+        now = time.time()
+        with self._lock, self._db() as db:
+            # Another worker may count the same new object at the same time; evict() recounts exactly
+            new_object = stored and not db.execute("SELECT MAX(stored) FROM results WHERE output_sha256 = ?",
+                                                   (output_sha,)).fetchone()[0]
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                       (self._key(input_digest, fingerprint), output_sha, output_size, stored, now))
+            # The output itself counts as processed, so in-place runs skip it next time
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, 0, ?)",
+                       (self._key(output_sha, fingerprint), output_sha, output_size, now))
+            if new_object:
+                db.execute("UPDATE meta SET value = value + ? WHERE key = 'stored_bytes'", (output_size,))
+            total = db.execute("SELECT value FROM meta WHERE key = 'stored_bytes'").fetchone()[0]
+        if total > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drops the least recently used objects until the cache fits into EVICT_TO of max_bytes.
+        Scans the index, so store() only calls it once the running total is above max_bytes."""
+        with self._lock:
+            db = self._db()
+            rows = db.execute("SELECT output_sha256, MAX(output_size), MAX(last_used) FROM results "
+                              "WHERE stored = 1 GROUP BY output_sha256 ORDER BY MAX(last_used) DESC").fetchall()
+            total = kept = 0
+            evicted = []
+            for output_sha, size, _ in rows:
+                total += size
+                if total <= self.max_bytes * EVICT_TO:
+                    kept += size
+                    continue
+                try:
+                    os.remove(self._object_path(output_sha))
+                except FileNotFoundError:
+                    pass
+                evicted.append((output_sha,))
+            with db:
+                db.executemany("UPDATE results SET stored = 0 WHERE output_sha256 = ?", evicted)
+                db.execute("UPDATE meta SET value = ? WHERE key = 'stored_bytes'", (kept,))
+
+    def _key(self, digest, fingerprint):
+        return hashlib.sha256(f"{digest}:{fingerprint}".encode("ascii")).hexdigest()
+
+    def _object_path(self, output_sha):
+        return os.path.join(self.objects_dir, f"{output_sha}.pdf")
@@ -1,51 +1,327 @@
 import os
+import sys
 import time
+import shutil
 import signal
+import tempfile
 import ocrmypdf
 
+import task_guard
+
+from ocr_cache import settings_fingerprint
+from triage import triage_pdf, MODE_SKIP
+from language_id import detect_languages
+from page_split import split_pdf, merge_pdfs
+from pdfprobe import page_count
+from metrics import Measurement, combine
+from profiles import BUILTIN_PROFILES, DEFAULT_PROFILE
+from recompress import recompress_pdf, lower_priority
+from fileio import copy_file, use_temp_dir, disk_writes
+
+# Retries of files that failed or hung: no deskew and at most this resolution
+FALLBACK_MIN_DPI = 200
+
+def is_in_place(input_path, output_path):
+    # "Zielordner = Quellordner": the output is a sibling "_ocr" file that replaces the input
+    return os.path.dirname(input_path) == os.path.dirname(output_path) and os.path.basename(input_path) != os.path.basename(output_path)
+
+def ensure_output_dir(output_path):
+    # Created lazily, so discovery does not touch the target tree
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+def copy_atomic(source_path, output_path):
+    # An interrupted copy must not leave a file that looks like a finished output
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    copy_file(source_path, tmp_path)
+    os.replace(tmp_path, output_path)
+
 class OCRProcessor:
-    def __init__(self, use_internal_parallelism=True, logfile_handler=None, pdf_folder=""):
+    def __init__(self, use_internal_parallelism=True, pdf_folder="", cache=None, min_dpi=None, profile=None):
         self.use_internal_parallelism = use_internal_parallelism
-        self.logfile_handler = logfile_handler
         self.pdf_folder = pdf_folder
+        self.cache = cache
+        self.profile = profile or BUILTIN_PROFILES[DEFAULT_PROFILE]
+        # An explicit min_dpi overrides the one of the profile
+        self.min_dpi = min_dpi or self.profile.min_dpi
+
+    def ocr_options(self):
+        return self.profile.ocr_options()
+
+    def fingerprint(self):
+        # Everything that influences the output, used as the cache key; switching profiles changes it
+        settings = {**self.ocr_options(), "min_dpi": self.min_dpi, "detect_language": self.profile.detect_language}
+        if self.profile.recompress:
+            # Only then, so the keys of existing cache entries stay the same
+            settings["recompress"] = (self.profile.recompress, self.profile.jpeg_quality, self.profile.png_quality)
+        return settings_fingerprint(settings)
+
+    def oversample_for(self, source_dpi, fallback=False):
+        """Lowest oversampling target that reaches min_dpi; None if the scan is already fine enough."""
+        min_dpi = min(self.min_dpi, FALLBACK_MIN_DPI) if fallback else self.min_dpi
+        if source_dpi and source_dpi >= min_dpi:
+            return None
+        return min_dpi
+
+    @staticmethod
+    def mode_options(mode):
+        # mode comes from the triage; without it every page is rasterized again
+        if mode == MODE_SKIP:
+            raise ValueError("Triage mode 'skip' has no ocrmypdf options, the file is kept as it is")
+        if mode is None:
+            return dict(force_ocr=True)
+        options = {mode: True}
+        if mode == "redo_ocr":
+            # ocrmypdf does not support deskewing together with --redo-ocr
+            options["deskew"] = False
+        return options
 
-    def process_pdf(self, input_path, output_path):
+    def jobs_value(self, jobs):
+        # The scheduler hands out the per-file share of the core budget
+        if jobs is not None:
+            return jobs
+        return 4 if self.use_internal_parallelism else 1
+
+    def build_options(self, mode, source_dpi, fallback=False, languages=None):
+        """ocrmypdf options for one file and the resolution the OCR will effectively see.
+        The fallback profile is cheaper and meant for retries of files that failed or hung."""
+        options = {**self.ocr_options(), **self.mode_options(mode)}
+        if languages:
+            # Only the traineddata models the file needs
+            options["language"] = "+".join(languages)
+        if fallback:
+            options.update(deskew=False, clean=False)
+        # Only upsample scans below min_dpi; ocrmypdf never downsamples
+        oversample = self.oversample_for(source_dpi, fallback)
+        if oversample:
+            options["oversample"] = oversample
+        return options, max(source_dpi or 0, oversample or 0)
+
+    def ocr(self, input_path, output_path, jobs, options):
+        # The metrics plugin books the time of the ocrmypdf stages on this worker process
+        ocrmypdf.ocr(input_path, output_path, jobs=self.jobs_value(jobs), plugins=["metrics_plugin"], **options)
+
+    def process_pdf(self, input_path, output_path, jobs=None, mode=None, source_dpi=None, pages=None, fallback=False,
+                    staged_input=None, languages=None):
+        """OCRs one file. With staged_input (a local copy made by the Stager) the OCR reads the copy and
+        writes next to it; the main process then writes the result back to output_path."""
+        if mode == MODE_SKIP:
+            # Triage found nothing to OCR
+            self.keep_original(input_path, output_path)
+            return dict(input_path=input_path, status="skipped", pages=pages or page_count(input_path))
+        read_path = staged_input or input_path
+        result = dict(input_path=input_path, status="done", pages=pages or page_count(read_path), fallback=fallback)
+        measurement = Measurement()
         try:
             relative_path = os.path.relpath(input_path, self.pdf_folder)
             print(f"🔄 Processing: {relative_path}")
 
-            jobs_value = 4 if self.use_internal_parallelism else 1
-            
-            # Process the file with OCR
-            ocrmypdf.ocr(
-                input_path, output_path,
-                deskew=True,
-                optimize=1,
-                force_ocr=True,
-                oversample=600,
-                language="deu+eng",
-                jobs=jobs_value
-            )
-            
-            # If input and output are in the same directory (different filenames)
-            if os.path.dirname(input_path) == os.path.dirname(output_path) and os.path.basename(input_path) != os.path.basename(output_path):
-                # Rename the output file to replace the original
-                os.replace(output_path, input_path)
-                print(f"✅ Finished and replaced original: {relative_path}")
+            options, effective_dpi = self.build_options(mode, source_dpi, fallback, languages)
+            result.update(dpi=effective_dpi, language=options["language"])
+            # Hash the input before it may get replaced by the output
+            input_digest = self.cache.file_digest(input_path) if self.cache else None
+            if staged_input:
+                write_path = os.path.join(os.path.dirname(staged_input), "output.pdf")
             else:
-                print(f"✅ Finished: {relative_path}")
+                write_path = output_path
+                ensure_output_dir(output_path)
 
-            if self.logfile_handler:
-                self.logfile_handler.write_log(input_path, self.pdf_folder)
+            # Process the file with OCR
+            self.ocr(read_path, write_path, jobs, options)
+            # Sizes are taken before an in-place output replaces the input
+            result.update(measurement.finish(read_path, write_path))
+            self.place_output(input_path, output_path, input_digest, source_dpi, result,
+                              staged_output=write_path if staged_input else None)
+            # Again after place_output, so the copy into the cache counts as well
+            result.update(measurement.disk_writes())
 
         except Exception as e:
             print(f"❌ Error processing {input_path}: {e}")
+            result.update(status="error", error=str(e))
+            result.setdefault("wall", measurement.finish(input_path)["wall"])
 
-        return os.path.basename(input_path)
+        return result
+
+    def place_output(self, input_path, output_path, input_digest, source_dpi, result, staged_output=None):
+        relative_path = os.path.relpath(input_path, self.pdf_folder)
+        effective_dpi = result["dpi"]
+        if staged_output:
+            # Written back by the main process, which also replaces the original in place
+            final_path = input_path if is_in_place(input_path, output_path) else output_path
+            result["staged_output"] = staged_output
+            print(f"✅ Finished, writing back: {relative_path} ({effective_dpi} dpi)")
+        # If input and output are in the same directory (different filenames)
+        elif is_in_place(input_path, output_path):
+            # Rename the output file to replace the original
+            os.replace(output_path, input_path)
+            final_path = input_path
+            print(f"✅ Finished and replaced original: {relative_path} ({effective_dpi} dpi)")
+        else:
+            final_path = output_path
+            print(f"✅ Finished: {relative_path} ({effective_dpi} dpi)")
+
+        result["output_path"] = final_path
+        # A fallback result does not match the settings of the fingerprint
+        if self.cache and not result.get("fallback"):
+            if self.profile.recompress:
+                # Stored once recompressed, so a cache hit restores the small file
+                result["input_digest"] = input_digest
+            else:
+                self.cache.store(input_digest, self.fingerprint(), staged_output or final_path)
+
+        # Logged by the batch runner once the result is back in the main process
+        scanned = f"{source_dpi} dpi" if source_dpi else "unbekannt"
+        result["details"] = f"Scan {scanned}, OCR mit {effective_dpi} dpi"
+        if result.get("language"):
+            result["details"] += f", Sprache {result['language']}"
+        if result.get("fallback"):
+            result["details"] += ", ohne Begradigung (Wiederholung)"
+
+    def recompress_output(self, result):
+        """Shrinks the images of a finished output with the profile's policy. Runs in the
+        low-priority recompression pool, after the OCR has given its cores back."""
+        path = result.get("staged_output") or result["output_path"]
+        input_digest = result.pop("input_digest", None)
+        relative_path = os.path.relpath(result["input_path"], self.pdf_folder)
+        writes_before = disk_writes()
+        try:
+            before, after = recompress_pdf(path, self.profile.recompress, self.profile.jpeg_quality,
+                                           self.profile.png_quality)
+        except Exception as e:
+            # The OCR output is fine as it is
+            print(f"⚠️ Recompression failed for {relative_path}: {e}")
+            before = after = None
+        if after is not None:
+            result.update(output_bytes=after, saved_bytes=before - after)
+            if before > after:
+                print(f"🗜️ Recompressed: {relative_path} ({before // 1024} -> {after // 1024} KB)")
+                result["details"] = f"{result.get('details', '')}, {(before - after) / 1024 ** 2:.1f} MB eingespart"
+            else:
+                print(f"🗜️ Recompression saved nothing, kept as is: {relative_path}")
+        if self.cache and input_digest:
+            self.cache.store(input_digest, self.fingerprint(), path)
+        writes_after = disk_writes()
+        if "disk_write_bytes" in result and writes_before is not None and writes_after is not None:
+            # The rewritten output is part of what the file cost the disk
+            result["disk_write_bytes"] += writes_after - writes_before
+        return result
+
+    def split_pdf(self, input_path, chunk_pages):
+        """Splits a large file into page-range chunks in a temporary work directory."""
+        work_dir = tempfile.mkdtemp(prefix="batchocr_split_")
+        try:
+            return work_dir, split_pdf(input_path, chunk_pages, work_dir)
+        except Exception:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+
+    def process_chunk(self, chunk_input, chunk_output, jobs=None, mode=None, source_dpi=None, fallback=False,
+                      languages=None):
+        """OCRs one chunk of a split file and returns its metrics."""
+        # Errors are passed on to the pool's error callback, which retries or fails the whole file
+        measurement = Measurement()
+        options, _ = self.build_options(mode, source_dpi, fallback, languages)
+        self.ocr(chunk_input, chunk_output, jobs, options)
+        return measurement.finish(chunk_input, chunk_output)
+
+    def merge_chunks(self, input_path, output_path, chunk_outputs, work_dir, source_dpi=None, pages=None,
+                     chunk_metrics=(), fallback=False, languages=None):
+        """Joins the OCRed chunks of a split file and places the result like process_pdf does.
+        The metrics of the file add up the worker time of all chunks and of the merge."""
+        result = dict(input_path=input_path, status="done", pages=pages, fallback=fallback)
+        measurement = Measurement()
+        try:
+            options, result["dpi"] = self.build_options(None, source_dpi, fallback, languages)
+            result["language"] = options["language"]
+            input_digest = self.cache.file_digest(input_path) if self.cache else None
+            ensure_output_dir(output_path)
+            merge_pdfs(input_path, chunk_outputs, output_path)
+            merge = measurement.finish(input_path, output_path)
+            merge["stages"] = dict(merge=merge["wall"])
+            self.place_output(input_path, output_path, input_digest, source_dpi, result)
+            merge.update(measurement.disk_writes())
+            result.update(combine([*chunk_metrics, merge]), input_bytes=merge["input_bytes"],
+                          output_bytes=merge["output_bytes"])
+        except Exception as e:
+            print(f"❌ Error merging {input_path}: {e}")
+            result.update(status="error", error=str(e))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return result
+
+    def triage_pdf(self, input_path, output_path):
+        """Classifies the pages of a file; files that need no OCR are placed right away."""
+        result = triage_pdf(input_path)
+        if result.error is None and result.mode == MODE_SKIP:
+            self.keep_original(input_path, output_path)
+        elif result.error is None:
+            result.languages = self.detect_languages(input_path, result)
+        return result
+
+    def detect_languages(self, input_path, triage):
+        """Languages of the profile found in a triaged file, None to OCR it with all of them."""
+        if not self.profile.detect_language:
+            return None
+        try:
+            guess = detect_languages(input_path, triage, self.profile.languages)
+        except Exception as e:
+            # Detection only saves time; the OCR with all languages still works
+            print(f"⚠️ Language detection failed for {input_path}: {e}")
+            return None
+        relative_path = os.path.relpath(input_path, self.pdf_folder)
+        if guess is None:
+            print(f"🌐 Language not detected, using {'+'.join(self.profile.languages)}: {relative_path}")
+            return None
+        print(f"🌐 Language {'+'.join(guess.languages)} ({guess.source}, {guess.confidence:.0%}): {relative_path}")
+        return guess.languages
+
+    def restore_cached(self, input_path, output_path):
+        """Places a cached result instead of running OCR. Returns False on a cache miss."""
+        if not self.cache:
+            return False
+        relative_path = os.path.relpath(input_path, self.pdf_folder)
+        try:
+            hit = self.cache.lookup(input_path, self.fingerprint())
+        except OSError as e:
+            print(f"❌ Cache lookup failed for {input_path}: {e}")
+            return False
+        if hit is None:
+            return False
+
+        if hit.object_path is None:
+            # The input already is the OCR result
+            self.keep_original(input_path, output_path)
+            return True
+
+        ensure_output_dir(output_path)
+        copy_atomic(hit.object_path, output_path)
+        if is_in_place(input_path, output_path):
+            os.replace(output_path, input_path)
+        print(f"♻️ Restored from cache: {relative_path}")
+        return True
+
+    def keep_original(self, input_path, output_path):
+        """Leaves a file that needs no OCR as it is; in target folder mode it is copied over."""
+        if not is_in_place(input_path, output_path) and not os.path.exists(output_path):
+            ensure_output_dir(output_path)
+            copy_atomic(input_path, output_path)
+        print(f"⏭️ No OCR needed: {os.path.relpath(input_path, self.pdf_folder)}")
+        if self.cache:
+            # Remember the decision, so the next run does not have to open the file again
+            digest = self.cache.file_digest(input_path)
+            self.cache.store(digest, self.fingerprint(), input_path)
 
     @staticmethod
-    def init_worker(lock):
-        # Initializer for worker processes: Sets the global lock and ignores SIGINT
-        global LOG_LOCK
-        LOG_LOCK = lock
+    def init_worker(redirect_output=False, events=None, rss_limit=None, temp_dir=None):
+        # Initializer for worker processes: ignores SIGINT, the main process handles it
         signal.signal(signal.SIGINT, signal.SIG_IGN)
+        use_temp_dir(temp_dir)
+        if events is not None:
+            task_guard.init_worker(events, rss_limit)
+        if redirect_output:
+            # Keep stdout free for machine-readable progress of the CLI
+            sys.stdout = sys.stderr
+
+    @staticmethod
+    def init_recompress_worker(nice, redirect_output=False, events=None, rss_limit=None, temp_dir=None):
+        OCRProcessor.init_worker(redirect_output, events, rss_limit, temp_dir)
+        lower_priority(nice)
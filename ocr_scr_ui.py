@@ -11,6 +11,8 @@ import tkfilebrowser
 import tkinter.font as tkfont
 from PIL import Image, ImageTk
 
+from profiles import load_profile, DEFAULT_PROFILE
+
 # Globaler Lock für Log-Schreibzugriffe
 LOG_LOCK = None
 
@@ -22,14 +24,13 @@ def process_pdf(input_path, output_path, use_internal_parallelism, logfile_enabl
 
         jobs_value = 4 if use_internal_parallelism else 1
 
+        # Sprache, Begradigung und Optimierung kommen aus dem Standardprofil wie in batchOCR
         ocrmypdf.ocr(
             input_path, output_path,
-            deskew=True,
-            optimize=1,
             force_ocr=True,
             oversample=600,
-            language="deu+eng",
-            jobs=jobs_value
+            jobs=jobs_value,
+            **load_profile(DEFAULT_PROFILE).ocr_options()
         )
         print(f"✅ Finished: {relative_path}")
 
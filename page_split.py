@@ -0,0 +1,99 @@
+import os
+import math
+import threading
+from contextlib import ExitStack
+
+import pikepdf
+
+# Default page count above which a file is split when splitting is enabled
+DEFAULT_SPLIT_PAGES = 100
+# Smaller chunks cost more in per-file overhead (PDF/A conversion, fonts) than they gain
+MIN_CHUNK_PAGES = 10
+
+class SplitState:
+    """Book-keeping for a file that is OCRed as several page-range chunks and merged afterwards."""
+
+    def __init__(self, input_path, output_path, source_folder, pages, mode=None, source_dpi=None, languages=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.source_folder = source_folder
+        self.pages = pages
+        self.mode = mode
+        self.source_dpi = source_dpi
+        self.languages = languages
+        self.work_dir = None
+        self.fallback = False  # a chunk had to be retried with the fallback settings
+        self.chunks = []  # (chunk_input, chunk_output, pages)
+        self.errors = []
+        self.metrics = []  # metrics of the finished chunks
+        self._remaining = 0
+        self._lock = threading.Lock()
+
+    def set_chunks(self, work_dir, chunks):
+        self.work_dir = work_dir
+        self.chunks = chunks
+        self._remaining = len(chunks)
+
+    def chunk_done(self, error=None, metrics=None):
+        """Returns True once the last chunk has come back."""
+        with self._lock:
+            if error is not None:
+                self.errors.append(error)
+            if metrics is not None:
+                self.metrics.append(metrics)
+            self._remaining -= 1
+            return self._remaining == 0
+
+    def chunk_outputs(self):
+        return [chunk_output for _, chunk_output, _ in self.chunks]
+
+def chunk_size(pages, cores):
+    # Enough chunks to keep every core busy, but not smaller than MIN_CHUNK_PAGES
+    return max(MIN_CHUNK_PAGES, math.ceil(pages / max(1, cores)))
+
+def split_pdf(input_path, chunk_pages, work_dir):
+    chunks = []
+    with pikepdf.open(input_path) as pdf:
+        for first in range(0, len(pdf.pages), chunk_pages):
+            part = pikepdf.new()
+            part.pages.extend(pdf.pages[first:first + chunk_pages])
+            chunk_input = os.path.join(work_dir, f"chunk_{first:06d}.pdf")
+            part.save(chunk_input)
+            chunks.append((chunk_input, os.path.join(work_dir, f"chunk_{first:06d}_ocr.pdf"), len(part.pages)))
+            part.close()
+    return chunks
+
+def copy_object(pdf, obj):
+    # copy_foreign only accepts indirect objects; direct containers are rebuilt around them
+    if obj.is_indirect:
+        return pdf.copy_foreign(obj)
+    if isinstance(obj, pikepdf.Array):
+        return pikepdf.Array([copy_object(pdf, item) for item in obj])
+    if isinstance(obj, pikepdf.Dictionary):
+        return pikepdf.Dictionary({key: copy_object(pdf, value) for key, value in obj.items()})
+    return obj
+
+def merge_pdfs(original_path, chunk_outputs, merged_path):
+    """Joins the OCRed chunks in order. The PDF/A output intent and XMP packet are taken
+    from the first chunk, title/author/etc. from the original file."""
+    with ExitStack() as stack:
+        # Page content is copied lazily, so every chunk has to stay open until the save
+        parts = [stack.enter_context(pikepdf.open(path)) for path in chunk_outputs]
+        original = stack.enter_context(pikepdf.open(original_path))
+        merged = stack.enter_context(pikepdf.new())
+        for part in parts:
+            merged.pages.extend(part.pages)
+
+        first = parts[0]
+        if "/OutputIntents" in first.Root:
+            merged.Root.OutputIntents = copy_object(merged, first.Root.OutputIntents)
+        if "/Metadata" in first.Root:
+            merged.Root.Metadata = copy_object(merged, first.Root.Metadata)
+        merged.docinfo = merged.make_indirect(copy_object(merged, first.docinfo))
+        for key, value in original.docinfo.items():
+            if key not in ("/Producer", "/ModDate"):
+                merged.docinfo[key] = copy_object(merged, value)
+        with merged.open_metadata(set_pikepdf_as_editor=False) as meta:
+            # Keep the XMP packet in sync with the document info, as PDF/A requires
+            meta.load_from_docinfo(merged.docinfo, delete_missing=False)
+        merged.save(merged_path)
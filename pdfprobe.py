@@ -0,0 +1,9 @@
+import pikepdf
+
+def page_count(path):
+    """Returns the number of pages of a PDF, or 1 if the file cannot be opened."""
+    try:
+        with pikepdf.open(path) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        return 1
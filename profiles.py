@@ -0,0 +1,130 @@
+import os
+import json
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".batchocr", "profiles")
+DEFAULT_PROFILE = "standard"
+# Tesseract's accuracy levels off around 300 DPI
+DEFAULT_MIN_DPI = 300
+# ocrmypdf's output types; "pdf" skips the PDF/A conversion by Ghostscript
+OUTPUT_TYPES = ("pdfa", "pdfa-1", "pdfa-2", "pdfa-3", "pdf")
+# Image policies of the recompression after the OCR; None leaves the output as ocrmypdf wrote it
+RECOMPRESS_POLICIES = (None, "lossless", "lossy")
+
+class ProfileError(ValueError):
+    pass
+
+class OcrProfile:
+    """Named set of OCR settings: languages, resolution, optimization, image cleanup,
+    output type and Tesseract engine mode. options holds further ocrmypdf keyword
+    arguments for anything the fields do not cover. With detect_language, files are only
+    OCRed with those of the languages a first pass finds in them. recompress shrinks the
+    images of finished outputs in a separate low-priority stage, lossless or lossy at
+    jpeg_quality/png_quality (None: ocrmypdf's defaults)."""
+
+    def __init__(self, name, languages=("deu", "eng"), min_dpi=DEFAULT_MIN_DPI, optimize=1, deskew=True,
+                 clean=False, output_type="pdfa", tesseract_oem=None, options=None, detect_language=True,
+                 recompress=None, jpeg_quality=None, png_quality=None):
+        if output_type not in OUTPUT_TYPES:
+            raise ProfileError(f"Profile {name}: unknown output type {output_type!r}")
+        if optimize not in (0, 1, 2, 3):
+            raise ProfileError(f"Profile {name}: optimize must be 0 to 3, not {optimize!r}")
+        if tesseract_oem not in (None, 0, 1, 2, 3):
+            raise ProfileError(f"Profile {name}: tesseract_oem must be 0 to 3, not {tesseract_oem!r}")
+        if recompress not in RECOMPRESS_POLICIES:
+            raise ProfileError(f"Profile {name}: unknown recompress policy {recompress!r}")
+        for quality in (jpeg_quality, png_quality):
+            if quality is not None and not 1 <= quality <= 100:
+                raise ProfileError(f"Profile {name}: image quality must be 1 to 100, not {quality!r}")
+        self.name = name
+        self.languages = [languages] if isinstance(languages, str) else list(languages)
+        self.min_dpi = int(min_dpi)
+        self.optimize = optimize
+        self.deskew = bool(deskew)
+        self.clean = bool(clean)  # needs unpaper
+        self.output_type = output_type
+        self.tesseract_oem = tesseract_oem  # None: Tesseract's default
+        self.options = dict(options or {})
+        self.detect_language = bool(detect_language)
+        self.recompress = recompress
+        self.jpeg_quality = jpeg_quality
+        self.png_quality = png_quality
+
+    def ocr_options(self):
+        """ocrmypdf keyword arguments of this profile."""
+        options = dict(
+            deskew=self.deskew,
+            optimize=self.optimize,
+            language="+".join(self.languages),
+            output_type=self.output_type,
+        )
+        if self.clean:
+            options["clean"] = True
+        if self.tesseract_oem is not None:
+            options["tesseract_oem"] = self.tesseract_oem
+        return {**options, **self.options}
+
+    def to_dict(self):
+        return dict(name=self.name, languages=self.languages, min_dpi=self.min_dpi, optimize=self.optimize,
+                    deskew=self.deskew, clean=self.clean, output_type=self.output_type,
+                    tesseract_oem=self.tesseract_oem, options=self.options, detect_language=self.detect_language,
+                    recompress=self.recompress, jpeg_quality=self.jpeg_quality, png_quality=self.png_quality)
+
+    @classmethod
+    def from_dict(cls, data, name=None):
+        fields = dict(data)
+        fields["name"] = name or fields.get("name")
+        if not fields["name"]:
+            raise ProfileError("Profile without a name")
+        try:
+            return cls(**fields)
+        except TypeError as e:
+            raise ProfileError(f"Profile {fields['name']}: {e}") from None
+
+BUILTIN_PROFILES = {
+    # The settings batchocr always used
+    "standard": OcrProfile("standard"),
+    # Throughput first: no deskew, no image optimization, plain PDF without the Ghostscript pass
+    "fast": OcrProfile("fast", min_dpi=200, optimize=0, deskew=False, output_type="pdf"),
+    # Archival quality: cleaned pages, finer rasterization, LSTM engine, PDF/A-2
+    "archive": OcrProfile("archive", min_dpi=400, optimize=2, deskew=True, clean=True, output_type="pdfa-2",
+                          tesseract_oem=1, detect_language=False),
+    # Standard OCR, then JPEG/PNG recompression of the outputs for storage and backup
+    "compact": OcrProfile("compact", recompress="lossy"),
+}
+
+def profile_path(name, profile_dir=DEFAULT_PROFILE_DIR):
+    return os.path.join(profile_dir, f"{name}.json")
+
+def load_profile(name, profile_dir=DEFAULT_PROFILE_DIR):
+    """Profile from <profile_dir>/<name>.json, which takes precedence over a built-in profile of that name."""
+    path = profile_path(name, profile_dir)
+    if os.path.isfile(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return OcrProfile.from_dict(json.load(f), name)
+        except (OSError, ValueError) as e:
+            raise ProfileError(f"Cannot read profile {path}: {e}") from None
+    if name in BUILTIN_PROFILES:
+        return BUILTIN_PROFILES[name]
+    raise ProfileError(f"Unknown profile {name!r}; available: {', '.join(list_profiles(profile_dir))}")
+
+def list_profiles(profile_dir=DEFAULT_PROFILE_DIR):
+    """Names of the built-in profiles and of the profile files."""
+    names = set(BUILTIN_PROFILES)
+    try:
+        names.update(os.path.splitext(entry)[0] for entry in os.listdir(profile_dir) if entry.endswith(".json"))
+    except OSError:
+        pass
+    return sorted(names)
+
+def save_profile(profile, profile_dir=DEFAULT_PROFILE_DIR):
+    """Writes a profile file, e.g. a copy of a built-in profile to edit."""
+    os.makedirs(profile_dir, exist_ok=True)
+    path = profile_path(profile.name, profile_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile.to_dict(), f, indent=2)
+    return path
+
+def resolve_profile(profile, profile_dir=DEFAULT_PROFILE_DIR):
+    """Accepts a profile or the name of one; None is the default profile."""
+    return profile if isinstance(profile, OcrProfile) else load_profile(profile or DEFAULT_PROFILE, profile_dir)
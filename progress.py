@@ -0,0 +1,123 @@
+import time
+import queue
+import threading
+from collections import Counter, deque
+
+# Throughput is measured over this many recent seconds, so the ETA follows the current speed
+RATE_WINDOW = 60.0
+# Shorter spans give no rate, the first pages of a batch often finish at once
+MIN_RATE_SPAN = 2.0
+# Events handed to the UI per drain; the rest waits for the next one, so the UI stays responsive
+MAX_EVENTS_PER_DRAIN = 500
+
+class ProgressBus:
+    """Thread-safe channel from the batch (pool result thread, discovery, staging) to the UI.
+
+    publish is passed to BatchRunner as on_event and never blocks; the UI thread takes
+    the events with drain, e.g. from Tk's after loop, and is the only one touching widgets."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def publish(self, event):
+        self._queue.put(event)
+
+    def drain(self, max_events=MAX_EVENTS_PER_DRAIN):
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+class ProgressTracker:
+    """Counters, throughput and ETA of a batch, built from its events alone.
+
+    The ETA counts the pages that still need OCR: those of triaged files not yet done,
+    plus an estimate for files that have not been triaged, at the page rate of the last
+    RATE_WINDOW seconds."""
+
+    def __init__(self, rate_window=RATE_WINDOW):
+        self.rate_window = rate_window
+        self.reset()
+
+    def reset(self):
+        self.start_time = None
+        self.total = 0
+        self.discovering = True
+        self.processed = 0
+        self.resumed = 0
+        self.statuses = Counter()
+        self.page_classes = Counter()
+        self.triaged = 0
+        self.ocr_pages_total = 0  # pages of the triaged files that need OCR
+        self.ocr_pages_done = 0
+        self.untriaged_done = 0  # files finished without a triage: cache hits and duplicates
+        self.duplicate_pages = 0
+        self.summary = None
+        self._pages = deque()  # (time, pages done so far)
+        self._lock = threading.Lock()
+
+    def update(self, event):
+        kind = event["event"]
+        now = time.monotonic()
+        with self._lock:
+            if kind == "start":
+                self.start_time = now
+                self.resumed = event.get("resumed", 0)
+            elif kind in ("discovered", "discovery_done"):
+                self.total = event["total"]
+                self.discovering = kind == "discovered"
+            elif kind == "triaged":
+                self.triaged += 1
+                self.page_classes.update(event.get("counts", {}))
+                self.ocr_pages_total += event.get("ocr_pages", 0)
+            elif kind == "page":
+                self.ocr_pages_done += 1
+                self._pages.append((now, self.ocr_pages_done))
+            elif kind == "file":
+                self.processed += 1
+                self.statuses[event.get("status")] += 1
+                if event.get("status") in ("cached", "duplicate"):
+                    self.untriaged_done += 1
+                if event.get("status") == "duplicate":
+                    self.duplicate_pages += event.get("pages") or 0
+            elif kind in ("done", "stopped"):
+                self.summary = event
+            while self._pages and now - self._pages[0][0] > self.rate_window:
+                self._pages.popleft()
+
+    def pages_per_sec(self):
+        with self._lock:
+            return self._rate()
+
+    def _rate(self):
+        if len(self._pages) < 2:
+            return 0.0
+        (first_time, first_pages), (last_time, last_pages) = self._pages[0], self._pages[-1]
+        # Until the window is full the rate is taken since the first page
+        span = max(time.monotonic() - first_time, last_time - first_time)
+        return (last_pages - first_pages) / span if span >= MIN_RATE_SPAN else 0.0
+
+    def eta(self):
+        """Estimated seconds until the batch is done; None while there is no rate or no estimate yet."""
+        with self._lock:
+            rate = self._rate()
+            if not rate or not self.triaged:
+                return None
+            untriaged = max(0, self.total - self.triaged - self.resumed - self.untriaged_done)
+            remaining = max(0, self.ocr_pages_total - self.ocr_pages_done) + untriaged * self.ocr_pages_total / self.triaged
+            return remaining / rate
+
+    def files_per_min(self):
+        with self._lock:
+            if self.start_time is None:
+                return 0.0
+            elapsed = time.monotonic() - self.start_time
+            return 60.0 * self.processed / elapsed if elapsed > 0 else 0.0
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
@@ -0,0 +1,68 @@
+import os
+import tempfile
+from pathlib import Path
+
+import ocrmypdf
+from pikepdf import ObjectStreamMode
+
+# ocrmypdf's optimizer takes a job context and options that are not public API; they are
+# known to fit these major versions only (see requirements.txt)
+OPTIMIZER_MAJOR_VERSIONS = range(17, 18)
+try:
+    from ocrmypdf._jobcontext import PdfContext
+    from ocrmypdf._options import OcrOptions
+    from ocrmypdf.optimize import optimize
+except ImportError:
+    optimize = None
+
+from fileio import copy_file
+
+# Image policies of a profile and the ocrmypdf optimization level each one runs
+RECOMPRESS_LOSSLESS = "lossless"  # JBIG2 for bitonal images, Flate instead of weak encodings
+RECOMPRESS_LOSSY = "lossy"        # additionally JPEG and quantized PNG at the profile's quality
+RECOMPRESS_LEVELS = {RECOMPRESS_LOSSLESS: 1, RECOMPRESS_LOSSY: 2}
+# Niceness of the recompression workers, so the OCR workers keep the CPU
+DEFAULT_NICE = 10
+# Bitonal images this similar share a JBIG2 symbol dictionary
+JBIG2_THRESHOLD = 0.85
+
+def lower_priority(nice=DEFAULT_NICE):
+    # Pool initializer; Windows has no nice and runs the workers at normal priority
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+def optimizer_unavailable():
+    """Why the installed ocrmypdf cannot recompress, None if it can."""
+    try:
+        major = int(ocrmypdf.__version__.split(".")[0])
+    except (AttributeError, ValueError):
+        major = None
+    if optimize is None or major not in OPTIMIZER_MAJOR_VERSIONS:
+        return f"ocrmypdf {getattr(ocrmypdf, '__version__', '?')} is not supported by the recompression"
+    return None
+
+def recompress_pdf(path, policy, jpeg_quality=None, png_quality=None):
+    """Recompresses the images of a finished PDF in place with ocrmypdf's optimizer.
+    The file is only replaced if it got smaller. Returns its size before and after.
+    Raises RuntimeError, leaving the file as it is, where the optimizer is unavailable."""
+    reason = optimizer_unavailable()
+    if reason:
+        raise RuntimeError(reason)
+    before = os.path.getsize(path)
+    with tempfile.TemporaryDirectory(prefix="batchocr_recompress_") as work_dir:
+        options = OcrOptions(input_file=Path(path), output_file=Path(work_dir, "out.pdf"),
+                             optimize=RECOMPRESS_LEVELS[policy], jpeg_quality=jpeg_quality or 0,
+                             png_quality=png_quality or 0, jbig2_threshold=JBIG2_THRESHOLD,
+                             quiet=True, progress_bar=False)
+        # The optimizer only reads the options of the context
+        context = PdfContext(options, Path(work_dir), Path(path), None, None)
+        output = optimize(Path(path), Path(work_dir, "out.pdf"), context,
+                          dict(compress_streams=True, preserve_pdfa=True, object_stream_mode=ObjectStreamMode.generate))
+        after = os.path.getsize(output)
+        if after >= before:
+            return before, before
+        # Next to the file and renamed onto it, so no half-written PDF is ever visible
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        copy_file(output, tmp_path)
+        os.replace(tmp_path, path)
+    return before, after
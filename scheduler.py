@@ -0,0 +1,270 @@
+import os
+import threading
+from bisect import insort
+from itertools import islice
+
+from pdfprobe import page_count
+
+# Above this, ocrmypdf's page workers mostly wait on each other
+DEFAULT_MAX_JOBS_PER_FILE = 8
+# Share of the physical memory that running files may be expected to use
+DEFAULT_MEMORY_FRACTION = 0.75
+# Memory estimate: a worker plus, per page in flight, an A4 RGB raster at the OCR resolution
+# and its copies (deskewed, rotated, Tesseract's own, the image in the output PDF)
+WORKER_BASE_MEMORY = 200 * 1024 ** 2
+PAGE_AREA_SQ_INCH = 8.27 * 11.69
+PAGE_COPIES = 4
+# Smaller files may overtake a file that does not fit this often before it waits for room
+MAX_OVERTAKES = 16
+
+# Order of the files within a source folder
+ORDER_LARGEST_FIRST = "largest"
+ORDER_SHORTEST_FIRST = "shortest"
+# Higher priorities go strictly first; folders of equal priority share the cores by weight
+DEFAULT_PRIORITY = 0
+DEFAULT_WEIGHT = 1.0
+# A merge finishes a file whose chunks are all done, so it goes before everything else
+MERGE_PRIORITY = float("inf")
+
+# Kinds of work: a whole file, one page range of a split file, or joining the ranges again
+KIND_FILE = "file"
+KIND_CHUNK = "chunk"
+KIND_MERGE = "merge"
+
+class ScheduledJob:
+    def __init__(self, input_path, output_path, source_folder, pages, mode=None, source_dpi=None,
+                 kind=KIND_FILE, split=None, max_jobs=None, attempt=1, fallback=False, dpi=None, priority=None,
+                 staged_input=None, languages=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.source_folder = source_folder
+        self.pages = pages
+        self.mode = mode
+        self.source_dpi = source_dpi
+        self.kind = kind
+        self.split = split          # SplitState for chunk and merge jobs
+        self.max_jobs = max_jobs    # e.g. 1 for single-threaded work
+        self.attempt = attempt
+        self.fallback = fallback    # cheaper OCR settings, used for retries
+        self.dpi = dpi              # resolution the pages are OCRed at, for the memory estimate
+        self.memory = 0             # bytes reserved while the job runs
+        self.held_back = False      # had to wait for memory at least once
+        self.priority = priority    # overrides the priority of the source folder
+        self.staged_input = staged_input  # local copy of a file on a network share
+        self.languages = languages  # detected languages, None: those of the profile
+
+    def retry(self):
+        return ScheduledJob(self.input_path, self.output_path, self.source_folder, self.pages, self.mode,
+                            self.source_dpi, self.kind, self.split, self.max_jobs, self.attempt + 1, fallback=True,
+                            dpi=self.dpi, priority=self.priority, staged_input=self.staged_input,
+                            languages=self.languages)
+
+    def belongs_to(self, input_path):
+        # Chunks and merges of a split file belong to the original file
+        return self.input_path == input_path or (self.split is not None and self.split.input_path == input_path)
+
+class FolderShare:
+    """Priority and weight of a source folder, and the pages it was served divided by its weight."""
+
+    def __init__(self, priority=DEFAULT_PRIORITY, weight=DEFAULT_WEIGHT):
+        self.priority = priority
+        self.weight = weight
+        self.served = 0.0
+
+def physical_memory():
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        # Windows: no budget unless one is given
+        return None
+
+def default_memory_budget():
+    total = physical_memory()
+    return int(total * DEFAULT_MEMORY_FRACTION) if total else None
+
+def estimate_memory(job, jobs):
+    """Projected peak memory of a job that ocrmypdf runs with `jobs` pages in parallel."""
+    page = PAGE_AREA_SQ_INCH * (job.dpi or 0) ** 2 * 3 * PAGE_COPIES
+    return int(WORKER_BASE_MEMORY + min(job.pages or 1, jobs) * page)
+
+class CoreScheduler:
+    """Owns the global core budget and splits it between file-level workers and
+    ocrmypdf's per-file `jobs`, so that the sum of both never exceeds the machine.
+
+    With a memory budget, a file whose projected memory does not fit gets fewer page
+    workers or is held back while smaller files go first, instead of swapping the machine.
+
+    Every source folder has its own queue. Folders of a higher priority go strictly first;
+    folders of the same priority are served in proportion to their weight, counted in
+    pages, so a folder with three invoices is not stuck behind one with 20k pages.
+    Within a folder the largest files go first, or with ORDER_SHORTEST_FIRST the smallest.
+    Priorities and weights may change while the batch runs."""
+
+    def __init__(self, total_cores=None, max_jobs_per_file=DEFAULT_MAX_JOBS_PER_FILE, memory_budget=None,
+                 order=ORDER_LARGEST_FIRST, shares=None):
+        self.total_cores = max(1, total_cores or os.cpu_count() or 1)
+        self.max_jobs_per_file = max(1, min(max_jobs_per_file, self.total_cores))
+        self.memory_budget = memory_budget
+        self.order = order
+        self.cores_in_use = 0
+        self.memory_in_use = 0
+        self.held_back = 0  # files that had to wait for memory
+        self._overtaken = 0
+        self._shares = dict(shares or {})  # source folder -> FolderShare
+        self._lanes = {}                    # (priority, source folder) -> list of jobs in dispatch order
+        self._lock = threading.Lock()
+
+    def add(self, files):
+        self.add_jobs([ScheduledJob(i, o, s, page_count(i)) for i, o, s in files])
+
+    def add_jobs(self, jobs):
+        # Longest files first: big scans start while the whole budget is still free,
+        # the small ones fill the gaps at the end of the batch. Jobs may arrive while
+        # the batch is running, so they are merged into the pending queue of their folder.
+        with self._lock:
+            self._add(jobs)
+
+    def set_share(self, source_folder, priority=None, weight=None):
+        """Changes priority and/or weight of a source folder, also for its files already queued."""
+        with self._lock:
+            share = self._share(source_folder)
+            if weight is not None:
+                share.weight = max(weight, 0.01)
+            if priority is None or priority == share.priority:
+                return
+            lane = self._lanes.pop((share.priority, source_folder), None)
+            share.priority = priority
+            if lane:
+                self._add(lane)
+
+    def reprioritize(self, input_path, priority):
+        """Gives the queued jobs of one file their own priority (None: the folder's again).
+        Returns the number of jobs moved."""
+        with self._lock:
+            moved = []
+            for key, lane in list(self._lanes.items()):
+                jobs = [job for job in lane if job.belongs_to(input_path)]
+                if not jobs:
+                    continue
+                self._lanes[key] = [job for job in lane if not job.belongs_to(input_path)]
+                moved.extend(jobs)
+            for job in moved:
+                job.priority = priority
+            self._add(moved)
+            self._lanes = {key: lane for key, lane in self._lanes.items() if lane}
+            return len(moved)
+
+    def worker_count(self):
+        # Every core may end up running a single-page file with jobs=1
+        return self.total_cores
+
+    def pending(self):
+        with self._lock:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def next_job(self):
+        """Returns (job, jobs) for the next file, or None if the queue is empty or no core is free."""
+        with self._lock:
+            free = self.total_cores - self.cores_in_use
+            if free <= 0:
+                return None
+            candidates = self._candidates(MAX_OVERTAKES + free)
+            for index, (key, job) in enumerate(candidates[:MAX_OVERTAKES + 1]):
+                if index and self._overtaken >= MAX_OVERTAKES:
+                    # The first file has waited long enough: keep the memory for it
+                    return None
+                window = [other.pages for _, other in candidates[index + 1:index + free]]
+                jobs = self._fit_memory(job, self._allot(job, free, window))
+                if jobs:
+                    if index:
+                        self._overtaken += 1
+                    else:
+                        self._overtaken = 0
+                    self._take(key, job)
+                    job.memory = estimate_memory(job, jobs) if self.memory_budget else 0
+                    self.cores_in_use += jobs
+                    self.memory_in_use += job.memory
+                    return job, jobs
+                if not job.held_back:
+                    job.held_back = True
+                    self.held_back += 1
+            return None
+
+    def release(self, jobs, memory=0):
+        with self._lock:
+            self.cores_in_use = max(0, self.cores_in_use - jobs)
+            self.memory_in_use = max(0, self.memory_in_use - memory)
+
+    def _fit_memory(self, job, jobs):
+        if not self.memory_budget:
+            return jobs
+        free = self.memory_budget - self.memory_in_use
+        for candidate in range(jobs, 0, -1):
+            if estimate_memory(job, candidate) <= free:
+                return candidate
+        # Alone on the machine a file runs even if the estimate exceeds the budget
+        return 1 if self.cores_in_use == 0 else 0
+
+    def _allot(self, job, free, competitors):
+        pages = job.pages
+        limit = min(self.max_jobs_per_file, job.max_jobs or self.max_jobs_per_file)
+        if limit <= 1:
+            return 1
+        # Share the free cores by page count with the files that compete for them next.
+        # With a full queue of small files every file gets one core, once the queue
+        # drains the remaining files get the idle cores.
+        share = int(free * pages / (pages + sum(competitors)))
+        return max(1, min(share, pages, limit, free))
+
+    # The helpers below expect the caller to hold the lock
+
+    def _share(self, source_folder):
+        share = self._shares.get(source_folder)
+        if share is None:
+            share = self._shares[source_folder] = FolderShare()
+        return share
+
+    def _priority(self, job):
+        if job.kind == KIND_MERGE:
+            return MERGE_PRIORITY
+        return self._share(job.source_folder).priority if job.priority is None else job.priority
+
+    def _add(self, jobs):
+        lanes = {}
+        for job in jobs:
+            lanes.setdefault((self._priority(job), job.source_folder), []).append(job)
+        busy = {folder for (_, folder), lane in self._lanes.items() if lane}
+        floor = min((self._shares[folder].served for folder in busy), default=None)
+        sign = 1 if self.order == ORDER_SHORTEST_FIRST else -1
+        for key, new in lanes.items():
+            folder = key[1]
+            share = self._share(folder)
+            if floor is not None and folder not in busy:
+                # A folder that was idle starts level with the busy ones instead of catching up
+                share.served = max(share.served, floor)
+            # Insert into the sorted lane instead of sorting it again: files may be streamed
+            # in one at a time, and re-sorting tens of thousands of queued jobs per file adds up
+            lane = self._lanes.setdefault(key, [])
+            for job in new:
+                insort(lane, job, key=lambda job: sign * job.pages)
+
+    def _candidates(self, limit):
+        # Jobs in dispatch order: by priority, then the folder served least for its weight
+        keys = sorted((key for key, lane in self._lanes.items() if lane),
+                      key=lambda key: (-key[0], self._shares[key[1]].served))
+        candidates = []
+        for key in keys:
+            candidates.extend((key, job) for job in islice(self._lanes[key], limit - len(candidates)))
+            if len(candidates) >= limit:
+                break
+        return candidates
+
+    def _take(self, key, job):
+        lane = self._lanes[key]
+        lane.remove(job)
+        if not lane:
+            del self._lanes[key]
+        if job.kind != KIND_MERGE:
+            # Merging is cheap, the chunks were already booked
+            share = self._shares[key[1]]
+            share.served += (job.pages or 1) / share.weight
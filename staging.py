@@ -0,0 +1,106 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ocr_processor import ensure_output_dir, copy_atomic
+from fileio import copy_file, disk_writes
+
+# Staged inputs (waiting or being OCRed) are limited by count and size
+DEFAULT_READ_AHEAD_BYTES = 4 * 1024 ** 3
+# Parallel copies from and to the shares; more rarely helps on a single link
+DEFAULT_COPY_THREADS = 2
+
+class Stager:
+    """Keeps network shares out of the OCR: inputs are copied to a local scratch directory
+    (tmpfs or SSD) ahead of the workers, and their outputs are written back in the background.
+
+    prefetch blocks a copy thread while the read-ahead is used up, so copying never runs
+    more than read_ahead_files files or read_ahead_bytes bytes ahead of the workers.
+    Write-back goes to a temporary file next to the destination and is renamed onto it,
+    so the share never shows a half-written PDF."""
+
+    def __init__(self, scratch_dir=None, read_ahead_files=8, read_ahead_bytes=DEFAULT_READ_AHEAD_BYTES,
+                 threads=DEFAULT_COPY_THREADS):
+        self.root = tempfile.mkdtemp(prefix="batchocr_stage_", dir=scratch_dir or None)
+        self.read_ahead_files = max(1, read_ahead_files)
+        self.read_ahead_bytes = read_ahead_bytes
+        self._fetch = ThreadPoolExecutor(threads, thread_name_prefix="stage-in")
+        self._write = ThreadPoolExecutor(threads, thread_name_prefix="stage-out")
+        self._room = threading.Condition()
+        self._staged = {}  # input path -> size of the staged copy
+        self._bytes = 0
+        self._closed = False
+
+    def directory(self, input_path):
+        # One scratch directory per file: the staged input and the output written next to it
+        return os.path.join(self.root, hashlib.sha1(input_path.encode("utf-8")).hexdigest()[:16])
+
+    def prefetch(self, input_path, callback):
+        """Copies a file to scratch in the background, then calls callback with the local
+        copy, or with None if it could not be staged and has to be read from the share."""
+        self._fetch.submit(self._prefetch, input_path, callback)
+
+    def _prefetch(self, input_path, callback):
+        local_path = None
+        try:
+            size = os.path.getsize(input_path)
+            if self._reserve(input_path, size):
+                directory = self.directory(input_path)
+                os.makedirs(directory, exist_ok=True)
+                local_path = os.path.join(directory, "input.pdf")
+                copy_file(input_path, local_path)
+        except OSError as e:
+            print(f"⚠️ Could not stage {input_path}, reading it from the share: {e}")
+            self.release(input_path)
+            local_path = None
+        callback(local_path)
+
+    def _reserve(self, input_path, size):
+        with self._room:
+            # A file bigger than the whole read-ahead still gets staged once nothing else is
+            while not self._closed and self._staged and (
+                    len(self._staged) >= self.read_ahead_files or self._bytes + size > self.read_ahead_bytes):
+                self._room.wait()
+            if self._closed:
+                return False
+            self._staged[input_path] = size
+            self._bytes += size
+            return True
+
+    def write_back(self, staged_output, final_path, callback):
+        """Moves an output from scratch to its destination in the background; callback gets
+        None when the output is in place, or the error, and the bytes the copy wrote to disk."""
+        self._write.submit(self._write_back, staged_output, final_path, callback)
+
+    def _write_back(self, staged_output, final_path, callback):
+        # Counted per thread, the copy threads write nothing else
+        writes_before = disk_writes(this_thread=True)
+        try:
+            ensure_output_dir(final_path)
+            copy_atomic(staged_output, final_path)
+            os.remove(staged_output)
+        except OSError as e:
+            print(f"❌ Could not write back {final_path}: {e}")
+            callback(e, None)
+            return
+        writes_after = disk_writes(this_thread=True)
+        callback(None, None if writes_before is None or writes_after is None else writes_after - writes_before)
+
+    def release(self, input_path):
+        """Frees the scratch space of a file once it is finished."""
+        with self._room:
+            self._bytes -= self._staged.pop(input_path, 0)
+            self._room.notify_all()
+        shutil.rmtree(self.directory(input_path), ignore_errors=True)
+
+    def close(self, wait=True):
+        """Stops staging; with wait, pending write-backs are finished first."""
+        with self._room:
+            self._closed = True
+            self._room.notify_all()
+        self._fetch.shutdown(wait=wait, cancel_futures=True)
+        self._write.shutdown(wait=wait)
+        shutil.rmtree(self.root, ignore_errors=True)
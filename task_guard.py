@@ -0,0 +1,257 @@
+import os
+import gc
+import sys
+import time
+import queue
+import ctypes
+import signal
+import itertools
+import threading
+import multiprocessing
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Time a task may take: base plus per page; both 0 disables the limit
+DEFAULT_TIMEOUT_BASE = 300.0
+DEFAULT_TIMEOUT_PER_PAGE = 60.0
+# Attempts per file, including the first one; retries wait backoff, backoff * factor, ...
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF = 10.0
+DEFAULT_BACKOFF_FACTOR = 2.0
+CHECK_INTERVAL = 1.0
+# Workers are replaced after this many tasks or once their RSS stays above the limit after a task
+DEFAULT_MAX_TASKS_PER_WORKER = 50
+DEFAULT_WORKER_RSS_LIMIT = 1536 * 1024 ** 2
+
+# Set in every pool worker by init_worker
+_events = None
+_rss_limit = None
+_retire = False
+
+class TaskTimeout(Exception):
+    pass
+
+class WorkerLost(Exception):
+    pass
+
+class RetryPolicy:
+    """Timeouts by page count and how often, and after which pause, a failed file is tried again."""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff=DEFAULT_BACKOFF, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 timeout_base=DEFAULT_TIMEOUT_BASE, timeout_per_page=DEFAULT_TIMEOUT_PER_PAGE):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.timeout_base = timeout_base
+        self.timeout_per_page = timeout_per_page
+
+    def timeout(self, pages=1):
+        if not self.timeout_base and not self.timeout_per_page:
+            return None
+        return self.timeout_base + self.timeout_per_page * max(1, pages or 1)
+
+    def should_retry(self, attempt):
+        return attempt < self.max_attempts
+
+    def delay(self, attempt):
+        # attempt is the one that just failed
+        return self.backoff * self.backoff_factor ** (attempt - 1)
+
+def init_worker(events, rss_limit=None):
+    global _events, _rss_limit
+    _events = events
+    _rss_limit = rss_limit
+    if hasattr(os, "setpgrp"):
+        # Own process group, so a hung task can be killed together with Tesseract and Ghostscript
+        os.setpgrp()
+
+def run_task(task_id, func, args):
+    # Runs in the pool worker: report who works on the task and since when
+    global _retire
+    if _retire:
+        # The pool gives a worker no way to quit between tasks, so the next task is handed back
+        _events.put(("retire", task_id, os.getpid()))
+        sys.exit(0)
+    _events.put(("start", task_id, os.getpid(), time.monotonic()))
+    try:
+        return func(*args)
+    finally:
+        release_memory()
+        rss = current_rss()
+        if _rss_limit and rss and rss > _rss_limit:
+            _retire = True
+        _events.put(("done", os.getpid(), rss, peak_rss(), peak_rss(children=True)))
+
+def report_page():
+    """Called by the OCR engine in the worker after every page; a no-op outside the pool."""
+    if _events is not None:
+        _events.put(("page", os.getpid()))
+
+def release_memory():
+    # Hands freed heap pages of the large page images back to the OS (glibc only)
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+def current_rss():
+    """Resident set size of this process in bytes, None where it cannot be read cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_rss()
+
+def peak_rss(children=False):
+    """Peak RSS in bytes of this process, or of its largest finished child (Tesseract, Ghostscript)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class _Task:
+    def __init__(self, func, args, name, timeout, callback, error_callback):
+        self.func = func
+        self.args = args
+        self.name = name
+        self.timeout = timeout
+        self.callback = callback
+        self.error_callback = error_callback
+        self.pid = None
+        self.started = None
+
+class TaskGuard:
+    """Watches the tasks of a multiprocessing.Pool: a task that runs longer than its timeout
+    gets its worker killed, a task whose worker died (killed, out of memory) is failed.
+    The pool starts a replacement worker by itself; the error callback of the task is called
+    with TaskTimeout or WorkerLost, so the batch carries on. Workers above the RSS limit
+    retire at their next task, which is then submitted again. The peak memory of every
+    worker is collected in worker_memory. on_page is called with the task name for every
+    page a worker reports as OCRed."""
+
+    def __init__(self, check_interval=CHECK_INTERVAL, rss_limit=DEFAULT_WORKER_RSS_LIMIT, on_page=None):
+        self.check_interval = check_interval
+        self.rss_limit = rss_limit
+        self.on_page = on_page
+        self.events = multiprocessing.Queue()
+        self.pool = None
+        self.abandoned = 0
+        self.retired = 0
+        self.worker_memory = {}  # pid -> (current RSS, peak RSS, peak RSS of a child) in bytes
+        self._tasks = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def initargs(self):
+        return (self.events, self.rss_limit)
+
+    def start(self, pool):
+        self.pool = pool
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, func, args, callback, error_callback, timeout=None, name=""):
+        self._submit(_Task(func, args, name, timeout, callback, error_callback))
+
+    def _submit(self, task):
+        task_id = next(self._ids)
+        with self._lock:
+            self._tasks[task_id] = task
+        self.pool.apply_async(run_task, (task_id, task.func, task.args),
+                              callback=lambda result: self._finish(task_id, result=result),
+                              error_callback=lambda error: self._finish(task_id, error=error))
+
+    def _finish(self, task_id, result=None, error=None):
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+        if task is None:
+            # Already failed by the watcher
+            return
+        if error is None:
+            task.callback(result)
+        else:
+            task.error_callback(error)
+
+    def _run(self):
+        next_check = time.monotonic() + self.check_interval
+        while not self._stop.is_set():
+            try:
+                self._event(*self.events.get(timeout=max(0.0, next_check - time.monotonic())))
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            if time.monotonic() >= next_check:
+                self._check()
+                next_check = time.monotonic() + self.check_interval
+
+    def _event(self, kind, *data):
+        if kind == "start":
+            task_id, pid, started = data
+            with self._lock:
+                task = self._tasks.get(task_id)
+                if task is not None:
+                    task.pid, task.started = pid, started
+        elif kind == "page":
+            (pid,) = data
+            with self._lock:
+                task = next((task for task in self._tasks.values() if task.pid == pid), None)
+            if task is not None and self.on_page:
+                self.on_page(task.name)
+        elif kind == "done":
+            pid, rss, peak, child_peak = data
+            self.worker_memory[pid] = (rss, peak, child_peak)
+        elif kind == "retire":
+            task_id, pid = data
+            with self._lock:
+                task = self._tasks.pop(task_id, None)
+                self.retired += 1
+                self.abandoned += 1
+            rss = self.worker_memory.get(pid, (None,))[0]
+            print(f"♻️ Recycling worker {pid} ({(rss or 0) // 1024 ** 2} MB)")
+            if task is not None:
+                self._submit(task)
+
+    def _check(self):
+        now = time.monotonic()
+        alive = {process.pid for process in multiprocessing.active_children()}
+        failed = []
+        with self._lock:
+            for task_id, task in list(self._tasks.items()):
+                if task.pid is None:
+                    continue
+                if task.pid not in alive:
+                    failed.append((task_id, WorkerLost(f"Worker {task.pid} died during {task.name}")))
+                elif task.timeout and now - task.started > task.timeout:
+                    print(f"⏱️ Timeout after {task.timeout:.0f}s, killing worker {task.pid}: {task.name}")
+                    kill_worker(task.pid)
+                    failed.append((task_id, TaskTimeout(f"Timed out after {task.timeout:.0f}s")))
+        for task_id, error in failed:
+            with self._lock:
+                # The pool keeps waiting for this result, so it can no longer be joined
+                self.abandoned += 1
+            self._finish(task_id, error=error)
+
+def kill_worker(pid):
+    try:
+        if sys.platform == "win32":
+            # No process groups: Tesseract/Ghostscript children finish on their own
+            os.kill(pid, signal.SIGTERM)
+        else:
+            os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
@@ -0,0 +1,79 @@
+from pathlib import Path
+from collections import Counter
+
+from ocrmypdf.pdfinfo import PdfInfo
+
+PAGE_DIGITAL = "digital"   # visible text, e.g. exported from Word
+PAGE_OCR = "ocr"           # invisible text layer over a scan, i.e. already OCRed
+PAGE_IMAGE = "image"       # scan without any text
+PAGE_EMPTY = "empty"       # neither text nor images: blank, or vector graphics only
+
+# How a file is handed to ocrmypdf; MODE_SKIP means the file is left untouched. Not None:
+# a job without a triage mode (None) gets every page rasterized again
+MODE_SKIP = "skip"
+MODE_SKIP_TEXT = "skip_text"
+MODE_REDO_OCR = "redo_ocr"
+
+class TriageResult:
+    def __init__(self, input_path, page_classes, page_dpi=(), error=None):
+        self.input_path = input_path
+        self.page_classes = page_classes
+        self.page_dpi = list(page_dpi)
+        self.error = error
+        self.counts = Counter(page_classes)
+        self.languages = None  # set by the language detection; None: all languages of the profile
+        self.pages = max(1, len(page_classes))
+        self.mode = self._route()
+
+    @property
+    def source_dpi(self):
+        """Resolution of the coarsest scanned page, None if no page contains an image."""
+        scanned = [dpi for page_class, dpi in zip(self.page_classes, self.page_dpi)
+                   if page_class != PAGE_DIGITAL and dpi > 0]
+        return min(scanned) if scanned else None
+
+    @property
+    def ocr_pages(self):
+        """Pages ocrmypdf runs the OCR engine on in the mode of this file."""
+        if self.mode == MODE_SKIP:
+            return 0
+        if self.error is not None:
+            return self.pages
+        # ocrmypdf also rasterizes the empty pages of a file it OCRs
+        pages = self.counts[PAGE_IMAGE] + self.counts[PAGE_EMPTY]
+        return pages + (self.counts[PAGE_OCR] if self.mode == MODE_REDO_OCR else 0)
+
+    def _route(self):
+        if self.error is not None:
+            # Let ocrmypdf report what is wrong with the file
+            return MODE_SKIP_TEXT
+        if not self.counts[PAGE_IMAGE]:
+            return MODE_SKIP
+        if self.counts[PAGE_OCR]:
+            # Replace the old text layer so the whole file gets a consistent one
+            return MODE_REDO_OCR
+        return MODE_SKIP_TEXT
+
+def classify_page(page):
+    if not page.has_text:
+        # A blank separator page must not send an otherwise born-digital file to the OCR
+        return PAGE_IMAGE if page.images else PAGE_EMPTY
+    visible = getattr(page, "has_visible_text", None)
+    if visible is None:
+        # Older ocrmypdf: text on top of an image is most likely an OCR layer
+        return PAGE_OCR if page.images else PAGE_DIGITAL
+    return PAGE_DIGITAL if visible else PAGE_OCR
+
+def page_resolution(page):
+    # The smaller axis decides how well glyphs can be recognized
+    dpi = page.dpi
+    return int(round(min(dpi.x, dpi.y)))
+
+def triage_pdf(input_path):
+    """Classifies every page of a PDF without rendering it. Runs in the worker pool."""
+    try:
+        info = PdfInfo(Path(input_path), detailed_analysis=False, progbar=False, max_workers=1)
+        return TriageResult(input_path, [classify_page(page) for page in info.pages],
+                            [page_resolution(page) for page in info.pages])
+    except Exception as e:
+        return TriageResult(input_path, [], error=str(e))